@@ -0,0 +1,308 @@
+# ai_jobs.py
+# AI 분석 작업 큐 (로컬 SQLite) 및 워커
+# 대시보드는 작업을 등록(enqueue)하고 상태만 조회하며, 실제 Gemini 호출은
+# 워커(별도 프로세스 또는 백그라운드 스레드 여러 개)가 담당하고 결과를 ai_analysis_results에 바로 저장합니다.
+# (세션이 끝나도 결과가 남음. 교사는 대시보드에서 저장된 결과를 고쳐 다시 저장할 수 있음)
+#
+# API 키는 큐 파일에 쓰지 않습니다. 워커는 교사별 키를 프로세스 메모리 → teacher_api_keys 테이블
+# (sql/teacher_api_keys.sql) → GEMINI_API_KEY 환경 변수 순서로 찾습니다.
+# 레이트 리미터 대기나 429가 나면 워커가 잠들지 않고 작업을 not_before 시각으로 미뤄 다른 작업을 먼저 처리합니다.
+# 별도 프로세스로 실행: python ai_jobs.py  (SUPABASE_URL / SUPABASE_KEY 필요)
+import sqlite3
+import os
+import time
+import uuid
+import hashlib
+import datetime
+import threading
+import traceback
+from utils import call_gemini
+import async_db
+import rate_limiter
+import resilience
+
+JOB_DB_PATH = os.environ.get("AI_JOB_DB_PATH", "ai_jobs.db")
+
+# 작업 상태
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+STATUS_LABELS = {
+    STATUS_QUEUED: "대기 중",
+    STATUS_RUNNING: "분석 중",
+    STATUS_DONE: "완료",
+    STATUS_FAILED: "실패",
+}
+
+# 워커가 처리하는 분석 유형
+JOB_TYPES = ('student_profile', 'class_summary', 'concern_summary')
+
+STALE_JOB_SECONDS = 600 # 이 시간 이상 'running'이면 워커가 죽은 것으로 보고 다시 대기열로
+WORKER_THREADS = int(os.environ.get("AI_WORKER_THREADS", 2)) # 한 교사의 긴 호출이 다른 교사 작업을 막지 않도록
+
+_api_keys = {} # teacher_id -> Gemini API 키 (메모리에만 보관)
+_api_keys_lock = threading.Lock()
+
+
+def _now():
+    return datetime.datetime.now().isoformat()
+
+def get_connection(db_path=None):
+    """작업 큐 SQLite 연결을 열고 테이블이 없으면 생성합니다."""
+    conn = sqlite3.connect(db_path or JOB_DB_PATH, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL") # 워커와 대시보드의 동시 접근 허용
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ai_jobs (
+            job_id TEXT PRIMARY KEY,
+            survey_instance_id TEXT NOT NULL,
+            student_id TEXT,
+            analysis_type TEXT NOT NULL,
+            prompt TEXT NOT NULL,
+            input_hash TEXT,
+            teacher_id TEXT,
+            status TEXT NOT NULL,
+            not_before TEXT,
+            result_text TEXT,
+            error TEXT,
+            created_at TEXT NOT NULL,
+            started_at TEXT,
+            finished_at TEXT
+        )
+    """)
+    columns = {row['name'] for row in conn.execute("PRAGMA table_info(ai_jobs)")}
+    if 'input_hash' not in columns: # 이전 버전 큐 파일 호환
+        conn.execute("ALTER TABLE ai_jobs ADD COLUMN input_hash TEXT")
+    if 'not_before' not in columns:
+        conn.execute("ALTER TABLE ai_jobs ADD COLUMN not_before TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ai_jobs_status ON ai_jobs (status, created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ai_jobs_inflight ON ai_jobs (survey_instance_id, analysis_type, input_hash, status)")
+    return conn
+
+def input_hash(prompt):
+    """프롬프트(분석 입력) 해시. 같은 입력의 동시 요청을 하나로 합치는 데 사용합니다."""
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+def _key_owner(teacher_id):
+    return str(teacher_id) if teacher_id is not None else ''
+
+def register_api_key(teacher_id, api_key):
+    """교사의 API 키를 이 프로세스 메모리에 등록합니다 (워커가 작업 실행 시 조회)."""
+    with _api_keys_lock:
+        _api_keys[_key_owner(teacher_id)] = api_key
+
+def store_api_key(teacher_id, api_key):
+    """교사의 API 키를 teacher_api_keys 테이블에 저장합니다 (별도 프로세스 워커도 교사 키로 실행할 수 있도록)."""
+    register_api_key(teacher_id, api_key)
+    resilience.write(lambda db: db.table('teacher_api_keys').upsert({
+        'teacher_id': str(teacher_id),
+        'api_key': api_key,
+        'updated_at': _now(),
+    }, on_conflict='teacher_id'))
+
+def forget_api_key(teacher_id):
+    """메모리와 teacher_api_keys 테이블에서 교사의 API 키를 지웁니다."""
+    with _api_keys_lock:
+        _api_keys.pop(_key_owner(teacher_id), None)
+    resilience.write(lambda db: db.table('teacher_api_keys').delete().eq('teacher_id', str(teacher_id)))
+
+def fetch_stored_api_key(teacher_id):
+    """teacher_api_keys 테이블에 저장된 교사의 API 키. 없거나 조회할 수 없으면 None
+    (키는 오래된 값을 쓰면 안 되므로 cache_key 없이 조회)"""
+    if teacher_id is None:
+        return None
+    try:
+        response = resilience.read_query(lambda db: db.table('teacher_api_keys').select('api_key')
+                                         .eq('teacher_id', str(teacher_id)).limit(1))
+    except Exception as e:
+        print(f"AI worker: 교사 API 키 조회 실패: {type(e).__name__}: {e}")
+        return None
+    rows = response.data or []
+    return rows[0].get('api_key') if rows else None
+
+def lookup_api_key(teacher_id):
+    """작업을 실행할 교사의 API 키: 이 프로세스 메모리 → teacher_api_keys 테이블 → GEMINI_API_KEY 환경 변수"""
+    with _api_keys_lock:
+        api_key = _api_keys.get(_key_owner(teacher_id))
+    if not api_key:
+        api_key = fetch_stored_api_key(teacher_id)
+        if api_key:
+            register_api_key(teacher_id, api_key)
+    return api_key or os.environ.get("GEMINI_API_KEY")
+
+def enqueue_job(survey_instance_id, student_id, analysis_type, prompt, api_key, teacher_id=None, db_path=None):
+    """분석 작업을 대기열에 등록하고 job_id를 반환합니다. api_key는 큐 파일이 아닌 메모리에만 등록합니다.
+    (설문, 학생, 분석 유형, 입력 해시)가 같은 작업이 이미 대기/실행 중이면 새로 만들지 않고 그 job_id를 돌려줍니다.
+    여러 탭/교사가 같은 분석을 동시에 요청해도 Gemini 호출과 DB 저장은 한 번만 일어납니다."""
+    if analysis_type not in JOB_TYPES:
+        raise ValueError(f"지원하지 않는 분석 유형입니다: {analysis_type}")
+    prompt_hash = input_hash(prompt)
+    register_api_key(teacher_id, api_key)
+    conn = get_connection(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE") # 확인과 등록 사이에 다른 요청이 끼어들지 않도록 잠금
+        try:
+            inflight = conn.execute(
+                "SELECT job_id FROM ai_jobs WHERE survey_instance_id = ? AND student_id IS ? AND analysis_type = ? "
+                "AND input_hash = ? AND status IN (?, ?) ORDER BY created_at LIMIT 1",
+                (survey_instance_id, student_id, analysis_type, prompt_hash, STATUS_QUEUED, STATUS_RUNNING)
+            ).fetchone()
+            if inflight:
+                job_id = inflight['job_id']
+            else:
+                job_id = str(uuid.uuid4())
+                conn.execute(
+                    "INSERT INTO ai_jobs (job_id, survey_instance_id, student_id, analysis_type, prompt, input_hash, teacher_id, status, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, survey_instance_id, student_id, analysis_type, prompt, prompt_hash,
+                     str(teacher_id) if teacher_id is not None else None, STATUS_QUEUED, _now())
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+    return job_id
+
+def get_job(job_id, db_path=None):
+    """작업 상태를 dict로 반환합니다. 없으면 None."""
+    conn = get_connection(db_path)
+    try:
+        row = conn.execute(
+            "SELECT job_id, survey_instance_id, student_id, analysis_type, status, result_text, error, "
+            "created_at, started_at, finished_at FROM ai_jobs WHERE job_id = ?",
+            (job_id,)
+        ).fetchone()
+        return dict(row) if row else None
+    finally:
+        conn.close()
+
+def claim_next_job(conn):
+    """실행 가능한(not_before가 지난) 가장 오래된 대기 작업 하나를 'running'으로 바꾸고 반환합니다. 없으면 None."""
+    conn.execute("BEGIN IMMEDIATE") # 여러 워커가 같은 작업을 가져가지 않도록 쓰기 잠금
+    try:
+        row = conn.execute(
+            "SELECT * FROM ai_jobs WHERE status = ? AND (not_before IS NULL OR not_before <= ?) ORDER BY created_at LIMIT 1",
+            (STATUS_QUEUED, _now())
+        ).fetchone()
+        if row:
+            conn.execute(
+                "UPDATE ai_jobs SET status = ?, started_at = ? WHERE job_id = ?",
+                (STATUS_RUNNING, _now(), row['job_id'])
+            )
+        conn.execute("COMMIT")
+        return dict(row) if row else None
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+def finish_job(conn, job_id, status, result_text=None, error=None):
+    """작업을 완료/실패 상태로 기록합니다."""
+    conn.execute(
+        "UPDATE ai_jobs SET status = ?, result_text = ?, error = ?, finished_at = ? WHERE job_id = ?",
+        (status, result_text, error, _now(), job_id)
+    )
+
+def defer_job(conn, job_id, wait_seconds):
+    """레이트 리미터 때문에 지금 실행할 수 없는 작업을 wait_seconds 뒤로 미뤄 다시 대기열에 넣습니다."""
+    not_before = (datetime.datetime.now() + datetime.timedelta(seconds=wait_seconds)).isoformat()
+    conn.execute(
+        "UPDATE ai_jobs SET status = ?, started_at = NULL, not_before = ? WHERE job_id = ?",
+        (STATUS_QUEUED, not_before, job_id)
+    )
+
+def scrub_stored_api_keys(conn):
+    """이전 버전이 큐 파일에 저장한 API 키를 지웁니다."""
+    columns = {row['name'] for row in conn.execute("PRAGMA table_info(ai_jobs)")}
+    if 'api_key' in columns:
+        conn.execute("UPDATE ai_jobs SET api_key = NULL WHERE api_key IS NOT NULL")
+
+def requeue_stale_jobs(conn, max_age_seconds=STALE_JOB_SECONDS):
+    """워커 중단 등으로 오래 'running'에 머문 작업을 다시 대기열로 돌립니다."""
+    cutoff = (datetime.datetime.now() - datetime.timedelta(seconds=max_age_seconds)).isoformat()
+    cur = conn.execute(
+        "UPDATE ai_jobs SET status = ?, started_at = NULL WHERE status = ? AND started_at < ?",
+        (STATUS_QUEUED, STATUS_RUNNING, cutoff)
+    )
+    return cur.rowcount
+
+def save_result(job, result):
+    """분석 결과를 ai_analysis_results에 upsert 합니다 (teacher_comment는 보내지 않으므로 기존 교사 코멘트는 그대로 유지됨)."""
+    return resilience.write(lambda db: db.table("ai_analysis_results").upsert({
+        'survey_instance_id': job['survey_instance_id'],
+        'student_id': job.get('student_id'),
+        'analysis_type': job['analysis_type'],
+        'result_text': result,
+        'generated_at': _now(),
+    }, on_conflict='survey_instance_id, student_id, analysis_type'))
+
+def process_job(job, save=True):
+    """작업 하나를 실행합니다: Gemini 호출 후 결과를 ai_analysis_results에 upsert (save=False면 작업에만 기록). (status, result, error) 반환
+    지금 호출할 수 없으면(레이트 리미터 대기/429) rate_limiter.RateLimitExceeded를 그대로 올립니다."""
+    api_key = lookup_api_key(job.get('teacher_id'))
+    if not api_key:
+        return STATUS_FAILED, None, "오류: API 키를 찾을 수 없습니다. 설정 페이지에서 키를 계정에 저장한 뒤 다시 실행해주세요."
+    gemini_result = call_gemini(job['prompt'], api_key, teacher_id=job.get('teacher_id'), analysis_type=job['analysis_type'], defer=True)
+    result = gemini_result.text
+    if not gemini_result.ok or not result:
+        # 오류 문구는 결과로 넘기지 않음 (같은 작업을 기다리는 모든 요청자에게 결과로 전달되지 않도록)
+        return STATUS_FAILED, None, result or "AI 분석 중 알 수 없는 오류"
+
+    if save:
+        try:
+            save_result(job, result)
+        except Exception as e:
+            # 결과는 작업에 남겨 두고 실패로 표시 (저장된 것으로 오해하지 않도록)
+            return STATUS_FAILED, result, f"분석은 끝났지만 결과 저장 중 오류 발생: {type(e).__name__}. 다시 실행해주세요."
+    return STATUS_DONE, result, None
+
+def run_worker(poll_interval=2.0, stop_event=None, db_path=None, save_results=True):
+    """대기열을 계속 확인하며 작업을 처리하는 워커 루프."""
+    conn = get_connection(db_path)
+    scrub_stored_api_keys(conn)
+    requeued = requeue_stale_jobs(conn)
+    if requeued:
+        print(f"AI worker: {requeued}건의 중단된 작업을 다시 대기열에 넣었습니다.")
+
+    while stop_event is None or not stop_event.is_set():
+        job = None
+        try:
+            job = claim_next_job(conn)
+            if job is None:
+                time.sleep(poll_interval)
+                continue
+            status, result, error = process_job(job, save_results)
+            finish_job(conn, job['job_id'], status, result, error)
+        except rate_limiter.RateLimitExceeded as e:
+            # 이 키는 기다려야 하므로 잠들지 않고 미뤄 둠 (다른 교사의 작업을 먼저 처리)
+            defer_job(conn, job['job_id'], e.wait_seconds)
+        except Exception as e:
+            print(f"AI worker 작업 처리 중 오류 발생: {e}")
+            traceback.print_exc()
+            if job is not None:
+                try:
+                    finish_job(conn, job['job_id'], STATUS_FAILED, error=f"작업 처리 중 오류 발생: {type(e).__name__}")
+                except Exception:
+                    traceback.print_exc()
+            time.sleep(poll_interval)
+
+def start_worker_thread(poll_interval=2.0, db_path=None, workers=WORKER_THREADS):
+    """Streamlit 프로세스 안에서 워커를 데몬 스레드 workers개로 실행합니다. (stop_event 반환)"""
+    stop_event = threading.Event()
+    for i in range(max(1, workers)):
+        thread = threading.Thread(
+            target=run_worker,
+            args=(poll_interval, stop_event, db_path),
+            name=f"ai-job-worker-{i}",
+            daemon=True
+        )
+        thread.start()
+    return stop_event
+
+
+if __name__ == "__main__":
+    async_db.resolve_credentials() # 연결 정보가 없으면 작업을 받기 전에 바로 종료
+    print(f"AI worker 시작 (큐: {JOB_DB_PATH})")
+    run_worker()
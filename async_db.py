@@ -0,0 +1,112 @@
+# async_db.py
+# 비동기 Supabase 데이터 계층 (acreate_client, 내부적으로 httpx 비동기 클라이언트)
+# - 프로세스당 이벤트 루프 스레드 1개와 비동기 클라이언트 1개를 공유
+# - 동기 코드(Streamlit 페이지, AI 워커 스레드)는 run() / gather() 로 결과를 기다림
+#   요청마다 스레드를 만들지 않고, 여러 쿼리를 한 이벤트 루프에서 동시에 보냄
+# - 이미 asyncio 안에서 실행되는 코드(CLI 스크립트 등)는 connect() 로 만든 클라이언트와
+#   execute_all() / fetch_all() 을 직접 await
+import os
+import asyncio
+import threading
+import contextvars
+from supabase import acreate_client
+
+MAX_CONCURRENT_REQUESTS = 10 # 동시에 보내는 요청 수 상한 (PostgREST 연결 수 보호)
+FETCH_PAGE_SIZE = 1000
+DEFAULT_TIMEOUT = 60 # 동기 대기 최대 시간(초)
+
+_loop = None
+_loop_lock = threading.Lock()
+_client = None
+_client_lock = None # 이벤트 루프 안에서 생성 (asyncio.Lock)
+# 요청 1건(페이지 1개)마다 적용할 제한 시간. resilience.read(paged=True)가 조회 작업 안에서만 설정
+_request_timeout = contextvars.ContextVar('request_timeout', default=None)
+
+
+def resolve_credentials():
+    """Supabase URL/Key: Streamlit secrets가 있으면 우선, 없으면 환경 변수 (워커/CLI)."""
+    try:
+        import streamlit as st
+        return st.secrets["supabase"]["url"], st.secrets["supabase"]["key"]
+    except Exception:
+        pass
+    url = os.environ.get("SUPABASE_URL")
+    key = os.environ.get("SUPABASE_KEY")
+    if not url or not key:
+        raise RuntimeError("Supabase 연결 정보(Secrets 또는 SUPABASE_URL / SUPABASE_KEY 환경 변수)를 찾을 수 없습니다.")
+    return url, key
+
+async def connect(url=None, key=None):
+    """비동기 클라이언트를 새로 만듭니다 (CLI 등 자체 이벤트 루프에서 사용)."""
+    if not url or not key:
+        url, key = resolve_credentials()
+    return await acreate_client(url, key)
+
+# --- 공유 이벤트 루프 ---
+def _get_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="async-db-loop", daemon=True).start()
+        return _loop
+
+async def _shared_client():
+    global _client, _client_lock
+    if _client_lock is None:
+        _client_lock = asyncio.Lock()
+    async with _client_lock:
+        if _client is None:
+            _client = await connect()
+        return _client
+
+# --- 비동기 도우미 ---
+def set_request_timeout(seconds):
+    """현재 작업(task)에서 bounded()가 요청마다 적용할 제한 시간을 정합니다."""
+    _request_timeout.set(seconds)
+
+async def bounded(awaitable):
+    """요청 1건에 set_request_timeout()으로 정한 제한 시간을 적용합니다 (정하지 않았으면 그대로 기다림)."""
+    timeout = _request_timeout.get()
+    return await (asyncio.wait_for(awaitable, timeout) if timeout else awaitable)
+
+async def execute_all(queries, limit=MAX_CONCURRENT_REQUESTS):
+    """{이름: 쿼리 빌더} 를 동시에 execute 합니다 (동시 요청 수는 limit 이하). {이름: 응답} 반환"""
+    semaphore = asyncio.Semaphore(limit)
+
+    async def _execute(query):
+        async with semaphore:
+            return await bounded(query.execute())
+
+    names = list(queries)
+    responses = await asyncio.gather(*(_execute(queries[name]) for name in names))
+    return dict(zip(names, responses))
+
+async def fetch_all(build_query, page_size=FETCH_PAGE_SIZE):
+    """PostgREST 최대 행 수 제한을 넘는 결과를 range()로 나눠 모두 가져옵니다."""
+    rows = []
+    start = 0
+    while True:
+        page = (await bounded(build_query().range(start, start + page_size - 1).execute())).data or []
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+        start += page_size
+
+# --- 동기 코드용 어댑터 ---
+def run(fn, timeout=DEFAULT_TIMEOUT):
+    """fn(async_client) 가 돌려주는 코루틴을 공유 이벤트 루프에서 실행하고 결과를 기다립니다."""
+    async def _run():
+        return await fn(await _shared_client())
+    return asyncio.run_coroutine_threadsafe(_run(), _get_loop()).result(timeout)
+
+def submit(fn):
+    """run() 과 같지만 기다리지 않고 concurrent.futures.Future 를 반환합니다 (백그라운드 미리 조회용)."""
+    async def _run():
+        return await fn(await _shared_client())
+    return asyncio.run_coroutine_threadsafe(_run(), _get_loop())
+
+def gather(build_queries, timeout=DEFAULT_TIMEOUT):
+    """build_queries(async_client) -> {이름: 쿼리 빌더}. 모든 쿼리를 동시에 실행해 {이름: 응답} 을 반환합니다.
+    예) async_db.gather(lambda db: {'classes': db.table('classes').select('*'), 'surveys': db.table('surveys').select('*')})"""
+    return run(lambda client: execute_all(build_queries(client)), timeout)
@@ -0,0 +1,134 @@
+# bootstrap.py
+# 페이지 시작 시 필요한 서로 독립적인 조회를 비동기 데이터 계층(async_db)에서 동시에 실행
+# - 학급 목록과 교사의 전체 설문 목록을 한 번의 왕복 시간에 함께 조회 (load_teacher_overview)
+# - 로그인 직후 start_prefetch로 미리 조회를 시작하고, 가장 최근 설문의 응답도 이어서 받아 둠
+#   (분석 대시보드에 들어가면 take_overview / take_prefetched_responses 가 그 결과를 한 번 사용)
+import threading
+import traceback
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import streamlit as st
+import async_db
+import resilience
+
+PREFETCH_KEY = 'bootstrap_prefetch'
+RESPONSE_COLUMNS = "*, students(student_id, student_name)"
+
+
+# --- 개별 조회 (쿼리 빌더만 만들고 실행은 호출하는 쪽에서) ---
+def classes_query(db, teacher_id):
+    return db.table('classes').select("class_id, class_name") \
+        .eq('teacher_id', teacher_id).order('created_at', desc=False)
+
+def teacher_surveys_query(db, teacher_id):
+    """교사의 모든 학급 설문 (최신순). 학급을 고른 뒤 학급별로 다시 조회하지 않아도 됨"""
+    return db.table('surveys').select("survey_instance_id, survey_name, class_id, created_at") \
+        .eq('teacher_id', teacher_id).order('created_at', desc=True)
+
+def survey_responses_query(db, survey_instance_id):
+    return db.table('survey_responses').select(RESPONSE_COLUMNS).eq('survey_instance_id', survey_instance_id)
+
+def fetch_survey_responses(survey_instance_id):
+    """설문 응답 조회 (DB 장애 중에는 마지막으로 불러온 응답)"""
+    return resilience.read_query(lambda db: survey_responses_query(db, survey_instance_id),
+                                 cache_key=('survey_responses', survey_instance_id)).data or []
+
+async def _load_overview(db, teacher_id):
+    responses = await async_db.execute_all({
+        'classes': classes_query(db, teacher_id),
+        'surveys': teacher_surveys_query(db, teacher_id),
+    })
+    return {name: response.data or [] for name, response in responses.items()}
+
+def load_teacher_overview(teacher_id):
+    """학급 목록과 설문 목록을 동시에 조회합니다. data가 {'classes': [...], 'surveys': [...]} 인 ReadResult 반환"""
+    return resilience.read(lambda db: _load_overview(db, teacher_id), cache_key=('teacher_overview', teacher_id))
+
+def latest_survey(surveys, class_id=None):
+    """가장 최근에 만든 설문 (class_id를 주면 그 학급에서). 없으면 None"""
+    for survey in surveys:
+        if class_id is None or survey.get('class_id') == class_id:
+            return survey
+    return None
+
+# --- 로그인 직후 미리 조회 ---
+class Prefetch:
+    """한 교사의 첫 화면 데이터 미리 조회. 설문 목록이 도착하면 최근 설문의 응답 조회를 이어서 시작"""
+
+    def __init__(self, teacher_id):
+        self.teacher_id = teacher_id
+        self.survey_instance_id = None
+        self.overview_used = False
+        self._overview = None
+        self._overview_error = None
+        self._overview_ready = threading.Event()
+        self._responses = async_db.submit(self._load) # 공유 이벤트 루프에서 실행 (별도 스레드 없음)
+
+    async def _load(self, db):
+        try:
+            self._overview = await _load_overview(db, self.teacher_id)
+        except Exception as e:
+            self._overview_error = e
+            return None
+        finally:
+            self._overview_ready.set()
+        survey = latest_survey(self._overview['surveys'])
+        if not survey:
+            return None
+        self.survey_instance_id = survey['survey_instance_id']
+        return (await survey_responses_query(db, self.survey_instance_id).execute()).data or []
+
+    def overview(self):
+        self._overview_ready.wait(resilience.READ_TIMEOUT)
+        if self._overview_error is not None:
+            raise self._overview_error
+        if self._overview is None:
+            raise TimeoutError("학급/설문 목록 미리 조회가 끝나지 않았습니다.")
+        return self._overview
+
+    def responses(self, survey_instance_id):
+        """미리 받은 응답 (다른 설문이거나 준비되지 않았으면 None)"""
+        try:
+            data = self._responses.result(resilience.READ_TIMEOUT)
+        except FutureTimeoutError:
+            return None
+        if data is None or str(survey_instance_id) != str(self.survey_instance_id):
+            return None
+        return data
+
+def start_prefetch(teacher_id):
+    """로그인 성공 시 호출: 학급/설문 목록과 최근 설문 응답 조회를 백그라운드에서 시작합니다."""
+    st.session_state[PREFETCH_KEY] = Prefetch(teacher_id)
+
+def _current_prefetch(teacher_id):
+    prefetch = st.session_state.get(PREFETCH_KEY)
+    if prefetch is not None and prefetch.teacher_id != teacher_id:
+        st.session_state.pop(PREFETCH_KEY, None)
+        return None
+    return prefetch
+
+def take_overview(teacher_id):
+    """학급/설문 목록(ReadResult): 미리 조회한 결과가 있으면 한 번만 사용하고, 없으면 두 조회를 동시에 실행합니다."""
+    prefetch = _current_prefetch(teacher_id)
+    if prefetch is not None and not prefetch.overview_used:
+        prefetch.overview_used = True
+        try:
+            return resilience.ReadResult(prefetch.overview())
+        except Exception as e:
+            print(f"미리 조회한 학급/설문 목록을 사용할 수 없어 다시 조회합니다: {e}")
+    return load_teacher_overview(teacher_id)
+
+def take_prefetched_responses(survey_instance_id, teacher_id=None):
+    """로그인 직후 미리 받은 이 설문의 응답(학생 정보 포함)을 한 번만 꺼냅니다. 없으면 None
+    세션 상태를 바꾸므로 st.cache_data 함수 밖에서 호출하고, 결과를 캐시 함수에 넘겨 주세요."""
+    prefetch = st.session_state.get(PREFETCH_KEY)
+    if prefetch is None or (teacher_id is not None and prefetch.teacher_id != teacher_id):
+        return None
+    try:
+        data = prefetch.responses(survey_instance_id)
+    except Exception as e:
+        print(f"미리 조회한 설문 응답을 사용할 수 없어 다시 조회합니다: {e}")
+        traceback.print_exc()
+        return None
+    if data is not None:
+        st.session_state.pop(PREFETCH_KEY, None) # 첫 화면용이므로 한 번 쓰고 버림
+    return data
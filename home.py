@@ -7,6 +7,9 @@ import os
 import pandas as pd # 학생 설문 로직 위해 필요
 import json         # 학생 설문 로직 위해 필요
 from urllib.parse import urlencode # 필요시 사용
+import survey_stats # 제출 시 응답 현황 캐시 무효화
+import bootstrap # 로그인 직후 대시보드 데이터 미리 조회
+import resilience # 제한 시간/재시도/회로 차단기를 적용한 쿼리 실행
 
 # --- 페이지 설정 (가장 먼저, 한 번만!) ---
 st.set_page_config(page_title="교우관계 시스템", page_icon="🌐", layout="wide")
@@ -65,14 +68,16 @@ def render_student_survey(survey_id):
             return None, "DB 연결 또는 survey_id 오류", None
         try:
             # 설문 정보 조회 (class_id 포함)
-            survey_response = supabase.table('surveys').select("survey_instance_id, survey_name, description, class_id").eq('survey_instance_id', _survey_id).maybe_single().execute()
+            survey_response = resilience.read_query(lambda db: db.table('surveys').select("survey_instance_id, survey_name, description, class_id").eq('survey_instance_id', _survey_id).maybe_single(),
+                                                    cache_key=('survey_info', _survey_id))
             if not survey_response.data: return None, f"ID '{_survey_id}'에 해당하는 설문을 찾을 수 없습니다.", None
             survey_info = survey_response.data
             class_id = survey_info.get('class_id')
             if not class_id: return survey_info, "설문에 연결된 학급 정보가 없습니다.", None
 
             # 학생 명단 조회
-            student_response = supabase.table('students').select("student_id, student_name").eq('class_id', class_id).order('student_name').execute()
+            student_response = resilience.read_query(lambda db: db.table('students').select("student_id, student_name").eq('class_id', class_id).order('student_name'),
+                                                     cache_key=('class_roster', class_id))
             if not student_response.data: return survey_info, "학급에 등록된 학생이 없습니다.", None
             students_df = pd.DataFrame(student_response.data)
             return survey_info, None, students_df
@@ -120,12 +125,12 @@ def render_student_survey(survey_id):
                     raise ConnectionError("Supabase 클라이언트(연결)가 유효하지 않습니다.")
 
                 # Supabase 쿼리 실행
-                res: PostgrestAPIResponse = supabase.table("survey_responses") \
-                    .select("*") \
-                    .eq("survey_instance_id", survey_id) \
-                    .eq("student_id", my_student_id) \
-                    .maybe_single() \
-                    .execute()
+                # (오래된 데이터로 판단하면 응답이 중복 저장될 수 있으므로 마지막 정상 데이터는 쓰지 않음)
+                res = resilience.read_query(lambda db: db.table("survey_responses")
+                                            .select("*")
+                                            .eq("survey_instance_id", survey_id)
+                                            .eq("student_id", my_student_id)
+                                            .maybe_single())
 
                 # --- !!! 중요: res 객체가 None이 아닌지 먼저 확인 !!! ---
                 if res is not None:
@@ -244,12 +249,12 @@ def render_student_survey(survey_id):
                     try:
                         if existing_response:
                             # --- UPDATE 로직 ---
-                            response = supabase.table('survey_responses') \
-                                .update(response_data) \
-                                .eq('response_id', response_id_to_update) \
-                                .execute()
+                            response = resilience.write(lambda db: db.table('survey_responses')
+                                                        .update(response_data)
+                                                        .eq('response_id', response_id_to_update))
                             # Supabase V2 update는 성공 시 data가 없을 수 있음
                             if response.data or (hasattr(response, 'status_code') and response.status_code == 204):
+                                survey_stats.invalidate_response_stats(survey_id)
                                 st.success("응답이 성공적으로 수정되었습니다. 감사합니다!")
                                 st.balloons()
                             else:
@@ -259,8 +264,9 @@ def render_student_survey(survey_id):
                             # --- INSERT 로직 ---
                             response_data['survey_instance_id'] = survey_id
                             response_data['student_id'] = my_student_id
-                            response = supabase.table('survey_responses').insert(response_data).execute()
+                            response = resilience.write(lambda db: db.table('survey_responses').insert(response_data))
                             if response.data:
+                                survey_stats.invalidate_response_stats(survey_id)
                                 st.success("설문이 성공적으로 제출되었습니다. 참여해주셔서 감사합니다!")
                                 st.balloons()
                             else:
@@ -311,7 +317,7 @@ def render_home_page():
                         # 예: check_username_exists(new_username) 함수 호출
                         username_exists = False # 임시
                         try:
-                            res = supabase.table("teachers").select("username").eq("username", new_username).execute()
+                            res = resilience.read_query(lambda db: db.table("teachers").select("username").eq("username", new_username))
                             if res.data:
                                 username_exists = True
                         except Exception as e:
@@ -324,12 +330,12 @@ def render_home_page():
                             # --- 여기에 비밀번호 해싱 및 Supabase insert 로직 추가 ---
                             try:
                                 hashed_password = pwd_context.hash(new_password)
-                                insert_res = supabase.table("teachers").insert({
+                                insert_res = resilience.write(lambda db: db.table("teachers").insert({
                                     "username": new_username,
                                     "password_hash": hashed_password,
                                     "teacher_name": new_teacher_name,
                                     "email": new_email # 이메일 추가 시
-                                }).execute()
+                                }))
                                 if insert_res.data:
                                     st.success("회원가입이 완료되었습니다. 로그인 탭에서 로그인해주세요.")
                                 else:
@@ -355,7 +361,8 @@ def check_login(username, password):
 
     try:
         # 사용자 이름으로 교사 정보 조회
-        response: PostgrestAPIResponse = supabase.table('teachers').select("teacher_id, password_hash, teacher_name").eq('username', username).execute()
+        # 인증 정보는 항상 최신 데이터로 확인 (마지막 정상 데이터 사용 안 함)
+        response = resilience.read_query(lambda db: db.table('teachers').select("teacher_id, password_hash, teacher_name").eq('username', username))
 
         if not response.data:
             st.warning("존재하지 않는 사용자 이름입니다.")
@@ -372,6 +379,7 @@ def check_login(username, password):
             st.session_state['logged_in'] = True
             st.session_state['teacher_id'] = teacher_id
             st.session_state['teacher_name'] = teacher_name
+            bootstrap.start_prefetch(teacher_id) # 환영 메시지를 보여주는 동안 학급/설문/최근 응답 조회
             st.success(f"{st.session_state['teacher_name']} 선생님, 환영합니다!")
             time.sleep(1) # 잠시 메시지 보여주고 새로고침
             st.rerun() # 로그인 후 페이지 새로고침하여 UI 업데이트
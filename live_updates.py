@@ -0,0 +1,118 @@
+# live_updates.py
+# Supabase Realtime으로 survey_responses 변경(INSERT/UPDATE)을 구독해 대시보드에 전달
+# - 설문 하나당 웹소켓 구독 하나를 백그라운드 스레드(자체 이벤트 루프)에서 실행
+# - 받은 변경 레코드는 스레드 안전한 큐에 쌓이고, 대시보드 fragment가 주기적으로 꺼내(drain) 반영
+# - idle_timeout 동안 drain 되지 않으면 (브라우저 탭을 닫았거나 세션이 끝난 경우) 스스로 구독을 종료
+# - SUPABASE_REALTIME_URL 환경 변수로 접속 주소를 바꿀 수 있음 (로컬 웹소켓 서버로 테스트할 때)
+import os
+import time
+import queue
+import asyncio
+import threading
+import traceback
+from realtime import AsyncRealtimeClient, RealtimeSubscribeStates
+
+REALTIME_URL_ENV = "SUPABASE_REALTIME_URL"
+WATCHED_EVENTS = ('INSERT', 'UPDATE')
+
+# 구독 상태
+STATE_CONNECTING = 'connecting'
+STATE_SUBSCRIBED = 'subscribed'
+STATE_ERROR = 'error'
+STATE_CLOSED = 'closed'
+STATE_LABELS = {
+    STATE_CONNECTING: "연결 중",
+    STATE_SUBSCRIBED: "실시간 수신 중",
+    STATE_ERROR: "연결 오류",
+    STATE_CLOSED: "종료됨",
+}
+
+
+def resolve_realtime_url(supabase_url):
+    """Realtime 접속 주소: 환경 변수가 있으면 우선, 없으면 Supabase 프로젝트 URL 기준."""
+    override = os.environ.get(REALTIME_URL_ENV)
+    if override:
+        return override.rstrip('/')
+    return f"{supabase_url.rstrip('/')}/realtime/v1"
+
+
+class ResponseFeed:
+    """설문 한 개의 survey_responses 변경 이벤트 구독."""
+
+    def __init__(self, realtime_url, api_key, survey_instance_id, idle_timeout=None):
+        self.realtime_url = realtime_url
+        self.api_key = api_key
+        self.survey_instance_id = survey_instance_id
+        self.idle_timeout = idle_timeout # 초, None이면 stop() 할 때까지 유지
+        self.state = STATE_CONNECTING
+        self.error = None
+        self._last_drain = time.monotonic()
+        self._events = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run_loop, name=f"realtime-{self.survey_instance_id}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive() and not self._stop.is_set()
+
+    def drain(self):
+        """지금까지 받은 변경 레코드를 모두 꺼냅니다. [record dict, ...]"""
+        self._last_drain = time.monotonic()
+        records = []
+        while True:
+            try:
+                records.append(self._events.get_nowait())
+            except queue.Empty:
+                return records
+
+    # --- 백그라운드 스레드 ---
+    def _run_loop(self):
+        try:
+            asyncio.run(self._run())
+        except Exception as e:
+            self.state, self.error = STATE_ERROR, str(e)
+            print(f"Realtime 구독 중 오류 발생 ({self.survey_instance_id}): {e}")
+            traceback.print_exc()
+
+    def _on_change(self, payload):
+        data = payload.get('data', payload) # 서버 형식: {'ids': [...], 'data': {'type', 'record', ...}}
+        record = data.get('record')
+        if data.get('type') in WATCHED_EVENTS and record:
+            self._events.put(record)
+
+    def _on_subscribe(self, status, error):
+        if status == RealtimeSubscribeStates.SUBSCRIBED:
+            self.state = STATE_SUBSCRIBED
+        elif status in (RealtimeSubscribeStates.CHANNEL_ERROR, RealtimeSubscribeStates.TIMED_OUT):
+            self.state, self.error = STATE_ERROR, str(error or status)
+
+    async def _run(self):
+        client = AsyncRealtimeClient(self.realtime_url, self.api_key)
+        await client.connect()
+        try:
+            channel = client.channel(f"survey-responses-{self.survey_instance_id}")
+            for event in WATCHED_EVENTS:
+                channel.on_postgres_changes(
+                    event, table='survey_responses', schema='public',
+                    filter=f"survey_instance_id=eq.{self.survey_instance_id}",
+                    callback=self._on_change,
+                )
+            await channel.subscribe(self._on_subscribe)
+            while not self._stop.is_set():
+                if self.idle_timeout is not None and time.monotonic() - self._last_drain > self.idle_timeout:
+                    print(f"Realtime 구독을 {self.idle_timeout:.0f}초 동안 사용하지 않아 종료합니다 ({self.survey_instance_id}).")
+                    self._stop.set()
+                    break
+                await asyncio.sleep(0.5)
+        finally:
+            await client.close()
+            if self.state != STATE_ERROR:
+                self.state = STATE_CLOSED
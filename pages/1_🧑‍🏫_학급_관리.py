@@ -3,6 +3,8 @@ import streamlit as st
 from supabase import Client, PostgrestAPIResponse
 import pandas as pd
 import os
+import roster # 학생 명단 파일 가져오기
+import resilience # 제한 시간/재시도/회로 차단기를 적용한 쿼리 실행
 
 # --- 페이지 설정 ---
 st.set_page_config(page_title="학급 및 학생 관리", page_icon="🧑‍🏫", layout="wide")
@@ -65,12 +67,15 @@ st.divider()
 st.subheader("📚 내 학급 목록")
 
 # 교사의 학급 목록 불러오기
+classes = []
 try:
-    response: PostgrestAPIResponse = supabase.table('classes') \
-        .select("class_id, class_name, description") \
-        .eq('teacher_id', teacher_id) \
-        .order('created_at', desc=False) \
-        .execute()
+    response = resilience.read_query(lambda db: db.table('classes')
+                                     .select("class_id, class_name, description")
+                                     .eq('teacher_id', teacher_id)
+                                     .order('created_at', desc=False),
+                                     cache_key=('classes', teacher_id))
+    if response.stale:
+        st.warning(resilience.stale_notice(response))
 
     if response.data:
         classes = response.data
@@ -110,11 +115,11 @@ with st.expander("➕ 새 학급 생성"):
                 st.warning("학급 이름을 입력해주세요.")
             else:
                 try:
-                    response: PostgrestAPIResponse = supabase.table('classes').insert({
+                    response: PostgrestAPIResponse = resilience.write(lambda db: db.table('classes').insert({
                         'teacher_id': teacher_id,
                         'class_name': new_class_name,
                         'description': new_class_desc
-                    }).execute()
+                    }))
 
                     if response.data:
                         st.success(f"'{new_class_name}' 학급이 생성되었습니다!")
@@ -127,7 +132,92 @@ with st.expander("➕ 새 학급 생성"):
                 except Exception as e:
                     st.error(f"학급 생성 중 오류 발생: {e}")
 
-# --- 학생 명단 관리 (다음 단계에서 구현) ---
+# --- 학생 명단 파일 업로드 (CSV/Excel, 여러 학급 가능) ---
+st.divider()
+st.subheader("📥 학생 명단 파일 업로드")
+st.caption("첫 행은 제목 행입니다. '이름' 컬럼(없으면 첫 번째 컬럼)을 학생 이름으로 사용하고, "
+           "'학급' 컬럼이 있으면 행마다 해당 학급에 배정합니다. 학급 값이 없으면 위에서 선택한 학급에 추가됩니다.")
+
+ROSTER_COLUMN_LABELS = {'row': "행", 'student_name': "이름", 'class_name': "학급", 'result': "결과", 'error': "오류"}
+
+# 직전 가져오기 결과 보고서
+if st.session_state.get('roster_import_report') is not None:
+    report_df = st.session_state['roster_import_report']
+    result_counts = report_df['result'].value_counts()
+    st.success(f"명단 가져오기 완료: {result_counts.get(roster.RESULT_ADDED, 0)}명 추가")
+    if result_counts.get(roster.RESULT_FAILED, 0):
+        st.error(f"{result_counts[roster.RESULT_FAILED]}명은 추가하지 못했습니다. 보고서의 오류를 확인해주세요.")
+    with st.expander("행별 처리 결과 보기"):
+        report_view = report_df[list(ROSTER_COLUMN_LABELS)].rename(columns=ROSTER_COLUMN_LABELS)
+        st.dataframe(report_view, hide_index=True, use_container_width=True)
+        st.download_button("⬇️ 결과 보고서 CSV", report_view.to_csv(index=False).encode('utf-8-sig'),
+                           file_name="명단_가져오기_결과.csv", mime="text/csv")
+    if st.button("보고서 닫기"):
+        st.session_state.pop('roster_import_report', None)
+        st.rerun()
+
+uploaded_file = st.file_uploader("학생 명단 파일 업로드 (CSV 또는 Excel)", type=["csv", "xlsx"])
+if uploaded_file is not None:
+    try:
+        # 같은 파일은 rerun 때마다 다시 읽지 않음
+        cached_upload = st.session_state.get('roster_upload')
+        if not cached_upload or cached_upload[0] != uploaded_file.file_id:
+            roster_df, has_class_column = roster.read_roster(uploaded_file.name, uploaded_file)
+            st.session_state['roster_upload'] = (uploaded_file.file_id, roster_df, has_class_column)
+        _, roster_df, has_class_column = st.session_state['roster_upload']
+
+        if roster_df.empty:
+            st.warning("업로드한 파일에 학생 데이터가 없습니다.")
+        else:
+            class_ids_by_name = {roster.normalize_name(c['class_name']): c['class_id'] for c in classes}
+            file_class_names = set(roster_df['class_name']) - {""}
+            missing_classes = sorted(file_class_names - set(class_ids_by_name))
+            create_classes = False
+            if missing_classes:
+                create_classes = st.checkbox(
+                    f"등록되지 않은 학급 {len(missing_classes)}개를 새로 만들기 ({', '.join(missing_classes[:10])}{' 등' if len(missing_classes) > 10 else ''})",
+                    value=True
+                )
+            if (roster_df['class_name'] == "").any() and not selected_class_id:
+                st.info("학급 값이 없는 행은 위 '내 학급 목록'에서 학급을 선택해야 추가됩니다.")
+
+            # 미리보기: 새로 만들 학급은 임시 ID로 배정
+            preview_class_ids = dict(class_ids_by_name)
+            if create_classes:
+                preview_class_ids.update({name: f"new:{name}" for name in missing_classes})
+            target_class_ids = {class_ids_by_name[name] for name in file_class_names if name in class_ids_by_name}
+            if selected_class_id:
+                target_class_ids.add(selected_class_id)
+            existing_names = roster.fetch_existing_names(target_class_ids)
+            plan_df = roster.plan_import(roster_df, preview_class_ids, existing_names, default_class_id=selected_class_id)
+
+            result_counts = plan_df['result'].value_counts()
+            to_add = int(result_counts.get(roster.RESULT_ADD, 0))
+            st.write(f"파일에서 **{len(plan_df)}**행을 읽었습니다: " +
+                     ", ".join(f"{result} {count}명" for result, count in result_counts.items()))
+            with st.expander("미리보기"):
+                st.dataframe(plan_df[['row', 'student_name', 'class_name', 'result']].rename(columns=ROSTER_COLUMN_LABELS),
+                             hide_index=True, use_container_width=True)
+
+            if to_add and st.button(f"명단 가져오기 ({to_add}명 추가)", type="primary"):
+                with st.spinner("학생 명단을 추가하는 중..."):
+                    if create_classes:
+                        class_ids_by_name.update(roster.create_missing_classes(teacher_id, missing_classes))
+                    # 학급 생성 후 실제 ID로 다시 배정 (그 사이 추가된 학생도 반영)
+                    target_class_ids = {class_ids_by_name[name] for name in file_class_names if name in class_ids_by_name}
+                    if selected_class_id:
+                        target_class_ids.add(selected_class_id)
+                    existing_names = roster.fetch_existing_names(target_class_ids)
+                    plan_df = roster.plan_import(roster_df, class_ids_by_name, existing_names, default_class_id=selected_class_id)
+                    st.session_state['roster_import_report'] = roster.insert_planned_students(plan_df)
+                st.rerun() # 학급/학생 목록 갱신
+            elif not to_add:
+                st.info("추가할 새로운 학생이 없습니다.")
+
+    except Exception as e:
+        st.error(f"파일 처리 중 오류 발생: {e}")
+
+# --- 학생 명단 관리 ---
 st.divider()
 st.subheader("🧑‍🎓 학생 명단 관리")
 
@@ -137,11 +227,11 @@ if selected_class_id:
     # 학생 목록 불러오기 함수
     def get_students(class_id):
         try:
-            response = supabase.table('students') \
-                .select("student_id, student_name") \
-                .eq('class_id', class_id) \
-                .order('student_name', desc=False) \
-                .execute()
+            response = resilience.read_query(lambda db: db.table('students')
+                                             .select("student_id, student_name")
+                                             .eq('class_id', class_id)
+                                             .order('student_name', desc=False),
+                                             cache_key=('students', class_id))
             return pd.DataFrame(response.data) if response.data else pd.DataFrame(columns=['student_id', 'student_name'])
         except Exception as e:
             st.error(f"학생 목록 조회 중 오류 발생: {e}")
@@ -156,15 +246,16 @@ if selected_class_id:
         submitted = st.form_submit_button("학생 추가")
         if submitted and new_student_name:
             try:
-                # 중복 이름 체크 (선택 사항)
-                existing_names = student_df['student_name'].tolist()
+                # 중복 이름 체크 (공백/유니코드 정규화 후 비교)
+                new_student_name = roster.normalize_name(new_student_name)
+                existing_names = set(roster.normalize_names(student_df['student_name']))
                 if new_student_name in existing_names:
                     st.warning(f"이미 '{new_student_name}' 학생이 존재합니다.")
                 else:
-                    response = supabase.table('students').insert({
+                    response = resilience.write(lambda db: db.table('students').insert({
                         'class_id': selected_class_id,
                         'student_name': new_student_name
-                    }).execute()
+                    }))
                     if response.data:
                         st.success(f"'{new_student_name}' 학생이 추가되었습니다.")
                         st.rerun() # 데이터 갱신
@@ -175,67 +266,6 @@ if selected_class_id:
         elif submitted and not new_student_name:
             st.warning("학생 이름을 입력해주세요.")
 
-    # --- 학생 명단 업로드 (CSV/Excel) ---
-    uploaded_file = st.file_uploader("학생 명단 파일 업로드 (CSV 또는 Excel)", type=["csv", "xlsx"])
-    if uploaded_file is not None:
-        try:
-            # 파일 확장자에 따라 읽기
-            if uploaded_file.name.endswith('.csv'):
-                # CSV 파일 인코딩 주의 (utf-8 또는 cp949/euc-kr 등)
-                try:
-                    new_students_df = pd.read_csv(uploaded_file)
-                except UnicodeDecodeError:
-                    # UTF-8 실패 시 다른 인코딩 시도
-                    uploaded_file.seek(0) # 파일 포인터 초기화
-                    new_students_df = pd.read_csv(uploaded_file, encoding='cp949') # 또는 'euc-kr'
-            elif uploaded_file.name.endswith('.xlsx'):
-                new_students_df = pd.read_excel(uploaded_file)
-            else:
-                st.error("지원하지 않는 파일 형식입니다.")
-                new_students_df = None
-
-            if new_students_df is not None:
-                # 파일에서 학생 이름 컬럼 추출 (첫 번째 컬럼으로 가정)
-                # 또는 특정 컬럼명 지정 (예: new_students_df['학생 이름'])
-                if not new_students_df.empty:
-                    student_name_col = new_students_df.columns[0]
-                    new_student_names = new_students_df[student_name_col].astype(str).str.strip().tolist()
-                    new_student_names = [name for name in new_student_names if name] # 빈 이름 제거
-
-                    # DB에 삽입할 데이터 준비 (중복 제외)
-                    existing_names = student_df['student_name'].tolist()
-                    students_to_insert = []
-                    skipped_count = 0
-                    for name in new_student_names:
-                        if name not in existing_names:
-                            students_to_insert.append({
-                                'class_id': selected_class_id,
-                                'student_name': name
-                            })
-                        else:
-                            skipped_count += 1
-
-                    # 데이터 삽입 실행
-                    if students_to_insert:
-                        response = supabase.table('students').insert(students_to_insert).execute()
-                        if response.data:
-                            st.success(f"{len(students_to_insert)}명의 학생이 성공적으로 추가되었습니다.")
-                            if skipped_count > 0:
-                                st.info(f"{skipped_count}명의 학생은 이미 존재하여 건너뛰었습니다.")
-                            st.rerun() # 데이터 갱신
-                        else:
-                            st.error("학생 명단 업로드 중 오류 발생")
-                    elif skipped_count > 0:
-                         st.info(f"업로드한 파일의 모든 학생({skipped_count}명)이 이미 명단에 존재합니다.")
-                    else:
-                         st.warning("업로드할 새로운 학생이 없습니다.")
-
-                else:
-                    st.warning("업로드한 파일에 학생 데이터가 없습니다.")
-
-        except Exception as e:
-            st.error(f"파일 처리 중 오류 발생: {e}")
-
     # --- 학생 목록 표시 및 수정/삭제 (st.data_editor 사용) ---
     st.write("학생 목록 (이름 수정 또는 행 삭제 가능):")
 
@@ -264,83 +294,21 @@ if selected_class_id:
 
         if st.button("변경 사항 저장"):
             try:
-                # 변경된 행 찾기 (Update)
-                diff = pd.concat([student_df, edited_df]).drop_duplicates(keep=False)
-                updates = []
-                original_ids_in_diff = set(diff[diff['student_id'].isin(student_df['student_id'])]['student_id'])
-
-                for index, row in edited_df.iterrows():
-                    student_id = row['student_id']
-                    if student_id in original_ids_in_diff: # 수정된 행
-                         # student_id가 None이거나 비어있지 않은지 확인 후 업데이트 리스트에 추가
-                         if student_id and pd.notna(student_id):
-                              updates.append({'student_id': student_id, 'student_name': row['student_name']})
-
-                if updates:
-                     # Supabase는 기본적으로 upsert 사용 가능, 여기서는 update 사용 예시
-                     # update는 리스트 직접 전달 불가, 개별 실행 필요 또는 함수형 언어 활용
-                     update_errors = 0
-                     for update_data in updates:
-                         try:
-                              response = supabase.table('students') \
-                                         .update({'student_name': update_data['student_name']}) \
-                                         .eq('student_id', update_data['student_id']) \
-                                         .execute()
-                              if not response.data and not hasattr(response, 'status_code') and response.status_code != 204: # 성공 시 보통 data 없음, 상태코드 확인 필요
-                                   print(f"Update failed for {update_data['student_id']}: {response}") # 실패 로깅
-                                   update_errors += 1
-                         except Exception as update_e:
-                              print(f"Update exception for {update_data['student_id']}: {update_e}")
-                              update_errors += 1
-                     if update_errors == 0:
-                          st.success(f"{len(updates)}명의 학생 정보가 수정되었습니다.")
-                     else:
-                          st.error(f"{update_errors}건의 학생 정보 수정 중 오류 발생.")
-
-
-                # 삭제된 행 찾기 (Delete)
-                deleted_ids = list(set(student_df['student_id']) - set(edited_df['student_id']))
-                if deleted_ids:
-                    # NaN 값 제거 (혹시 모를 경우 대비)
-                    deleted_ids = [id_ for id_ in deleted_ids if pd.notna(id_)]
-                    if deleted_ids: # 유효한 ID가 있을 때만 실행
-                         delete_errors = 0
-                         try:
-                              # in_ 연산자로 한 번에 삭제 시도
-                              response = supabase.table('students') \
-                                         .delete() \
-                                         .in_('student_id', deleted_ids) \
-                                         .execute()
-                              # 삭제 성공 여부 확인 (API 응답 구조에 따라 다를 수 있음)
-                              # 성공 시 보통 data가 비어있거나, 삭제된 row 수 반환 가능
-                              # 여기서는 간단히 성공 메시지만 표시
-                              st.success(f"{len(deleted_ids)}명의 학생 정보가 삭제되었습니다.")
-                         except Exception as delete_e:
-                              st.error(f"학생 정보 삭제 중 오류 발생: {delete_e}")
-
-
-                # 추가된 행 찾기 (Add) - data_editor에서 num_rows="dynamic" 사용 시
-                added_rows = edited_df[~edited_df['student_id'].isin(student_df['student_id'])]
-                inserts = []
-                for index, row in added_rows.iterrows():
-                     if pd.notna(row['student_name']) and row['student_name'].strip(): # 이름이 있고 비어있지 않은 경우
-                          inserts.append({
-                              'class_id': selected_class_id,
-                              'student_name': row['student_name'].strip()
-                          })
-
-                if inserts:
-                     response = supabase.table('students').insert(inserts).execute()
-                     if response.data:
-                         st.success(f"{len(inserts)}명의 학생이 추가되었습니다.")
-                     else:
-                         st.error(f"{len(inserts)}건의 학생 추가 중 오류 발생")
-
+                # 학생 ID 기준으로 수정/삭제/추가된 행 찾기
+                renamed, deleted_ids, added = roster.diff_roster(student_df, edited_df)
+                if renamed or deleted_ids or added:
+                    # 이름 수정 + 추가는 일괄 upsert 1회, 삭제는 일괄 delete 1회 (RPC 설치 시 한 트랜잭션)
+                    counts = roster.save_roster_changes(selected_class_id, renamed, deleted_ids, added)
+                    st.session_state['roster_save_message'] = \
+                        f"학생 명단을 저장했습니다. (수정 {counts.get('updated', 0)}명, 추가 {counts.get('inserted', 0)}명, 삭제 {counts.get('deleted', 0)}명)"
                 # 모든 작업 후 새로고침
                 st.rerun()
 
             except Exception as e:
                 st.error(f"변경 사항 저장 중 오류 발생: {e}")
 
+    if st.session_state.get('roster_save_message'):
+        st.success(st.session_state.pop('roster_save_message'))
+
 else:
     st.info("학생 명단을 관리하려면 먼저 위에서 학급을 선택하거나 생성해주세요.")
@@ -3,8 +3,10 @@ import streamlit as st
 from supabase import Client, PostgrestAPIResponse
 import pandas as pd
 from urllib.parse import urlencode # URL 파라미터 생성을 위해 추가
-import qrcode # QR 코드 생성을 위해 추가
-from io import BytesIO # 이미지 메모리 처리를 위해 추가
+import qr_utils # QR 코드 생성 (캐시) 및 인쇄용 PDF
+import survey_ops # 설문 상태 일괄 변경/복제/마감
+import survey_stats # 설문별 응답 현황 (집계 캐시)
+import resilience # 제한 시간/재시도/회로 차단기를 적용한 쿼리 실행
 import os
 
 # --- 페이지 설정 ---
@@ -61,12 +63,15 @@ st.write("학급을 선택하고 설문 회차를 생성하거나 기존 설문
 st.divider()
 st.subheader("1. 설문 대상 학급 선택")
 
+classes = []
 try:
-    class_response: PostgrestAPIResponse = supabase.table('classes') \
-        .select("class_id, class_name") \
-        .eq('teacher_id', teacher_id) \
-        .order('created_at', desc=False) \
-        .execute()
+    class_response = resilience.read_query(lambda db: db.table('classes')
+                                           .select("class_id, class_name")
+                                           .eq('teacher_id', teacher_id)
+                                           .order('created_at', desc=False),
+                                           cache_key=('classes', teacher_id, 'names'))
+    if class_response.stale:
+        st.warning(resilience.stale_notice(class_response))
 
     if class_response.data:
         classes = class_response.data
@@ -88,21 +93,42 @@ except Exception as e:
 
 # --- QR 코드 생성 함수 ---
 def generate_qr_code(url):
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L, # 오류 복원 레벨
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(url)
-    qr.make(fit=True)
+    # URL별로 캐시되므로 rerun/팝오버 열기 때마다 다시 렌더링하지 않음
+    return qr_utils.qr_png(url)
+
+# --- 설문 링크 기본 URL ---
+def get_app_base_url():
+    """Render 환경 변수 → Streamlit Secrets → localhost 순으로 앱 기본 URL을 찾습니다."""
+    app_base_url = None
+    # --- ▼▼▼ Render.com에 설정한 환경 변수 이름으로 변경하세요! ▼▼▼ ---
+    env_var_name_for_base_url = "APP_BASE_URL"
+    # --- ▲▲▲ Render.com에 설정한 환경 변수 이름으로 변경하세요! ▲▲▲ ---
+
+    # 1순위: 환경 변수 시도 (Render.com 등)
+    app_base_url = os.environ.get(env_var_name_for_base_url)
+    if app_base_url and app_base_url.strip().startswith("http"):
+        app_base_url = app_base_url.strip()
+    else:
+        # 2순위: Streamlit Secrets 시도 (Streamlit Cloud 또는 로컬)
+        try:
+            app_base_url = st.secrets.get("app", {}).get("base_url")
+            if app_base_url and app_base_url.strip().startswith("http"):
+                app_base_url = app_base_url.strip()
+            else:
+                app_base_url = None # Secrets에도 없거나 유효하지 않음
+        except Exception as e:
+            st.write(f"DEBUG: Secrets 접근 중 오류: {e}")
+            app_base_url = None
 
-    img = qr.make_image(fill_color="black", back_color="white")
+    # 3순위: 최종 대체 (localhost)
+    if not app_base_url:
+        app_base_url = "http://localhost:8501" # Streamlit 기본 로컬 주소
+        st.warning(f"환경 변수('{env_var_name_for_base_url}') 또는 Secrets에서 유효한 base_url을 찾을 수 없습니다. 로컬 주소로 링크를 생성합니다.")
+    return app_base_url
 
-    # 이미지를 메모리 버퍼에 저장
-    buf = BytesIO()
-    img.save(buf, format="PNG")
-    return buf.getvalue()
+def build_survey_url(app_base_url, survey_instance_id):
+    # Home.py에서 처리하므로 앱 기본 URL + 파라미터 형태
+    return f"{app_base_url}/?{urlencode({'survey_id': survey_instance_id})}"
 
 # --- 설문 회차 관리 ---
 if selected_class_id:
@@ -112,11 +138,11 @@ if selected_class_id:
     # 기존 설문 회차 목록 조회 함수
     def get_surveys(class_id):
         try:
-            response = supabase.table('surveys') \
-                .select("survey_instance_id, survey_name, description, status, created_at") \
-                .eq('class_id', class_id) \
-                .order('created_at', desc=True) \
-                .execute()
+            response = resilience.read_query(lambda db: db.table('surveys')
+                                             .select("survey_instance_id, survey_name, description, status, created_at")
+                                             .eq('class_id', class_id)
+                                             .order('created_at', desc=True),
+                                             cache_key=('surveys', class_id))
             return pd.DataFrame(response.data) if response.data else pd.DataFrame()
         except Exception as e:
             st.error(f"설문 목록 조회 중 오류 발생: {e}")
@@ -131,7 +157,7 @@ if selected_class_id:
         processed_df = survey_df.copy() # 원본 복사
 
         # 1. status 컬럼 처리: None 값을 기본값('준비중')으로 채우고, 문자열로 변환
-        status_options = ['준비중', '진행중', '완료']
+        status_options = survey_ops.STATUS_OPTIONS
         processed_df['status'] = processed_df['status'].fillna('준비중').astype(str)
         # 혹시 모를 options 외 값 처리 (선택적: 첫번째 옵션 값으로 강제 변환 등)
         processed_df['status'] = processed_df['status'].apply(lambda x: x if x in status_options else status_options[0])
@@ -144,6 +170,13 @@ if selected_class_id:
         processed_df['survey_name'] = processed_df['survey_name'].fillna('').astype(str)
         processed_df['description'] = processed_df['description'].fillna('').astype(str)
 
+        # 4. 응답 현황: 제출/전체 학생 수, 마지막 제출 시각 (집계 쿼리 결과 캐시, 편집 불가)
+        response_stats = survey_stats.get_response_stats(processed_df['survey_instance_id'])
+        survey_keys = processed_df['survey_instance_id'].astype(str)
+        processed_df['responses'] = survey_keys.map(lambda survey_id: survey_stats.format_response_count(response_stats.get(survey_id)))
+        processed_df['last_submitted_at'] = pd.to_datetime(
+            survey_keys.map(lambda survey_id: (response_stats.get(survey_id) or {}).get('last_submitted_at')), errors='coerce')
+
         # (디버깅용) 전처리 후 DataFrame 정보 출력
         # st.write("전처리 후 데이터 타입:")
         # st.dataframe(processed_df.dtypes.astype(str))
@@ -163,8 +196,11 @@ if selected_class_id:
                       "생성일",
                       format="YYYY-MM-DD HH:mm", # 표시 형식
                       # step=60*60 # 1시간 단위 (선택 사항)
-                  )
+                  ),
+                  "responses": st.column_config.TextColumn("응답 (제출/전체)", width="small"),
+                  "last_submitted_at": st.column_config.DatetimeColumn("마지막 제출", format="YYYY-MM-DD HH:mm"),
              },
+             disabled=["responses", "last_submitted_at"],
              hide_index=True,
              use_container_width=True,
              key="survey_editor"
@@ -174,21 +210,20 @@ if selected_class_id:
         if not processed_df[['status']].equals(edited_survey_df[['status']]): # 상태 변경만 감지 (다른 컬럼도 편집 가능하게 하려면 로직 수정 필요)
              if st.button("설문 상태 변경 저장"):
                   try:
-                      update_errors = 0
-                      for index, row in edited_survey_df.iterrows():
-                          original_row = processed_df.loc[index] # loc 사용 권장
-                          if row['status'] != original_row['status']:
-                               response = supabase.table('surveys') \
-                                          .update({'status': row['status']}) \
-                                          .eq('survey_instance_id', row['survey_instance_id']) \
-                                          .execute()
-                               # 응답 확인 로직 강화 필요 (예: response.error 확인)
-                               # if response.error: update_errors += 1
-                      if update_errors == 0:
-                           st.success("설문 상태가 업데이트되었습니다.")
+                      # 상태가 바뀐 설문만 모아 상태별로 한 번씩 일괄 update
+                      changed = edited_survey_df['status'] != processed_df['status']
+                      status_by_survey = dict(zip(edited_survey_df.loc[changed, 'survey_instance_id'],
+                                                  edited_survey_df.loc[changed, 'status']))
+                      names_by_survey = dict(zip(processed_df['survey_instance_id'], processed_df['survey_name']))
+                      results = survey_ops.update_survey_statuses(teacher_id, status_by_survey)
+                      failed = {survey_id: error for survey_id, error in results.items() if error}
+                      if not failed:
+                           st.success(f"{len(results)}개 설문의 상태가 업데이트되었습니다.")
                            st.rerun()
                       else:
-                           st.error("일부 설문 상태 업데이트 중 오류 발생.")
+                           st.error(f"{len(failed)}개 설문의 상태 업데이트 중 오류 발생 (성공 {len(results) - len(failed)}개):")
+                           for survey_id, error in failed.items():
+                                st.write(f"- {names_by_survey.get(survey_id, survey_id)}: {error}")
                   except Exception as e:
                        st.error(f"상태 업데이트 중 오류: {e}")
 
@@ -204,42 +239,8 @@ if selected_class_id:
             if selected_survey_name_for_link:
                 selected_survey_id_for_link = link_survey_options[selected_survey_name_for_link]
 
-                # --- !!! URL 생성 부분 수정 (Render 환경 변수 우선) !!! ---
-                app_base_url = None
-                # --- ▼▼▼ Render.com에 설정한 환경 변수 이름으로 변경하세요! ▼▼▼ ---
-                env_var_name_for_base_url = "APP_BASE_URL"
-                # --- ▲▲▲ Render.com에 설정한 환경 변수 이름으로 변경하세요! ▲▲▲ ---
-
-                # 1순위: 환경 변수 시도 (Render.com 등)
-                app_base_url = os.environ.get(env_var_name_for_base_url)
-                if app_base_url and app_base_url.strip().startswith("http"):
-                    app_base_url = app_base_url.strip()
-                    # st.write(f"DEBUG: 환경 변수 '{env_var_name_for_base_url}'에서 base_url 로드: {app_base_url}")
-                else:
-                    # 2순위: Streamlit Secrets 시도 (Streamlit Cloud 또는 로컬)
-                    # st.write(f"DEBUG: 환경 변수 '{env_var_name_for_base_url}' 없음/유효하지 않음. Secrets 확인 시도...")
-                    try:
-                        app_base_url = st.secrets.get("app", {}).get("base_url")
-                        if app_base_url and app_base_url.strip().startswith("http"):
-                            app_base_url = app_base_url.strip()
-                            # st.write(f"DEBUG: Secrets 'app.base_url'에서 base_url 로드: {app_base_url}")
-                        else:
-                            app_base_url = None # Secrets에도 없거나 유효하지 않음
-                    except Exception as e:
-                        st.write(f"DEBUG: Secrets 접근 중 오류: {e}")
-                        app_base_url = None
-
-                # 3순위: 최종 대체 (localhost)
-                if not app_base_url:
-                    app_base_url = "http://localhost:8501" # Streamlit 기본 로컬 주소
-                    st.warning(f"환경 변수('{env_var_name_for_base_url}') 또는 Secrets에서 유효한 base_url을 찾을 수 없습니다. 로컬 주소로 링크를 생성합니다.")
-
-                # st.write(f"DEBUG: 최종 사용될 Base URL: {app_base_url}")
-
-                # URL 파라미터 생성 및 최종 URL 조합
-                query_params = urlencode({'survey_id': selected_survey_id_for_link})
-                # Home.py에서 처리하므로 앱 기본 URL + 파라미터 형태
-                survey_url = f"{app_base_url}/?{query_params}"
+                # URL 생성 (Render 환경 변수 우선)
+                survey_url = build_survey_url(get_app_base_url(), selected_survey_id_for_link)
                 st.write(f"**'{selected_survey_name_for_link}' 설문 링크:**")
                 st.code(survey_url)
                 st.caption("링크를 복사하거나 아래 QR 코드를 학생들에게 보여주세요.")
@@ -255,17 +256,54 @@ if selected_class_id:
                     with st.popover("QR 코드 크게 보기"):
                         st.image(qr_code_data, use_column_width=True)
 
+                    st.download_button(
+                        label="⬇️ QR 코드 SVG 다운로드 (인쇄용)",
+                        data=qr_utils.qr_svg(survey_url),
+                        file_name=f"QR_{selected_survey_name_for_link}.svg",
+                        mime="image/svg+xml",
+                        key=f"qr_svg_{selected_survey_id_for_link}"
+                    )
+
                 except Exception as e:
                     st.error(f"QR 코드 생성 중 오류 발생: {e}")
         else:
              st.info("기존 설문 목록에서 설문을 선택해주세요.")
 
+    # 다른 학급으로 설문 복제
+    if not survey_df.empty and len(classes) > 1:
+        with st.expander("📑 설문을 다른 학급으로 복제"):
+            surveys_by_id = {s['survey_instance_id']: s for s in survey_df.to_dict('records')}
+            with st.form("clone_survey_form"):
+                clone_source_id = st.selectbox(
+                    "복제할 설문", options=list(surveys_by_id),
+                    format_func=lambda survey_id: surveys_by_id[survey_id]['survey_name'])
+                other_classes = {c['class_id']: c['class_name'] for c in classes if c['class_id'] != selected_class_id}
+                clone_class_ids = st.multiselect(
+                    "대상 학급", options=list(other_classes), format_func=lambda class_id: other_classes[class_id])
+                clone_status = st.selectbox("상태", options=survey_ops.STATUS_OPTIONS, index=0)
+                clone_submitted = st.form_submit_button("복제하기")
+
+            if clone_submitted:
+                if not clone_class_ids:
+                    st.warning("대상 학급을 선택해주세요.")
+                else:
+                    try:
+                        created = survey_ops.clone_survey(teacher_id, surveys_by_id[clone_source_id], clone_class_ids, clone_status)
+                        succeeded = [other_classes[class_id] for class_id, survey_id in created.items() if survey_id]
+                        failed = [other_classes[class_id] for class_id, survey_id in created.items() if not survey_id]
+                        if succeeded:
+                            st.success(f"{len(succeeded)}개 학급에 설문을 복제했습니다: {', '.join(succeeded)}")
+                        if failed:
+                            st.error(f"복제하지 못한 학급: {', '.join(failed)}")
+                    except Exception as e:
+                        st.error(f"설문 복제 중 오류 발생: {e}")
+
     # 새 설문 회차 생성 폼
     with st.expander("➕ 새 설문 회차 생성"):
         with st.form("new_survey_form", clear_on_submit=True):
             new_survey_name = st.text_input("새 설문 이름 (예: 2025년 1학기 교우관계)", max_chars=100)
             new_survey_desc = st.text_area("설명 (선택 사항)", max_chars=300)
-            new_survey_status = st.selectbox("상태", options=['준비중', '진행중', '완료'], index=1) # 기본값 '진행중'
+            new_survey_status = st.selectbox("상태", options=survey_ops.STATUS_OPTIONS, index=1) # 기본값 '진행중'
             submitted = st.form_submit_button("설문 생성하기")
 
             if submitted:
@@ -273,13 +311,13 @@ if selected_class_id:
                     st.warning("설문 이름을 입력해주세요.")
                 else:
                     try:
-                        response: PostgrestAPIResponse = supabase.table('surveys').insert({
+                        response: PostgrestAPIResponse = resilience.write(lambda db: db.table('surveys').insert({
                             'class_id': selected_class_id,
                             'teacher_id': teacher_id,
                             'survey_name': new_survey_name,
                             'description': new_survey_desc,
                             'status': new_survey_status
-                        }).execute()
+                        }))
 
                         if response.data:
                             st.success(f"'{new_survey_name}' 설문이 생성되었습니다!")
@@ -292,4 +330,70 @@ if selected_class_id:
                         st.error(f"설문 생성 중 오류 발생: {e}")
 
 else:
-    st.info("먼저 학급을 선택해주세요.")
\ No newline at end of file
+    st.info("먼저 학급을 선택해주세요.")
+
+# --- 진행중인 설문 일괄 마감 ---
+st.divider()
+st.subheader("🗂️ 진행중인 설문 일괄 마감")
+st.caption("모든 학급의 '진행중' 설문을 한 번에 '완료'로 바꿉니다.")
+confirm_close_all = st.checkbox("모든 학급의 진행중 설문을 마감합니다.")
+if st.button("진행중 설문 모두 마감", disabled=not confirm_close_all):
+    try:
+        closed = survey_ops.close_active_surveys(teacher_id)
+        if closed:
+            class_names = {c['class_id']: c['class_name'] for c in classes}
+            st.session_state['close_surveys_message'] = (
+                f"{len(closed)}개 설문을 마감했습니다.",
+                [f"{class_names.get(survey.get('class_id'), '')} {survey.get('survey_name', '')}" for survey in closed])
+            # 위 설문 목록/상태 편집기는 마감 전 상태로 이미 그려졌으므로, 편집 내용을 버리고 새로 조회
+            # (그대로 두면 '진행중'으로 보이는 편집기를 저장할 때 방금 마감한 설문이 다시 열림)
+            st.session_state.pop('survey_editor', None)
+            st.rerun()
+        else:
+            st.info("'진행중' 상태인 설문이 없습니다.")
+    except Exception as e:
+        st.error(f"설문 마감 중 오류 발생: {e}")
+
+if st.session_state.get('close_surveys_message'):
+    close_message, closed_names = st.session_state.pop('close_surveys_message')
+    st.success(close_message)
+    for closed_name in closed_names:
+        st.write(f"- {closed_name}")
+
+# --- 진행중인 설문 QR 코드 일괄 인쇄 ---
+st.divider()
+st.subheader("🖨️ 진행중인 설문 QR 코드 인쇄")
+st.caption("모든 학급의 '진행중' 설문 QR 코드를 한 페이지에 하나씩 담은 PDF로 만듭니다.")
+
+if st.button("인쇄용 QR PDF 만들기"):
+    try:
+        active_response = resilience.read_query(lambda db: db.table('surveys')
+                                                .select("survey_instance_id, survey_name, class_id, created_at")
+                                                .eq('teacher_id', teacher_id)
+                                                .eq('status', '진행중')
+                                                .order('created_at', desc=False))
+        active_surveys = active_response.data or []
+        if not active_surveys:
+            st.info("'진행중' 상태인 설문이 없습니다.")
+            st.session_state.pop('qr_sheet_pdf', None)
+        else:
+            class_names = {c['class_id']: c['class_name'] for c in classes}
+            app_base_url = get_app_base_url()
+            entries = [
+                (class_names.get(survey['class_id'], ''), survey['survey_name'], build_survey_url(app_base_url, survey['survey_instance_id']))
+                for survey in active_surveys
+            ]
+            with st.spinner(f"QR 코드 {len(entries)}개를 PDF로 만드는 중..."):
+                st.session_state['qr_sheet_pdf'] = (qr_utils.build_qr_sheet_pdf(entries), len(entries))
+    except Exception as e:
+        st.error(f"QR 인쇄용 PDF 생성 중 오류 발생: {e}")
+
+if st.session_state.get('qr_sheet_pdf'):
+    qr_sheet_pdf, qr_sheet_count = st.session_state['qr_sheet_pdf']
+    st.download_button(
+        label=f"⬇️ QR 코드 PDF 다운로드 ({qr_sheet_count}개 설문)",
+        data=qr_sheet_pdf,
+        file_name="설문_QR코드.pdf",
+        mime="application/pdf",
+        key="qr_sheet_download"
+    )
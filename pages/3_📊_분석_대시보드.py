@@ -2,12 +2,23 @@
 import streamlit as st
 from supabase import Client, PostgrestAPIResponse
 import pandas as pd
+import numpy as np
 import json
 import plotly.express as px # 시각화를 위해 Plotly 추가 (pip install plotly)
 import os
-from utils import call_gemini
+import ai_jobs
+import rate_limiter
+import reports
+import survey_stats
+import live_updates
+import bootstrap
+import resilience
+import sociometry
+import sociogram
+import trends
+import relation_matrix as rm
+from relation_matrix import RelationMatrix
 import itertools
-from fpdf import FPDF        # PDF 생성을 위해 추가
 from io import BytesIO      # 메모리 버퍼 사용 위해 추가
 import datetime
 import traceback
@@ -62,54 +73,18 @@ teacher_id = st.session_state.get('teacher_id')
 teacher_name = st.session_state.get('teacher_name', '선생님')
 
 def create_pdf(text_content, title="AI 분석 결과"):
-    pdf = FPDF()
-    pdf.add_page()
-
-    # 한글 폰트 추가
-    try:
-        font_path = 'fonts/NanumGothicCoding.ttf'
-        pdf.add_font('NanumGothic', '', font_path, uni=True)
-        pdf.set_font('NanumGothic', size=16)
-    except Exception as e:
-        st.error(f"PDF 오류: 폰트 처리 중 오류 - {e}")
-        return None
-
-    # 제목
-    try:
-        pdf.cell(0, 10, txt=title, ln=1, align='C')
-        pdf.ln(10)
-    except Exception as e:
-        st.error(f"PDF 제목 쓰기 오류: {e}")
-        return None
-
-    # 본문
-    pdf.set_font('NanumGothic', size=10)
+    """PDF bytes를 반환합니다 (폰트는 프로세스당 1회 로드, 같은 내용은 캐시 사용). 실패 시 None"""
     try:
-        pdf.multi_cell(0, 5, txt=text_content)
+        return reports.create_pdf_cached(text_content, title)
     except Exception as e:
-        st.error(f"PDF 내용 쓰기 오류: {e}")
-        return None
-
-    # PDF 데이터를 바이트 형태로 반환 (수정된 부분 - 타입 체크 완화)
-    try:
-        pdf_data = pdf.output() # 바이트 또는 바이트 배열 반환 기대
-
-        # 반환값이 bytes 또는 bytearray 인지 확인 (더 유연하게)
-        if isinstance(pdf_data, (bytes, bytearray)):
-             return pdf_data # 그대로 반환
-        else:
-             # 예상치 못한 타입 반환 시 오류 발생
-             raise TypeError(f"pdf.output() did not return bytes or bytearray (returned {type(pdf_data)}).")
-
-    except Exception as e_output:
-        st.error(f"PDF 데이터 생성(출력) 중 오류: {e_output}")
+        st.error(f"PDF 생성 중 오류: {e}")
         print("PDF Output Error Traceback:")
         traceback.print_exc()
         return None
 
 # --- 받은 점수 계산 함수 ---
-@st.cache_data # 입력값이 같으면 이전 계산 결과 재사용
-def calculate_received_scores(_analysis_df, _students_map):
+@st.cache_data(max_entries=32) # 같은 응답 데이터(행렬 지문)면 이전 계산 결과 재사용 (실시간 반영 중 지문이 계속 바뀌므로 개수 제한)
+def calculate_received_scores(_analysis_df, _students_map, fingerprint=None):
     """각 학생이 다른 학생들로부터 받은 평균 친밀도 점수를 계산합니다."""
     # 입력 DataFrame이나 map이 비어있으면 빈 DataFrame 반환
     if _analysis_df.empty or not _students_map:
@@ -148,8 +123,8 @@ def calculate_received_scores(_analysis_df, _students_map):
 
 
 # --- 준 점수 계산 함수 (기존 코드 약간 수정) ---
-@st.cache_data # 입력값이 같으면 이전 계산 결과 재사용
-def calculate_given_scores(_analysis_df, _students_map, id_col='submitter_id', name_col='submitter_name', relations_col='parsed_relations'):
+@st.cache_data(max_entries=32) # 같은 응답 데이터(행렬 지문)면 이전 계산 결과 재사용 (실시간 반영 중 지문이 계속 바뀌므로 개수 제한)
+def calculate_given_scores(_analysis_df, _students_map, id_col='submitter_id', name_col='submitter_name', relations_col='parsed_relations', fingerprint=None):
     """각 학생이 다른 학생들에게 준 평균 친밀도 점수 및 점수 목록을 계산합니다."""
     # 입력 유효성 검사
     if _analysis_df.empty or id_col not in _analysis_df.columns or not _students_map:
@@ -186,6 +161,15 @@ def calculate_given_scores(_analysis_df, _students_map, id_col='submitter_id', n
         return pd.DataFrame(columns=['submitter_id', 'submitter_name', 'average_score_given', 'rated_count', 'scores_list'])
     return pd.DataFrame(given_scores_list)
 
+# 관계 유형 분류 (analyze_reciprocity / analyze_reciprocity_matrix 공통)
+def categorize_relationship(row, high_threshold=75, low_threshold=35):
+    score_ab = row['A->B 점수']
+    score_ba = row['B->A 점수']
+    # ... (분류 로직) ...
+    if score_ab >= high_threshold and score_ba >= high_threshold: return "✅ 상호 높음"
+    # ... (나머지 분류 로직) ...
+    return "↔️ 혼합/중간"
+
 # --- ▼▼▼ [수정 1] analyze_reciprocity 함수 정의를 여기로 이동 ▼▼▼ ---
 @st.cache_data # 계산 결과를 캐싱
 def analyze_reciprocity(df, student_map):
@@ -224,19 +208,501 @@ def analyze_reciprocity(df, student_map):
 
     reciprocity_df_local = pd.DataFrame(reciprocal_data) # 변수 이름 충돌 방지
 
-    # 3. 관계 유형 분류 함수 정의
-    def categorize_relationship(row, high_threshold=75, low_threshold=35):
-        score_ab = row['A->B 점수']
-        score_ba = row['B->A 점수']
-        # ... (분류 로직) ...
-        if score_ab >= high_threshold and score_ba >= high_threshold: return "✅ 상호 높음"
-        # ... (나머지 분류 로직) ...
-        return "↔️ 혼합/중간"
-
+    # 3. 관계 유형 분류
     reciprocity_df_local['관계 유형'] = reciprocity_df_local.apply(categorize_relationship, axis=1)
     return reciprocity_df_local # 계산된 DataFrame 반환
 # --- ▲▲▲ [수정 1] 완료 ▲▲▲ ---
 
+def analyze_reciprocity_matrix(matrix):
+    """analyze_reciprocity 와 같은 결과를 관계 행렬(보정 점수 포함)에서 계산합니다. (서로 점수를 매긴 제출 학생 쌍)"""
+    columns = ['학생 A', '학생 B', 'A->B 점수', 'B->A 점수', '관계 유형']
+    rated = ~np.isnan(matrix.scores) & matrix.submitted[:, None] & matrix.submitted[None, :]
+    rows, cols = np.nonzero(np.triu(rated & rated.T, 1))
+    if rows.size == 0:
+        return pd.DataFrame(columns=columns)
+    reciprocity_df_local = pd.DataFrame({
+        '학생 A': [matrix.names[i] for i in rows], '학생 B': [matrix.names[j] for j in cols],
+        'A->B 점수': matrix.scores[rows, cols].round(1), 'B->A 점수': matrix.scores[cols, rows].round(1),
+    })
+    reciprocity_df_local['관계 유형'] = reciprocity_df_local.apply(categorize_relationship, axis=1)
+    return reciprocity_df_local
+
+@st.cache_data(max_entries=32) # 같은 설문 버전(행렬 지문)이면 이전 계산 결과 재사용
+def get_sociometry_metrics(_matrix, survey_instance_id, fingerprint):
+    return sociometry.compute_metrics(_matrix)
+
+@st.cache_data(max_entries=32)
+def get_friend_groups(_matrix, survey_instance_id, fingerprint):
+    return sociometry.detect_communities(_matrix)
+
+@st.cache_data(max_entries=32) # 설문 버전마다 한 번만 배치 계산
+def get_sociogram_layout(_matrix, survey_instance_id, fingerprint, _previous_positions):
+    return sociogram.layout_positions(_matrix, previous=_previous_positions)
+
+@st.cache_data(max_entries=32) # 실시간 반영 중에는 변경마다 지문이 바뀌므로 개수 제한
+def get_received_intervals(_matrix, survey_instance_id, fingerprint):
+    return _matrix.received_intervals()
+
+@st.cache_data(max_entries=32)
+def get_heatmap_order(_matrix, survey_instance_id, fingerprint, _membership_df):
+    return sociometry.seriation_order(_matrix, _membership_df)
+
+@st.cache_data(ttl=300) # 학급 + 설문 목록이 같으면 재사용 (새 설문이 생기면 키가 바뀜)
+def load_class_trend(class_id, survey_ids, _surveys, _roster):
+    tensor, result = trends.load_class_rounds(_surveys, _roster)
+    return tensor, resilience.stale_notice(result)
+
+TREND_STUDENT_LABELS = {
+    'student_name': "학생", 'received_before': "기준 회차 받은 평균", 'received_after': "비교 회차 받은 평균",
+    'received_change': "받은 평균 변화", 'given_change': "준 평균 변화", 'positive_in_change': "받은 긍정 선택 변화",
+}
+TREND_PAIR_LABELS = {'from_name': "준 학생", 'to_name': "받은 학생", 'score_before': "기준 회차", 'score_after': "비교 회차", 'change': "변화"}
+
+def render_trend_view(class_id, class_surveys, current_survey_id):
+    """학급의 설문 회차 비교 (모든 회차 응답을 한 번에 불러와 학생/학생 쌍별 변화 표시)"""
+    if len(class_surveys) < 2:
+        st.info("이 학급의 설문이 2개 이상이어야 회차를 비교할 수 있습니다.")
+        return
+    survey_ids = tuple(str(s['survey_instance_id']) for s in class_surveys)
+    tensor, notice = load_class_trend(class_id, survey_ids, class_surveys, get_class_roster(class_id))
+    if notice:
+        st.warning(notice)
+
+    summary_df = tensor.class_summary()
+    st.write("##### 회차별 학급 요약")
+    st.dataframe(summary_df.rename(columns={
+        'survey_name': "설문", 'submitted': "응답 학생 수", 'mean_score': "평균 점수",
+        'positive_ratio': "긍정 선택 비율", 'negative_ratio': "부정 선택 비율"}).round(3),
+        use_container_width=True, hide_index=True)
+
+    names = tensor.survey_names
+    target_default = tensor.round_index(current_survey_id) if str(current_survey_id) in survey_ids else len(tensor) - 1
+    target_default = max(target_default, 1)
+    col_base, col_target = st.columns(2)
+    with col_base:
+        base = st.selectbox("기준 회차", options=range(len(tensor)), index=target_default - 1,
+                            format_func=lambda i: names[i], key=f"trend_base_{class_id}")
+    with col_target:
+        target = st.selectbox("비교 회차", options=range(len(tensor)), index=target_default,
+                              format_func=lambda i: names[i], key=f"trend_target_{class_id}")
+    if base == target:
+        st.info("서로 다른 두 회차를 선택해주세요.")
+        return
+
+    student_df = tensor.student_changes(base, target)
+    if student_df.empty:
+        st.write("두 회차에 모두 응답한 학생이 없어 비교할 수 없습니다.")
+        return
+    received, _, _ = tensor.student_averages()
+    movers = pd.concat([student_df.head(trends.TOP_CHANGES // 2), student_df.tail(trends.TOP_CHANGES // 2)]).drop_duplicates('student_id')
+    mover_idx = [tensor.student_ids.index(student_id) for student_id in movers['student_id']]
+    line_df = pd.DataFrame(received[:, mover_idx], columns=[tensor.names[i] for i in mover_idx])
+    line_df['설문'] = names
+    fig_trend = px.line(line_df.melt(id_vars='설문', var_name='학생', value_name='받은 평균 점수'),
+                        x='설문', y='받은 평균 점수', color='학생', markers=True,
+                        title="받은 평균 점수 변화가 큰 학생의 회차별 추이")
+    fig_trend.update_layout(yaxis_range=[0, 100])
+    st.plotly_chart(fig_trend, use_container_width=True)
+
+    col_drop, col_rise = st.columns(2)
+    with col_drop:
+        st.write("##### 🔻 받은 평균 점수가 가장 많이 떨어진 학생")
+        st.dataframe(student_df.head(trends.TOP_CHANGES).query('received_change < 0')[list(TREND_STUDENT_LABELS)]
+                     .rename(columns=TREND_STUDENT_LABELS).round(1), use_container_width=True, hide_index=True)
+    with col_rise:
+        st.write("##### 🔺 받은 평균 점수가 가장 많이 오른 학생")
+        st.dataframe(student_df.iloc[::-1].head(trends.TOP_CHANGES).query('received_change > 0')[list(TREND_STUDENT_LABELS)]
+                     .rename(columns=TREND_STUDENT_LABELS).round(1), use_container_width=True, hide_index=True)
+
+    drops_df, rises_df = tensor.pair_changes(base, target)
+    col_drop, col_rise = st.columns(2)
+    with col_drop:
+        st.write("##### 🔻 점수가 가장 많이 떨어진 관계")
+        st.dataframe(drops_df.rename(columns=TREND_PAIR_LABELS), use_container_width=True, hide_index=True)
+    with col_rise:
+        st.write("##### 🔺 점수가 가장 많이 오른 관계")
+        st.dataframe(rises_df.rename(columns=TREND_PAIR_LABELS), use_container_width=True, hide_index=True)
+    st.caption("두 회차에 모두 응답한 학생 사이의 점수만 비교합니다. 관계는 '준 학생 → 받은 학생' 방향의 점수입니다.")
+
+def sociogram_positions(matrix, class_id, survey_instance_id, class_survey_ids):
+    """소시오그램 배치 좌표. 같은 학급의 이전 설문 배치(없으면 가장 최근에 본 배치)에서 시작해 설문 간 위치를 유지"""
+    history = st.session_state.setdefault('sociogram_layouts', {}).setdefault(class_id, {})
+    previous = None
+    ids = [str(survey_id) for survey_id in class_survey_ids]
+    if str(survey_instance_id) in ids:
+        older = ids[ids.index(str(survey_instance_id)) + 1:] # 목록은 최신순
+        previous = next((history[survey_id] for survey_id in older if survey_id in history), None)
+    if previous is None and history:
+        previous = next(reversed(history.values()))
+    positions = get_sociogram_layout(matrix, survey_instance_id, matrix.fingerprint(), previous)
+    history.pop(str(survey_instance_id), None)
+    history[str(survey_instance_id)] = positions
+    return positions
+
+SOCIOMETRY_LABELS = {
+    'student_name': "학생", 'in_strength': "받은 연결 강도", 'out_strength': "준 연결 강도",
+    'pagerank': "PageRank", 'reciprocity': "상호 선택 비율", 'betweenness': "매개 중심성",
+    'positive_in': "받은 긍정 선택", 'negative_in': "받은 부정 선택", 'status': "사회성 지위", 'isolation_index': "고립 지수",
+}
+GROUP_LABELS = {
+    'group': "그룹", 'size': "인원", 'members': "구성원", 'density': "그룹 내 선택 밀도",
+    'mutual_ratio': "상호 선택 비율", 'mean_score': "그룹 내 평균 점수",
+}
+
+
+# --- AI 분석 결과 일괄 조회 함수 ---
+def load_ai_results(survey_instance_id):
+    """설문의 모든 AI 분석 결과를 한 번의 쿼리로 조회하여 (student_id, analysis_type) 키의 dict로 반환합니다."""
+    response = resilience.read_query(lambda db: db.table("ai_analysis_results")
+                                     .select("student_id, analysis_type, result_text, teacher_comment, generated_at")
+                                     .eq("survey_instance_id", survey_instance_id),
+                                     cache_key=('ai_results', survey_instance_id))
+    return {(row.get('student_id'), row.get('analysis_type')): row for row in (response.data or [])}
+
+def get_ai_results(survey_instance_id):
+    """세션에 보관된 설문별 AI 결과 dict를 반환합니다. 없으면 한 번만 DB에서 불러옵니다."""
+    session_key = f"ai_results_{survey_instance_id}"
+    if session_key not in st.session_state:
+        try:
+            st.session_state[session_key] = load_ai_results(survey_instance_id)
+        except Exception as e:
+            st.warning(f"저장된 AI 분석 결과 조회 중 오류: {e}")
+            return {} # 오류 시 세션에 저장하지 않아 다음 실행 때 재시도
+    return st.session_state[session_key]
+
+def remember_ai_result(ai_results, saved_row):
+    """upsert로 저장한 행을 일괄 로드한 dict에 바로 반영합니다 (재조회 없음)."""
+    key = (saved_row.get('student_id'), saved_row.get('analysis_type'))
+    ai_results[key] = {**ai_results.get(key, {}), **saved_row}
+
+# --- 백그라운드 AI 작업 관련 함수 ---
+@st.cache_resource
+def start_ai_worker():
+    """AI 작업 워커를 이 프로세스에서 한 번만 백그라운드 스레드로 시작합니다."""
+    if os.environ.get("AI_WORKER_MODE") == "external": # 별도 프로세스(python ai_jobs.py)로 워커를 실행하는 경우
+        return None
+    return ai_jobs.start_worker_thread()
+
+def ai_job_session_key(survey_instance_id, student_id, analysis_type):
+    return f"ai_job_{survey_instance_id}_{student_id}_{analysis_type}"
+
+def ai_error_session_key(survey_instance_id, student_id, analysis_type):
+    return f"ai_job_error_{survey_instance_id}_{student_id}_{analysis_type}"
+
+def save_ai_result(ai_results, data_to_save):
+    """(교사가 고친) 분석 결과를 ai_analysis_results에 upsert 하고 일괄 로드한 dict에도 반영합니다. 성공하면 True"""
+    try:
+        upsert_response = resilience.write(lambda db: db.table("ai_analysis_results")
+            .upsert(data_to_save, on_conflict='survey_instance_id, student_id, analysis_type'))
+        if hasattr(upsert_response, 'error') and upsert_response.error is not None:
+            st.warning(f"분석 결과를 DB에 저장하는 중 오류 발생: {upsert_response.error}")
+            return False
+    except Exception as db_e:
+        st.warning(f"분석 결과를 DB에 저장하는 중 예외 발생: {db_e}")
+        return False
+    remember_ai_result(ai_results, data_to_save) # 일괄 로드한 dict도 즉시 갱신
+    return True
+
+def render_ai_result_editor(survey_instance_id, analysis_type, ai_results):
+    """학급 단위(student_id 없음) 분석의 저장된 결과를 교사가 고쳐 다시 저장할 수 있게 합니다 (선택 사항)."""
+    saved_row = ai_results.get((None, analysis_type))
+    if not saved_row or not saved_row.get('result_text'):
+        return
+    with st.expander("✏️ 분석 결과 수정"):
+        edited_text = st.text_area("분석 결과", value=saved_row['result_text'], height=300,
+                                   key=f"edit_ai_{survey_instance_id}_{analysis_type}")
+        if st.button("💾 수정 내용 저장하기", key=f"save_ai_{survey_instance_id}_{analysis_type}",
+                     disabled=edited_text == saved_row['result_text']):
+            # teacher_comment는 보내지 않으므로 기존 교사 코멘트는 그대로 유지됨
+            if save_ai_result(ai_results, {
+                'survey_instance_id': survey_instance_id,
+                'student_id': None,
+                'analysis_type': analysis_type,
+                'result_text': edited_text,
+                'generated_at': datetime.datetime.now().isoformat(),
+            }):
+                st.success("✅ 수정한 분석 결과가 저장되었습니다.")
+                st.rerun()
+
+def submit_ai_job(survey_instance_id, student_id, analysis_type, prompt, api_key):
+    """AI 분석을 작업 큐에 등록하고 job_id를 세션에 기록합니다."""
+    try:
+        job_id = ai_jobs.enqueue_job(survey_instance_id, student_id, analysis_type, prompt, api_key, teacher_id=teacher_id)
+        st.session_state[ai_job_session_key(survey_instance_id, student_id, analysis_type)] = job_id
+        st.session_state.pop(ai_error_session_key(survey_instance_id, student_id, analysis_type), None)
+        st.info("⏳ AI 분석 작업이 등록되었습니다. 다른 페이지로 이동해도 분석은 계속 진행됩니다.")
+        # 레이트 리미터 기준 예상 대기 시간 안내 (실패 대신 미리 알려줌)
+        expected_wait = rate_limiter.get_limiter().estimate_wait(api_key, rate_limiter.estimate_tokens(prompt))
+        if expected_wait >= 1:
+            st.caption(f"현재 AI 요청이 많아 약 {expected_wait:.0f}초 후 분석이 시작됩니다.")
+        return job_id
+    except Exception as e:
+        st.error(f"AI 분석 작업 등록 중 오류 발생: {e}")
+        return None
+
+AI_JOB_POLL_SECONDS = 2 # 진행 중인 AI 작업 상태 확인 주기
+
+def poll_ai_job(survey_instance_id, student_id, analysis_type):
+    """AI 작업 상태 표시. 대기/실행 중인 작업이 세션에 있을 때만 AI_JOB_POLL_SECONDS마다 다시 실행되는 fragment로 확인합니다
+    (작업이 없으면 주기 실행 없이 한 번만 그림)."""
+    pending = bool(st.session_state.get(ai_job_session_key(survey_instance_id, student_id, analysis_type)))
+    st.fragment(_poll_ai_job, run_every=AI_JOB_POLL_SECONDS if pending else None)(survey_instance_id, student_id, analysis_type)
+
+def _poll_ai_job(survey_instance_id, student_id, analysis_type):
+    """완료되면(워커가 이미 저장함) 결과 dict에 반영 후 페이지를 새로고침합니다.
+    실패하면 작업을 세션에서 지우고 새로고침해 주기 확인을 멈추고, 오류는 다시 실행할 때까지 보여줍니다."""
+    job_key = ai_job_session_key(survey_instance_id, student_id, analysis_type)
+    error_key = ai_error_session_key(survey_instance_id, student_id, analysis_type)
+    job_id = st.session_state.get(job_key)
+    if not job_id:
+        if st.session_state.get(error_key):
+            st.error(st.session_state[error_key])
+        return
+    job = ai_jobs.get_job(job_id)
+    if not job:
+        st.session_state.pop(job_key, None)
+        st.rerun() # 주기 확인 중단
+
+    if job['status'] == ai_jobs.STATUS_DONE:
+        st.session_state.pop(job_key, None)
+        remember_ai_result(get_ai_results(survey_instance_id), {
+            'student_id': student_id,
+            'analysis_type': analysis_type,
+            'result_text': job['result_text'],
+            'generated_at': job['finished_at'],
+        })
+        st.rerun() # 결과 표시를 위해 전체 페이지 새로고침
+    elif job['status'] == ai_jobs.STATUS_FAILED:
+        st.session_state.pop(job_key, None)
+        st.session_state[error_key] = job.get('error') or "AI 분석 중 알 수 없는 오류"
+        st.rerun() # 주기 확인 중단 (오류는 새로고침 후 위에서 표시)
+    else:
+        st.info(f"⏳ AI 분석 {ai_jobs.STATUS_LABELS.get(job['status'], job['status'])}... (다른 페이지로 이동해도 작업은 계속 진행됩니다)")
+
+SUBMISSION_POLL_SECONDS = 10 # 제출 현황 갱신 주기
+
+def get_class_roster(class_id):
+    """학급 명단 {student_id: 이름} (세션당 한 번만 조회)"""
+    roster_key = f"class_roster_{class_id}"
+    if roster_key not in st.session_state:
+        students = resilience.read_query(lambda db: db.table('students').select("student_id, student_name")
+                                         .eq('class_id', class_id).order('student_name'),
+                                         cache_key=('class_roster', class_id)).data or []
+        st.session_state[roster_key] = {s['student_id']: s['student_name'] for s in students}
+    return st.session_state[roster_key]
+
+@st.fragment(run_every=SUBMISSION_POLL_SECONDS)
+def submission_tracker(survey_instance_id, class_id):
+    """제출 현황: (student_id, submission_time)만 주기적으로 조회해 제출/미제출 학생을 보여줍니다.
+    fragment 안에서만 다시 실행되므로 페이지의 나머지 분석은 다시 그리지 않습니다."""
+    live = st.toggle("실시간 갱신", value=True, key=f"submission_live_{survey_instance_id}",
+                     help=f"{SUBMISSION_POLL_SECONDS}초마다 제출 여부만 확인합니다.")
+    status_key = f"submission_status_{survey_instance_id}"
+    try:
+        class_roster = get_class_roster(class_id)
+        if live or status_key not in st.session_state:
+            previous = st.session_state.get(status_key)
+            current = survey_stats.fetch_submission_status(survey_instance_id)
+            st.session_state[status_key] = current
+            if previous is not None and current != previous:
+                survey_stats.invalidate_response_stats(survey_instance_id)
+                st.session_state[f"new_submissions_{survey_instance_id}"] = True
+    except Exception as e:
+        st.error(f"제출 현황 조회 중 오류 발생: {e}")
+        return
+
+    submitted = st.session_state[status_key]
+    missing_names = [name for student_id, name in class_roster.items() if student_id not in submitted]
+    submitted_rows = sorted(
+        ((class_roster.get(student_id, "(명단에 없음)"), str(submitted_at or "")[:16].replace("T", " "))
+         for student_id, submitted_at in submitted.items()),
+        key=lambda row: row[1], reverse=True
+    )
+
+    col_submitted, col_missing = st.columns(2)
+    col_submitted.metric("제출", f"{len(submitted)}명")
+    col_missing.metric("미제출", f"{len(missing_names)}명")
+    if missing_names:
+        st.write("**미제출 학생:** " + ", ".join(missing_names))
+    else:
+        st.success("모든 학생이 제출했습니다.")
+    if submitted_rows:
+        st.dataframe(pd.DataFrame(submitted_rows, columns=["학생", "제출 시각"]), hide_index=True, use_container_width=True)
+    st.caption(f"마지막 확인: {datetime.datetime.now().strftime('%H:%M:%S')}")
+
+    if st.session_state.get(f"new_submissions_{survey_instance_id}"):
+        if st.button("🔄 새 응답을 분석에 반영", key=f"refresh_analysis_{survey_instance_id}"):
+            st.session_state.pop(f"new_submissions_{survey_instance_id}", None)
+            st.session_state[f"reload_analysis_{survey_instance_id}"] = True
+            st.rerun() # 전체 페이지 새로고침
+
+
+# --- 점수 차트 (받은 점수 / 준 점수 / 전체 분포) ---
+def interval_text(row):
+    if pd.isna(row.get('ci_low')):
+        return ""
+    return f", {rm.BOOTSTRAP_LEVEL:.0%} 구간 {row['ci_low']:.1f}~{row['ci_high']:.1f}"
+
+def render_score_charts(avg_received_df, avg_given_df, all_scores_given, intervals_df=None):
+    """관계 분석 탭의 점수 차트 3종을 그립니다. 실시간 반영 중에는 이 부분만 다시 그립니다.
+    intervals_df(received_intervals 결과)를 주면 받은 점수 막대에 신뢰구간을 오차 막대로 표시합니다."""
+    if not avg_received_df.empty:
+        st.subheader("학생별 평균 받은 친밀도 점수")
+        # 실시간/보정 점수는 정렬되지 않은 채로 들어오므로 정렬 후 사용
+        avg_received_df = avg_received_df.sort_values('average_score', ascending=False)
+        if intervals_df is not None and not intervals_df.empty:
+            avg_received_df = avg_received_df.merge(intervals_df, on='student_id', how='left')
+            avg_received_df['error_plus'] = avg_received_df['ci_high'] - avg_received_df['average_score']
+            avg_received_df['error_minus'] = avg_received_df['average_score'] - avg_received_df['ci_low']
+        has_intervals = 'ci_low' in avg_received_df.columns
+        fig_received = px.bar(avg_received_df, x='student_name', y='average_score',
+                              title="평균 받은 친밀도 점수 (높을수록 긍정적 관계)",
+                              labels={'student_name':'학생 이름', 'average_score':'평균 점수',
+                                      'ci_low':'구간 하한', 'ci_high':'구간 상한'},
+                              hover_data=['received_count'] + (['ci_low', 'ci_high'] if has_intervals else []), # 마우스 올리면 받은 횟수 표시
+                              error_y='error_plus' if has_intervals else None,
+                              error_y_minus='error_minus' if has_intervals else None,
+                              color='average_score', # 점수에 따라 색상 변화
+                              color_continuous_scale=px.colors.sequential.Viridis)
+        st.plotly_chart(fig_received, use_container_width=True)
+
+
+        # 간단 분석
+        highest = avg_received_df.iloc[0]
+        lowest = avg_received_df.iloc[-1]
+        st.write(f"🌟 가장 높은 평균 점수를 받은 학생: **{highest['student_name']}** ({highest['average_score']:.1f}점{interval_text(highest)}, {highest['received_count']}회)")
+        st.write(f"😟 가장 낮은 평균 점수를 받은 학생: **{lowest['student_name']}** ({lowest['average_score']:.1f}점{interval_text(lowest)}, {lowest['received_count']}회)")
+        if has_intervals:
+            st.caption(f"오차 막대는 받은 점수를 {rm.BOOTSTRAP_RESAMPLES}번 재표집해 구한 {rm.BOOTSTRAP_LEVEL:.0%} 신뢰구간입니다. "
+                       "구간이 겹치는 학생끼리의 차이는 우연일 수 있고, 받은 횟수가 적을수록 구간이 넓습니다.")
+            if len(avg_received_df) > 1:
+                runner_up, second_lowest = avg_received_df.iloc[1], avg_received_df.iloc[-2]
+                if highest['ci_low'] <= runner_up['ci_high'] or lowest['ci_high'] >= second_lowest['ci_low']:
+                    st.caption("ℹ️ 가장 높은/낮은 학생과 그다음 학생의 구간이 겹쳐, 순위 차이가 뚜렷하지 않습니다.")
+    else:
+        st.write("점수 비교 분석을 위한 데이터가 충분하지 않습니다.")
+
+    st.divider() # 구분선 추가
+
+    if not avg_given_df.empty:
+        st.subheader("학생별 평균 준 친밀도 점수")
+        # 평균 준 점수 기준 정렬
+        avg_given_df = avg_given_df.sort_values(by='average_score_given', ascending=False)
+        # --- !!! avg_given_df 변수 사용하여 시각화 !!! ---
+        fig_given = px.bar(avg_given_df.sort_values('average_score_given', ascending=False), x='submitter_name', y='average_score_given',
+                           title="평균 '준' 친밀도 점수 (높을수록 다른 친구를 긍정적으로 평가)",
+                           labels={'submitter_name':'학생 이름', 'average_score_given':'평균 준 점수'},
+                           hover_data=['rated_count'], # 마우스 올리면 평가한 친구 수 표시
+                           color='average_score_given', # 점수에 따라 색상 변화
+                           color_continuous_scale=px.colors.sequential.Plasma_r)
+        st.plotly_chart(fig_given)
+        highest_giver = avg_given_df.iloc[0]
+        lowest_giver = avg_given_df.iloc[-1]
+        st.write(f"👍 다른 친구들에게 가장 높은 평균 점수를 준 학생: **{highest_giver['submitter_name']}** ({highest_giver['average_score_given']:.1f}점, {highest_giver['rated_count']}명 평가)")
+        st.write(f"🤔 다른 친구들에게 가장 낮은 평균 점수를 준 학생: **{lowest_giver['submitter_name']}** ({lowest_giver['average_score_given']:.1f}점, {lowest_giver['rated_count']}명 평가)")
+
+    else:
+        st.write("점수 비교 분석을 위한 데이터가 충분하지 않습니다.")
+
+    # --- (선택 사항) 개인별 준 점수 분포 시각화 ---
+    st.markdown("---")
+
+    # --- 3. 학급 전체 친밀도 점수 분포 (새로 추가) ---
+    overall_scores_series = pd.Series(all_scores_given, dtype=float)
+    st.subheader("학급 전체 친밀도 점수 분포")
+    # --- ▼▼▼ [수정 2] 미리 계산된 all_scores_given 사용 ▼▼▼ ---
+    if all_scores_given: # 추출된 점수가 있을 경우 (리스트 사용)
+        # 점수 목록으로 DataFrame 생성 (히스토그램용)
+        scores_dist_df = pd.DataFrame({'점수': all_scores_given})
+
+        # 히스토그램 생성 (이하 로직 동일)
+        fig_overall_dist = px.histogram(
+            scores_dist_df,
+            x='점수',
+            title="학급 전체에서 학생들이 매긴 '친밀도 점수' 분포",
+            labels={'점수': '친밀도 점수 (0: 매우 어려움 ~ 100: 매우 친함)'},
+            nbins=20, # 막대의 개수 (20개 구간으로 나눔, 조절 가능)
+            range_x=[0, 100] # X축 범위 0-100으로 고정
+        )
+        # 그래프 레이아웃 추가 설정
+        fig_overall_dist.update_layout(
+            bargap=0.1, # 막대 사이 간격
+            yaxis_title="응답 빈도수" # Y축 제목
+        )
+        st.plotly_chart(fig_overall_dist, use_container_width=True)
+
+        # 통계 정보 표시 (이제 overall_scores_series 사용 가능)
+        try:
+            if not overall_scores_series.empty: # Series가 비어있지 않은지 확인
+                avg_overall = overall_scores_series.mean()
+                median_overall = overall_scores_series.median()
+                stdev_overall = overall_scores_series.std()
+                st.write(f"**전체 평균 점수:** {avg_overall:.1f}")
+                st.write(f"**중앙값:** {median_overall:.0f}")
+                st.write(f"**표준편차:** {stdev_overall:.1f}")
+            else:
+                st.write("전체 점수 데이터가 없어 통계를 계산할 수 없습니다.")
+            # ... (캡션 등) ...
+        except Exception as stat_e:
+            st.warning(f"통계 계산 중 오류: {stat_e}")
+    else:
+         st.write("분석할 전체 점수 데이터가 없습니다.")
+
+LIVE_REFRESH_SECONDS = 3 # 실시간 변경 반영 주기
+LIVE_IDLE_POLLS = 10 # 이 횟수만큼 반영 주기 동안 fragment가 확인하지 않으면 (탭 닫힘/세션 종료) 구독 종료
+
+def stop_live_feed():
+    """구독을 종료하고 그 설문의 실시간 행렬도 버립니다 (다시 켜면 최신 데이터로 새로 만듦)."""
+    feed = st.session_state.pop('live_response_feed', None)
+    if feed:
+        feed.stop()
+        st.session_state.pop(f"live_matrix_{feed.survey_instance_id}", None)
+
+def ensure_live_feed(survey_instance_id):
+    """선택한 설문의 변경 구독을 시작합니다 (다른 설문을 구독 중이면 먼저 종료).
+    사용하지 않아 종료된 구독을 다시 시작하면, 그 사이 변경을 놓쳤을 수 있으므로 새로고침 안내를 띄웁니다."""
+    feed = st.session_state.get('live_response_feed')
+    if feed and feed.survey_instance_id == survey_instance_id and feed.is_alive:
+        return feed
+    if feed and feed.survey_instance_id == survey_instance_id:
+        st.session_state[f"new_submissions_{survey_instance_id}"] = True
+    stop_live_feed()
+    feed = live_updates.ResponseFeed(
+        live_updates.resolve_realtime_url(supabase.supabase_url),
+        supabase.supabase_key,
+        survey_instance_id,
+        idle_timeout=LIVE_IDLE_POLLS * LIVE_REFRESH_SECONDS,
+    ).start()
+    st.session_state['live_response_feed'] = feed
+    return feed
+
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def live_score_charts(survey_instance_id, class_id, score_mode=rm.SCORING_RAW):
+    """구독으로 받은 응답 변경을 관계 행렬에 증분 반영하고, 점수 차트만 다시 그립니다. (score_mode: 점수 기준)"""
+    feed = st.session_state.get('live_response_feed')
+    matrix = st.session_state.get(f"live_matrix_{survey_instance_id}")
+    if feed is None or matrix is None:
+        return
+    roster = get_class_roster(class_id)
+    changed = False
+    for record in feed.drain():
+        if record.get('student_id'):
+            changed |= matrix.apply_response(record['student_id'], record.get('relation_mapping_data'),
+                                             name=roster.get(record['student_id']))
+    if changed:
+        survey_stats.invalidate_response_stats(survey_instance_id)
+        st.session_state[f"new_submissions_{survey_instance_id}"] = True # 상호성/AI 분석 등은 새로고침 시 반영
+
+    status_label = live_updates.STATE_LABELS.get(feed.state, feed.state)
+    if feed.state == live_updates.STATE_ERROR:
+        st.warning(f"실시간 연결 오류: {feed.error} (아래 차트는 마지막으로 받은 데이터 기준입니다)")
+    else:
+        st.caption(f"⚡ {status_label} · 제출 {int(matrix.submitted.sum())}명 · 변경 {matrix.version}회 반영 · "
+                   f"{datetime.datetime.now().strftime('%H:%M:%S')}")
+    scored = matrix.normalized(score_mode)
+    render_score_charts(scored.received_scores(), scored.given_scores(), scored.all_scores().tolist(),
+                        get_received_intervals(scored, survey_instance_id, scored.fingerprint()))
+
 
 st.title(f"📊 {teacher_name}의 분석 대시보드")
 st.write("학급과 설문 회차를 선택하여 결과를 분석하고 시각화합니다.")
@@ -250,52 +716,67 @@ selected_survey_id = None
 selected_class_name = None
 selected_survey_name = None
 
+# 학급 목록과 설문 목록을 동시에 조회 (로그인 직후 미리 조회한 결과가 있으면 사용)
+try:
+    overview_result = bootstrap.take_overview(teacher_id)
+    overview, overview_error = overview_result.data, None
+    if overview_result.stale:
+        st.warning(resilience.stale_notice(overview_result))
+except Exception as e:
+    overview, overview_error = {'classes': [], 'surveys': []}, e
+classes = overview['classes']
+teacher_surveys = overview['surveys']
+
+# 처음 들어왔을 때는 가장 최근 설문의 학급/설문을 선택해 둠 (응답은 미리 조회되어 있음)
+if 'class_select_analysis' not in st.session_state:
+    recent_survey = bootstrap.latest_survey(teacher_surveys)
+    recent_class_name = next((c['class_name'] for c in classes if recent_survey and c['class_id'] == recent_survey['class_id']), None)
+    if recent_class_name:
+        st.session_state['class_select_analysis'] = recent_class_name
+        st.session_state['survey_select_analysis'] = recent_survey['survey_name']
+
 with col1:
     st.subheader("1. 분석 대상 학급 선택")
-    try:
-        class_response = supabase.table('classes') \
-            .select("class_id, class_name") \
-            .eq('teacher_id', teacher_id) \
-            .order('created_at', desc=False) \
-            .execute()
-
-        if class_response.data:
-            classes = class_response.data
-            class_options = {c['class_name']: c['class_id'] for c in classes}
-            class_options_with_prompt = {"-- 학급 선택 --": None}
-            class_options_with_prompt.update(class_options) # 맨 앞에 선택 안내 추가
-            selected_class_name = st.selectbox(
-                "분석할 학급:",
-                options=class_options_with_prompt.keys(),
-                key="class_select_analysis"
-            )
-            selected_class_id = class_options_with_prompt.get(selected_class_name)
-        else:
-            st.info("먼저 '학급 및 학생 관리' 메뉴에서 학급을 생성해주세요.")
-    except Exception as e:
-        st.error(f"학급 목록 로딩 오류: {e}")
+    if overview_error:
+        st.error(f"학급 목록 로딩 오류: {overview_error}")
+    elif classes:
+        class_options = {c['class_name']: c['class_id'] for c in classes}
+        class_options_with_prompt = {"-- 학급 선택 --": None}
+        class_options_with_prompt.update(class_options) # 맨 앞에 선택 안내 추가
+        selected_class_name = st.selectbox(
+            "분석할 학급:",
+            options=class_options_with_prompt.keys(),
+            key="class_select_analysis"
+        )
+        selected_class_id = class_options_with_prompt.get(selected_class_name)
+    else:
+        st.info("먼저 '학급 및 학생 관리' 메뉴에서 학급을 생성해주세요.")
 
 with col2:
     st.subheader("2. 분석 대상 설문 선택")
     if selected_class_id:
         try:
-            survey_response = supabase.table('surveys') \
-                .select("survey_instance_id, survey_name") \
-                .eq('class_id', selected_class_id) \
-                .order('created_at', desc=True) \
-                .execute()
-
-            if survey_response.data:
-                surveys = survey_response.data
+            surveys = [s for s in teacher_surveys if s['class_id'] == selected_class_id] # 이미 최신순
+
+            if surveys:
                 survey_options = {s['survey_name']: s['survey_instance_id'] for s in surveys}
                 survey_options_with_prompt = {"-- 설문 선택 --": None}
                 survey_options_with_prompt.update(survey_options)
+                if st.session_state.get('survey_select_analysis') not in survey_options_with_prompt:
+                    st.session_state.pop('survey_select_analysis', None) # 다른 학급의 설문이 선택되어 있던 경우
                 selected_survey_name = st.selectbox(
                     f"'{selected_class_name}' 학급의 설문:",
                     options=survey_options_with_prompt.keys(),
                     key="survey_select_analysis"
                 )
                 selected_survey_id = survey_options_with_prompt.get(selected_survey_name)
+                # 응답 현황 표시 (집계 캐시, 전체 응답은 불러오지 않음)
+                # 선택지 라벨에 넣으면 응답 수가 바뀔 때 선택이 초기화되므로 별도 캡션으로 표시
+                if selected_survey_id:
+                    stat = survey_stats.get_response_stats(survey_options.values()).get(str(selected_survey_id))
+                    if stat:
+                        last_submitted = str(stat['last_submitted_at'] or "-")[:16].replace("T", " ")
+                        st.caption(f"응답 {survey_stats.format_response_count(stat)}명 · 마지막 제출 {last_submitted}")
             else:
                 st.info("선택된 학급에 대한 설문이 없습니다. '설문 관리' 메뉴에서 생성해주세요.")
         except Exception as e:
@@ -309,19 +790,17 @@ if selected_class_id and selected_survey_id:
     st.subheader(f"'{selected_class_name}' - '{selected_survey_name}' 분석 결과")
 
     @st.cache_data(ttl=300) # 5분 캐싱
-    def load_analysis_data(_survey_instance_id):
+    def load_analysis_data(survey_instance_id, _prefetched_responses=None):
         try:
-            # 1. 응답 데이터 로드 (학생 정보 포함)
-            response = supabase.table('survey_responses') \
-                .select("*, students(student_id, student_name)") \
-                .eq('survey_instance_id', _survey_instance_id) \
-                .execute()
+            # 1. 응답 데이터 로드 (학생 정보 포함, 로그인 직후 미리 조회한 응답을 넘겨받으면 그대로 사용)
+            response_data = _prefetched_responses if _prefetched_responses is not None \
+                else bootstrap.fetch_survey_responses(survey_instance_id)
 
-            if not response.data:
+            if not response_data:
                 st.warning("선택된 설문에 대한 응답 데이터가 없습니다.")
                 return None, None
 
-            responses_df = pd.DataFrame(response.data)
+            responses_df = pd.DataFrame(response_data)
 
             # 2. 학생 이름 매핑 및 'relation_mapping_data' 파싱
             all_students_map = {} # 전체 학생 ID:이름 맵
@@ -355,6 +834,9 @@ if selected_class_id and selected_survey_id:
                  return None, None
 
             analysis_df = pd.DataFrame(parsed_responses)
+            # 3. 응답 품질 점검 (모두 기본값/같은 점수/극단값만 준 응답 표시)
+            quality_df = rm.screen_responses(analysis_df['parsed_relations'].tolist())
+            analysis_df = analysis_df.join(quality_df.add_prefix('quality_'))
             return analysis_df, all_students_map
 
         except Exception as e:
@@ -362,15 +844,43 @@ if selected_class_id and selected_survey_id:
             return None, None
 
 
+    # 제출 현황 (응답 내용 없이 제출 여부만 주기적으로 확인)
+    with st.expander("📡 제출 현황"):
+        submission_tracker(selected_survey_id, selected_class_id)
+
     # 데이터 로드 실행
-    analysis_df, students_map = load_analysis_data(selected_survey_id)
+    if st.session_state.pop(f"reload_analysis_{selected_survey_id}", False):
+        load_analysis_data.clear()
+        st.session_state.pop(f"live_matrix_{selected_survey_id}", None)
+    # 미리 조회한 응답은 세션 상태에 있으므로 (세션 간 공유되는) 캐시 함수 밖에서 꺼내 넘김
+    analysis_df, students_map = load_analysis_data(selected_survey_id, bootstrap.take_prefetched_responses(selected_survey_id, teacher_id))
 
     if analysis_df is not None and students_map:
+        # --- 응답 품질 점검 결과: 성의 없는 응답의 점수를 분석에서 제외할 수 있음 ---
+        flagged = analysis_df['quality_flag'] != rm.QUALITY_OK
+        if flagged.any():
+            exclude_flagged = st.toggle(f"🧹 성의 없는 응답 {int(flagged.sum())}건의 점수를 분석에서 제외",
+                                        key=f"exclude_flagged_{selected_survey_id}",
+                                        on_change=st.session_state.pop, args=(f"live_matrix_{selected_survey_id}", None),
+                                        help="모든 친구에게 기본값(50점)이나 같은 점수, 0/100점만 준 응답입니다. "
+                                             "제외해도 그 학생이 받은 점수와 서술형 응답은 그대로 사용합니다.")
+            with st.expander("🔎 응답 품질 점검 결과"):
+                st.dataframe(analysis_df.loc[flagged, ['submitter_name', 'quality_flag', 'quality_rated_count', 'quality_mean', 'quality_std']]
+                             .assign(quality_flag=lambda df: df['quality_flag'].map(rm.QUALITY_LABELS))
+                             .rename(columns={'submitter_name': "학생", 'quality_flag': "사유", 'quality_rated_count': "평가한 친구 수",
+                                              'quality_mean': "평균 점수", 'quality_std': "표준편차"}).round(1),
+                             use_container_width=True, hide_index=True)
+            if exclude_flagged:
+                analysis_df = analysis_df.assign(parsed_relations=[{} if is_flagged else relations for relations, is_flagged
+                                                                   in zip(analysis_df['parsed_relations'], flagged)])
+        relation_matrix = RelationMatrix.from_responses(analysis_df, students_map, roster=get_class_roster(selected_class_id))
+        analysis_fingerprint = relation_matrix.fingerprint()
+
         # --- !!! 기본 분석 함수 호출 및 결과 저장 (데이터 로드 직후) !!! ---
         try:
             # 각 함수 호출하여 결과 DataFrame/Series 저장
-            avg_received_df = calculate_received_scores(analysis_df, students_map)
-            avg_given_df = calculate_given_scores(analysis_df, students_map)
+            avg_received_df = calculate_received_scores(analysis_df, students_map, fingerprint=analysis_fingerprint)
+            avg_given_df = calculate_given_scores(analysis_df, students_map, fingerprint=analysis_fingerprint)
             reciprocity_df = analyze_reciprocity(analysis_df, students_map) # analyze_reciprocity 함수가 정의되어 있다면
             # all_scores_list = get_all_scores(analysis_df) # 전체 점수 목록 함수가 정의되어 있다면
             # overall_scores_series = pd.Series(all_scores_list) if all_scores_list else pd.Series(dtype=float)
@@ -400,95 +910,39 @@ if selected_class_id and selected_survey_id:
              overall_scores_series = pd.Series(dtype=float)
         # --- !!! 계산 완료 !!! ---
         # --- 탭 구성 (기본 분석 + AI 분석 탭) ---
-        tab_list = ["📊 관계 분석", "💬 서술형 응답", "✨ AI 심층 분석"]
-        tab1, tab2, tab3 = st.tabs(tab_list)
+        tab_list = ["📊 관계 분석", "💬 서술형 응답", "✨ AI 심층 분석", "📈 회차 비교"]
+        tab1, tab2, tab3, tab4 = st.tabs(tab_list)
 
         with tab1:
             st.header("관계 분석 (친밀도 점수 기반)")
 
-            if not avg_received_df.empty:
-                st.subheader("학생별 평균 받은 친밀도 점수")
-                fig_received = px.bar(avg_received_df.sort_values('average_score', ascending=False), x='student_name', y='average_score',
-                                      title="평균 받은 친밀도 점수 (높을수록 긍정적 관계)",
-                                      labels={'student_name':'학생 이름', 'average_score':'평균 점수'},
-                                      hover_data=['received_count'], # 마우스 올리면 받은 횟수 표시
-                                      color='average_score', # 점수에 따라 색상 변화
-                                      color_continuous_scale=px.colors.sequential.Viridis)
-                st.plotly_chart(fig_received, use_container_width=True)
-
-
-                # 간단 분석
-                highest = avg_received_df.iloc[0]
-                lowest = avg_received_df.iloc[-1]
-                st.write(f"🌟 가장 높은 평균 점수를 받은 학생: **{highest['student_name']}** ({highest['average_score']:.1f}점, {highest['received_count']}회)")
-                st.write(f"😟 가장 낮은 평균 점수를 받은 학생: **{lowest['student_name']}** ({lowest['average_score']:.1f}점, {lowest['received_count']}회)")
+            score_mode = st.radio("점수 기준", options=list(rm.SCORING_LABELS), format_func=rm.SCORING_LABELS.get,
+                                  horizontal=True, key=f"score_mode_{selected_survey_id}",
+                                  help="모두에게 높은 점수(또는 기본값 50점)를 주는 등 학생마다 다른 점수 습관을 보정합니다. "
+                                       "'평가자별 표준화'는 학생마다 준 점수를 표준화하고, '평가자 성향 보정'은 각 학생의 후한/박한 정도를 추정해 뺍니다.")
+            scored_matrix = relation_matrix.normalized(score_mode)
+            if score_mode == rm.SCORING_RAW:
+                tab_received_df, tab_given_df, tab_scores, tab_reciprocity_df = avg_received_df, avg_given_df, all_scores_given, reciprocity_df
             else:
-                st.write("점수 비교 분석을 위한 데이터가 충분하지 않습니다.")
-
-            st.divider() # 구분선 추가
-
-            if not avg_given_df.empty:
-                st.subheader("학생별 평균 준 친밀도 점수")
-                # 평균 준 점수 기준 정렬
-                avg_given_df = avg_given_df.sort_values(by='average_score_given', ascending=False)
-                # --- !!! avg_given_df 변수 사용하여 시각화 !!! ---
-                fig_given = px.bar(avg_given_df.sort_values('average_score_given', ascending=False), x='submitter_name', y='average_score_given',
-                                   title="평균 '준' 친밀도 점수 (높을수록 다른 친구를 긍정적으로 평가)",
-                                   labels={'submitter_name':'학생 이름', 'average_score_given':'평균 준 점수'},
-                                   hover_data=['rated_count'], # 마우스 올리면 평가한 친구 수 표시
-                                   color='average_score_given', # 점수에 따라 색상 변화
-                                   color_continuous_scale=px.colors.sequential.Plasma_r)
-                st.plotly_chart(fig_given)
-                highest_giver = avg_given_df.iloc[0]
-                lowest_giver = avg_given_df.iloc[-1]
-                st.write(f"👍 다른 친구들에게 가장 높은 평균 점수를 준 학생: **{highest_giver['submitter_name']}** ({highest_giver['average_score_given']:.1f}점, {highest_giver['rated_count']}명 평가)")
-                st.write(f"🤔 다른 친구들에게 가장 낮은 평균 점수를 준 학생: **{lowest_giver['submitter_name']}** ({lowest_giver['average_score_given']:.1f}점, {lowest_giver['rated_count']}명 평가)")
-
-            else:
-                st.write("점수 비교 분석을 위한 데이터가 충분하지 않습니다.")
-
-            # --- (선택 사항) 개인별 준 점수 분포 시각화 ---
-            st.markdown("---")
-
-            # --- 3. 학급 전체 친밀도 점수 분포 (새로 추가) ---
-            st.subheader("학급 전체 친밀도 점수 분포")
-            # --- ▼▼▼ [수정 2] 미리 계산된 all_scores_given 사용 ▼▼▼ ---
-            if all_scores_given: # 추출된 점수가 있을 경우 (리스트 사용)
-                # 점수 목록으로 DataFrame 생성 (히스토그램용)
-                scores_dist_df = pd.DataFrame({'점수': all_scores_given})
-
-                # 히스토그램 생성 (이하 로직 동일)
-                fig_overall_dist = px.histogram(
-                    scores_dist_df,
-                    x='점수',
-                    title="학급 전체에서 학생들이 매긴 '친밀도 점수' 분포",
-                    labels={'점수': '친밀도 점수 (0: 매우 어려움 ~ 100: 매우 친함)'},
-                    nbins=20, # 막대의 개수 (20개 구간으로 나눔, 조절 가능)
-                    range_x=[0, 100] # X축 범위 0-100으로 고정
-                )
-                # 그래프 레이아웃 추가 설정
-                fig_overall_dist.update_layout(
-                    bargap=0.1, # 막대 사이 간격
-                    yaxis_title="응답 빈도수" # Y축 제목
-                )
-                st.plotly_chart(fig_overall_dist, use_container_width=True)
-
-                # 통계 정보 표시 (이제 overall_scores_series 사용 가능)
-                try:
-                    if not overall_scores_series.empty: # Series가 비어있지 않은지 확인
-                        avg_overall = overall_scores_series.mean()
-                        median_overall = overall_scores_series.median()
-                        stdev_overall = overall_scores_series.std()
-                        st.write(f"**전체 평균 점수:** {avg_overall:.1f}")
-                        st.write(f"**중앙값:** {median_overall:.0f}")
-                        st.write(f"**표준편차:** {stdev_overall:.1f}")
-                    else:
-                        st.write("전체 점수 데이터가 없어 통계를 계산할 수 없습니다.")
-                    # ... (캡션 등) ...
-                except Exception as stat_e:
-                    st.warning(f"통계 계산 중 오류: {stat_e}")
+                tab_received_df, tab_given_df = scored_matrix.received_scores(), scored_matrix.given_scores()
+                tab_scores, tab_reciprocity_df = scored_matrix.all_scores().tolist(), analyze_reciprocity_matrix(scored_matrix)
+                st.caption(f"📐 {rm.SCORING_LABELS[score_mode]} 점수로 표시합니다. (0~100 범위, 아래 모든 차트/순위에 적용)")
+
+            live = st.toggle("⚡ 실시간 반영", key=f"live_charts_{selected_survey_id}",
+                             help="학생이 응답을 제출/수정하면 점수 차트에 바로 반영합니다.")
+            if live:
+                ensure_live_feed(selected_survey_id)
+                matrix_key = f"live_matrix_{selected_survey_id}"
+                if matrix_key not in st.session_state:
+                    st.session_state[matrix_key] = RelationMatrix.from_responses(
+                        analysis_df, students_map, roster=get_class_roster(selected_class_id))
+                live_score_charts(selected_survey_id, selected_class_id, score_mode)
             else:
-                 st.write("분석할 전체 점수 데이터가 없습니다.")
+                stop_live_feed()
+                render_score_charts(tab_received_df, tab_given_df, tab_scores,
+                                    get_received_intervals(scored_matrix, selected_survey_id, scored_matrix.fingerprint()))
+            if not tab_given_df.empty:
+                tab_given_df = tab_given_df.sort_values(by='average_score_given', ascending=False)
                  
 
             st.markdown("---")        
@@ -496,11 +950,11 @@ if selected_class_id and selected_survey_id:
 
 
 
-            if not reciprocity_df.empty:
+            if not tab_reciprocity_df.empty:
                 st.write("서로 점수를 매긴 학생 쌍 간의 관계 유형입니다.")
 
                 # 요약 통계: 관계 유형별 개수
-                type_counts = reciprocity_df['관계 유형'].value_counts()
+                type_counts = tab_reciprocity_df['관계 유형'].value_counts()
                 st.write("##### 관계 유형별 분포:")
                 st.dataframe(type_counts)
                 # 파이 차트 추가 (선택 사항)
@@ -511,7 +965,7 @@ if selected_class_id and selected_survey_id:
                 # 상세 테이블: 상호 평가 목록
                 st.write("##### 상세 관계 목록:")
                 # 컬럼 순서 및 이름 변경하여 표시 (선택 사항)
-                display_df = reciprocity_df[['학생 A', '학생 B', 'A->B 점수', 'B->A 점수', '관계 유형']]
+                display_df = tab_reciprocity_df[['학생 A', '학생 B', 'A->B 점수', 'B->A 점수', '관계 유형']]
                 st.dataframe(display_df, use_container_width=True, hide_index=True)
 
                 # (고급/선택) 네트워크 그래프 시각화
@@ -522,12 +976,63 @@ if selected_class_id and selected_survey_id:
             else:
                 st.write("상호 평가 데이터가 부족하여 관계 상호성 분석을 할 수 없습니다.")
                 st.caption("학생들이 서로에 대해 충분히 평가해야 이 분석이 가능합니다.")        
+            st.markdown("---")
+            st.subheader("사회성 측정 지표 (Sociometry)")
+            if scored_matrix.submitted.sum() >= 2:
+                metrics_df = get_sociometry_metrics(scored_matrix, selected_survey_id, scored_matrix.fingerprint())
+                st.write("##### 사회성 지위 유형별 분포:")
+                st.dataframe(sociometry.status_counts(metrics_df))
+                sociometry_df = metrics_df[list(SOCIOMETRY_LABELS)].copy()
+                sociometry_df['status'] = sociometry_df['status'].map(sociometry.STATUS_LABELS)
+                sociometry_df = sociometry_df.sort_values('pagerank', ascending=False).rename(columns=SOCIOMETRY_LABELS)
+                st.dataframe(sociometry_df.round(3), use_container_width=True, hide_index=True)
+                st.caption(f"긍정 선택은 {sociometry.POSITIVE_THRESHOLD}점 이상, 부정 선택은 {sociometry.NEGATIVE_THRESHOLD}점 이하입니다. "
+                           "사회성 지위는 받은 긍정/부정 선택 수를 표준화해 분류하며, 고립 지수는 응답한 친구 중 긍정 선택을 하지 않은 비율입니다 (1에 가까울수록 고립).")
+            else:
+                st.write("응답한 학생이 2명 이상이어야 사회성 측정 지표를 계산할 수 있습니다.")
+
+            st.markdown("---")
+            st.subheader("친구 그룹 (Community)")
+            membership_df, groups_df, group_modularity = get_friend_groups(scored_matrix, selected_survey_id, scored_matrix.fingerprint())
+            if not groups_df.empty:
+                st.write(f"긍정 선택({sociometry.POSITIVE_THRESHOLD}점 이상)으로 연결된 친구 그룹 {len(groups_df)}개를 찾았습니다. (모듈성 {group_modularity:.2f})")
+                st.dataframe(groups_df.rename(columns=GROUP_LABELS).round(3), use_container_width=True, hide_index=True)
+                ungrouped = membership_df[membership_df['group'] == sociometry.NO_GROUP]['student_name'].tolist()
+                if ungrouped:
+                    st.warning(f"소속 그룹이 없는 학생 ({len(ungrouped)}명): {', '.join(ungrouped)}")
+                else:
+                    st.success("모든 학생이 한 그룹 이상에 속해 있습니다.")
+                st.caption("그룹 내 선택 밀도는 그룹 안에서 가능한 선택 중 실제 긍정 선택의 비율이며, 모듈성이 0.3 이상이면 그룹 구분이 뚜렷한 편입니다.")
+            else:
+                st.write("긍정 선택 관계가 부족하여 친구 그룹을 찾을 수 없습니다.")
+
+            st.markdown("---")
+            st.subheader("관계망 (Sociogram)")
+            if scored_matrix.submitted.sum() >= 2:
+                positions = sociogram_positions(scored_matrix, selected_class_id, selected_survey_id,
+                                                [s['survey_instance_id'] for s in surveys])
+                fig_sociogram = sociogram.build_figure(scored_matrix, positions, membership_df, metrics_df)
+                st.plotly_chart(fig_sociogram, use_container_width=True)
+                st.caption("선은 긍정 선택(굵은 초록: 서로 선택, 회색: 한쪽 선택), 점 색은 친구 그룹, 점 크기는 받은 긍정 선택 수입니다. "
+                           "같은 학급의 이전 설문 배치에서 시작하므로 설문 사이에 학생 위치가 크게 바뀌지 않습니다.")
+            else:
+                st.write("응답한 학생이 2명 이상이어야 관계망을 그릴 수 있습니다.")
+
+            st.markdown("---")
+            st.subheader("친밀도 행렬 (Heatmap)")
+            if scored_matrix.submitted.sum() >= 2:
+                heatmap_order = get_heatmap_order(scored_matrix, selected_survey_id, scored_matrix.fingerprint(), membership_df)
+                st.plotly_chart(sociogram.build_heatmap(scored_matrix, heatmap_order, membership_df), use_container_width=True)
+                st.caption(f"행은 점수를 준 학생, 열은 받은 학생입니다. 친구 그룹별로 묶어 정렬하여 그룹이 블록으로 보입니다. "
+                           f"학생이 {sociogram.HEATMAP_MAX_SIDE}명을 넘으면 그룹(또는 구간) 평균 점수로 표시합니다.")
+            else:
+                st.write("응답한 학생이 2명 이상이어야 친밀도 행렬을 표시할 수 있습니다.")
             st.markdown("---")        
             st.subheader("개인별 '준' 점수 분포 확인")
             # 학생 이름 목록 생성 (submitter_name 사용)
-            # 학생 이름 목록 생성 (avg_given_df에서 가져옴 - 이전 단계에서 생성됨)
-            if not avg_given_df.empty:
-                student_names_for_given = ["-- 학생 선택 --"] + sorted(avg_given_df['submitter_name'].unique())
+            # 학생 이름 목록 생성 (tab_given_df에서 가져옴 - 이전 단계에서 생성됨)
+            if not tab_given_df.empty:
+                student_names_for_given = ["-- 학생 선택 --"] + sorted(tab_given_df['submitter_name'].unique())
                 student_to_view = st.selectbox(
                     "점수 내역을 확인할 학생 선택:", # 레이블 약간 변경
                     options=student_names_for_given,
@@ -540,16 +1045,15 @@ if selected_class_id and selected_survey_id:
                     student_data_row = analysis_df[analysis_df['submitter_name'] == student_to_view]
 
                     if not student_data_row.empty:
-                        relations_dict = student_data_row.iloc[0].get('parsed_relations', {})
+                        # 선택한 점수 기준이 적용된 행렬(scored_matrix)의 해당 학생 행 (행: 준 학생, 열: 받은 학생)
+                        rater_index = scored_matrix.index.get(student_data_row.iloc[0].get('submitter_id'))
                         individual_ratings = [] # 막대 그래프용 데이터 리스트
 
-                        if isinstance(relations_dict, dict) and relations_dict:
-                            for classmate_id, info in relations_dict.items():
-                                score = info.get('intimacy')
-                                if isinstance(score, (int, float)):
-                                    # students_map (ID->이름 맵)을 사용하여 이름 가져오기
-                                    classmate_name = students_map.get(classmate_id, f"ID:{classmate_id[:4]}...")
-                                    individual_ratings.append({"평가 대상 학생": classmate_name, "내가 준 점수": score})
+                        if rater_index is not None:
+                            given_row = scored_matrix.scores[rater_index]
+                            for target_index in np.flatnonzero(~np.isnan(given_row)):
+                                individual_ratings.append({"평가 대상 학생": scored_matrix.names[target_index],
+                                                           "내가 준 점수": float(given_row[target_index])})
 
                         if individual_ratings:
                             # --- !!! 데이터프레임 생성 및 막대 그래프 그리기 !!! ---
@@ -607,12 +1111,18 @@ if selected_class_id and selected_survey_id:
 
             if api_key:
                 st.success("✅ Gemini API 키가 활성화되어 AI 분석 기능을 사용할 수 있습니다.")
+
+                # --- 저장된 AI 분석 결과 일괄 로드 (설문당 1회 조회) ---
+                if st.button("💾 저장된 분석 결과 다시 불러오기", key="reload_ai_results"):
+                    st.session_state.pop(f"ai_results_{selected_survey_id}", None)
+                ai_results = get_ai_results(selected_survey_id)
+                start_ai_worker() # 백그라운드 AI 작업 워커 (프로세스당 1회)
                 st.markdown("---")
 
                 # --- AI 분석 기능 선택 ---
                 analysis_option = st.selectbox(
                     "어떤 내용을 분석하시겠어요?",
-                    ["선택하세요", "학생 고민 전체 요약", "학생별 관계 프로파일 생성", "학급 전체 관계 요약", "주요 키워드 추출 (준비중)"]
+                    ["선택하세요", "학생 고민 전체 요약", "학생별 관계 프로파일 생성", "학급 전체 관계 요약", "학급 보고서 일괄 다운로드 (PDF)", "주요 키워드 추출 (준비중)"]
                 )
 
                 if analysis_option == "학생 고민 전체 요약":
@@ -630,26 +1140,32 @@ if selected_class_id and selected_survey_id:
 
                         # 이제 all_concerns 변수가 정의되었으므로 아래 코드 사용 가능
                         if all_concerns:
-                            # 요약 버튼
+                            analysis_type = 'concern_summary'
+                            # 요약 버튼 (백그라운드 작업으로 등록)
                             if st.button("AI 요약 실행하기", key="summarize_concerns"):
-                                with st.spinner("AI가 고민 내용을 요약 중입니다..."):
-                                    # 프롬프트 구성
-                                    prompt = f"""
-                                    다음은 학생들이 익명으로 작성한 학교생활 고민 내용들입니다.
-                                    각 고민 내용은 "-----"로 구분되어 있습니다.
-                                    전체 내용을 바탕으로 주요 고민 주제 3~5가지와 각 주제별 핵심 내용을 요약해주세요.
-                                    결과는 한국어 불렛포인트 형태로 명확하게 제시해주세요.
-
-                                    고민 목록:
-                                    { "-----".join(all_concerns) }
-
-                                    요약:
-                                    """
-                                    # AI 호출
-                                    summary = call_gemini(prompt, api_key)
-                                    # 결과 표시
-                                    st.markdown("#### AI 요약 결과:")
-                                    st.info(summary) # 또는 st.text_area
+                                # 프롬프트 구성
+                                prompt = f"""
+                                다음은 학생들이 익명으로 작성한 학교생활 고민 내용들입니다.
+                                각 고민 내용은 "-----"로 구분되어 있습니다.
+                                전체 내용을 바탕으로 주요 고민 주제 3~5가지와 각 주제별 핵심 내용을 요약해주세요.
+                                결과는 한국어 불렛포인트 형태로 명확하게 제시해주세요.
+
+                                고민 목록:
+                                { "-----".join(all_concerns) }
+
+                                요약:
+                                """
+                                submit_ai_job(selected_survey_id, None, analysis_type, prompt, api_key)
+                            poll_ai_job(selected_survey_id, None, analysis_type)
+
+                            # 결과 표시 (저장된 결과)
+                            cached_row = ai_results.get((None, analysis_type))
+                            if cached_row:
+                                generated_time = pd.to_datetime(cached_row.get("generated_at")).strftime('%Y-%m-%d %H:%M')
+                                st.markdown("#### AI 요약 결과:")
+                                st.caption(f"💾 분석 시각: {generated_time}")
+                                st.info(cached_row.get("result_text")) # 또는 st.text_area
+                                render_ai_result_editor(selected_survey_id, analysis_type, ai_results)
                         else:
                             st.info("요약할 만한 유효한 고민 내용이 없습니다.")
                     else:
@@ -668,54 +1184,24 @@ if selected_class_id and selected_survey_id:
                                 # 세션 상태 키 정의
                                 session_key_result = f"ai_result_{selected_student_id}_{analysis_type}"
                                 session_key_comment = f"ai_comment_{selected_student_id}_{analysis_type}"
-                                # --- 1. 캐시된 결과 조회 ---
+                                # --- 1. 캐시된 결과 조회 (탭 진입 시 일괄 로드한 dict에서 조회) ---
                                 cached_result = None
                                 generated_time = None
-                                cache_response = None
                                 cached_comment = "" # 기본 빈 문자열
-                                try:
-                                    # Supabase 객체 유효성 확인
-                                    if not supabase:
-                                        raise ConnectionError("Supabase 클라이언트가 유효하지 않습니다.")
-
-                                    # st.write(f"DEBUG: Checking cache for survey {selected_survey_id}, student {selected_student_id}") # 디버깅
-                                    cache_query = supabase.table("ai_analysis_results") \
-                                        .select("result_text, generated_at") \
-                                        .eq("survey_instance_id", selected_survey_id) \
-                                        .eq("student_id", selected_student_id) \
-                                        .eq("analysis_type", analysis_type) \
-                                        .maybe_single() \
-                                        # .execute()
-                                    try:
-                                        cache_response = cache_query.execute()
-                                        # st.write(f"DEBUG: Cache query response type: {type(cache_response)}") # 타입 확인
-                                        if cache_response is not None:
-                                            if hasattr(cache_response, 'data') and cache_response.data:
-                                                cached_result = cache_response.data.get("result_text")
-                                                cached_comment = cache_response.data.get("teacher_comment", "") # 코멘트 로드, 없으면 빈 문자열
-                                                generated_time = pd.to_datetime(cache_response.data.get("generated_at")).strftime('%Y-%m-%d %H:%M') # 시간 포맷 변경
-                                                st.caption(f"💾 이전에 분석된 결과입니다. (분석 시각: {generated_time})")
-                                                st.session_state[session_key_result] = cached_result
-                                                st.session_state[session_key_comment] = cached_comment
-                                        # else:
-                                        #     # execute() 자체가 None 반환 또는 실패 시
-                                        #     st.warning("캐시된 결과를 조회하는 중 문제가 발생했습니다 (응답 객체 없음). AI 분석을 새로 실행합니다.")
-                                        #     print("Supabase cache query execute() returned None or failed.")
-                                    except Exception as exec_e_cache:
-                                        st.warning(f"캐시 조회 쿼리 실행 오류: {exec_e_cache}")
-                                        cache_response = None # 오류 시 None 처리
-                                    
-                                except ConnectionError as ce:
-                                    st.error(f"데이터베이스 연결 오류: {ce}")
-                                    # 필요시 st.stop()
-                                except Exception as e:
-                                    st.warning(f"캐시된 분석 결과 조회 중 오류: {e}")
-                                    
+                                cached_row = ai_results.get((selected_student_id, analysis_type))
+                                if cached_row:
+                                    cached_result = cached_row.get("result_text")
+                                    cached_comment = cached_row.get("teacher_comment") or "" # 코멘트 로드, 없으면 빈 문자열
+                                    generated_time = pd.to_datetime(cached_row.get("generated_at")).strftime('%Y-%m-%d %H:%M') # 시간 포맷 변경
+                                    st.caption(f"💾 이전에 분석된 결과입니다. (분석 시각: {generated_time})")
+                                    st.session_state[session_key_result] = cached_result
+                                    st.session_state[session_key_comment] = cached_comment
+
                                 # --- 2. 분석 실행 버튼 (캐시 없거나, 다시 분석 원할 때) ---
                                 regenerate = st.button("🔄 AI 분석 실행/재실행", key=f"run_ai_{selected_student_id}")
                                 if regenerate: # 버튼 클릭 할때
                                 # if st.button(f"'{selected_student_name}' 학생 프로파일 생성하기", key="generate_profile"):
-                                    with st.spinner(f"{selected_student_name} 학생의 관계 데이터를 분석 중입니다..."):
+                                    with st.spinner(f"{selected_student_name} 학생의 분석 작업을 등록 중입니다..."):
                                         previous_comment = st.session_state.get(session_key_comment, "") # 현재 세션의 코멘트 가져오기    
                                         # 1. 선택된 학생의 응답 데이터 찾기
                                         student_response_row = analysis_df[analysis_df['submitter_id'] == selected_student_id]
@@ -774,20 +1260,10 @@ if selected_class_id and selected_survey_id:
                                         위 정보를 종합하여 '{selected_student_name}' 학생의 학급 내 교우관계 특징, 사회성(예: 관계 주도성, 수용성), 긍정적/부정적 관계 양상, 그리고 교사가 관심을 가져야 할 부분(잠재적 강점 또는 어려움)에 대해 구체적으로 분석하고 해석해주세요. 분석 결과에는 학생 ID가 아닌 학생 이름만 포함하여 한국어로 작성해주세요.
                                         """
 
-                                        # --- AI 호출 및 결과 표시 ---
-                                        new_analysis_result = call_gemini(prompt, api_key) # utils 사용 가정
-                                        # --- 결과 처리 및 캐시 저장/업데이트 ---
-                                        if new_analysis_result and not new_analysis_result.startswith("오류:"):
-                                            st.session_state[session_key_result] = new_analysis_result
-                                            # 재분석 시 기존 코멘트는 유지하거나 지울 수 있음 (현재는 유지)
-                                            # st.session_state[session_key_comment] = "" # 재분석 시 코멘트 초기화 원하면
-                                            st.success("✅ AI 분석 완료! 아래 결과를 확인하고 저장하세요.")
-                                        else:
-                                            # AI 호출 실패 시 오류 메시지 표시
-                                            st.error(new_analysis_result or "AI 분석 중 알 수 없는 오류")
-                                            if session_key_result in st.session_state:
-                                                del st.session_state[session_key_result] # 실패 시 이전 결과도 지움
-                                
+                                        # --- AI 분석 작업 등록 (워커가 Gemini 호출 후 결과 저장, 교사 코멘트/수정은 아래에서) ---
+                                        submit_ai_job(selected_survey_id, selected_student_id, analysis_type, prompt, api_key)
+                                poll_ai_job(selected_survey_id, selected_student_id, analysis_type)
+
                                 current_result = st.session_state.get(session_key_result)
                                 if current_result:
                                     st.markdown(f"#### '{selected_student_name}' 학생 관계 프로파일 (AI 분석):")
@@ -810,65 +1286,29 @@ if selected_class_id and selected_survey_id:
                                             st.warning("저장할 AI 분석 결과가 없습니다. 먼저 분석을 실행해주세요.")
                                         else:
                                             # DB에 결과 저장 (Upsert 사용: 없으면 Insert, 있으면 Update)
-                                            try:
-                                                # upsert 할 데이터 준비
-                                                data_to_save = {
-                                                    'survey_instance_id': selected_survey_id,
-                                                    'student_id': selected_student_id,
-                                                    'analysis_type': analysis_type,
-                                                    'result_text': current_result,
-                                                    'teacher_comment': teacher_comment_input, # 입력된 코멘트 저장
-                                                    'generated_at': datetime.datetime.now().isoformat(), # 현재 시각
-                                                    # 'prompt_hash': prompt_hash # 선택 사항
-                                                }
-                                                # unique 제약 조건이 있는 컬럼들 지정하여 충돌 시 업데이트
-                                                upsert_response = supabase.table("ai_analysis_results") \
-                                                    .upsert(data_to_save, on_conflict='survey_instance_id, student_id, analysis_type') \
-                                                    .execute()
-
-                                                # upsert 성공 여부 확인 (API v2에서는 data가 없을 수 있음)
-                                                if not hasattr(upsert_response, 'error') or upsert_response.error is None:
-                                                    st.success("✅ 분석 결과가 데이터베이스에 저장/업데이트되었습니다.")
-                                                    st.session_state[session_key_comment] = teacher_comment_input
-                                                    st.rerun() # 저장 상태 반영 위해 새로고침
-                                                else:
-                                                    st.warning(f"분석 결과를 DB에 저장하는 중 오류 발생: {upsert_response.error}")
-
-                                            except Exception as db_e:
-                                                st.warning(f"분석 결과를 DB에 저장하는 중 예외 발생: {db_e}")
-                                                
-                                        # if profile_result and not profile_result.startswith("오류:"):
-                                        #     st.markdown("---")
-                                        #     st.subheader("📄 분석 결과 저장/출력")
-
-                                        #     # PDF 다운로드 버튼
-                                        #     try:
-                                        #         # PDF 데이터 생성 시도
-                                        #         pdf_data = create_pdf(profile_result, f"{selected_survey_name} - AI 분석 결과")
-                                        #         if pdf_data: # create_pdf가 bytearray 또는 bytes를 성공적으로 반환 시
-                                        #             # --- !!! bytearray를 bytes로 변환 !!! ---
-                                        #             try:
-                                        #                 pdf_bytes_for_button = bytes(pdf_data) # 타입 변환 시도
-                                        #             except Exception as convert_e:
-                                        #                 st.error(f"PDF 데이터 형식 변환 오류: {convert_e}")
-                                        #                 pdf_bytes_for_button = None # 변환 실패 시 None
-                                        #             # -----------------------------------------
-                                        #             if pdf_bytes_for_button: # PDF 생성 성공 시에만 버튼 활성화
-                                        #                 current_time = datetime.datetime.now().strftime("%Y%m%d_%H%M")
-                                        #                 pdf_filename = f"AI_분석결과_{selected_class_name}_{selected_survey_name}_{current_time}.pdf"
-
-                                        #                 st.download_button(
-                                        #                     label="PDF로 저장하기",
-                                        #                     data=pdf_data,
-                                        #                     file_name=pdf_filename,
-                                        #                     mime="application/pdf"
-                                        #                 )
-                                        #         # else:
-                                        #         #     # create_pdf 함수 내부에서 오류 메시지가 이미 표시되었을 것임
-                                        #         #     st.warning("PDF 생성에 실패하여 다운로드 버튼을 비활성화합니다.")
-
-                                        #     except Exception as pdf_e:
-                                        #         st.error(f"PDF 다운로드 버튼 생성 중 오류: {pdf_e}")
+                                            data_to_save = {
+                                                'survey_instance_id': selected_survey_id,
+                                                'student_id': selected_student_id,
+                                                'analysis_type': analysis_type,
+                                                'result_text': current_result,
+                                                'teacher_comment': teacher_comment_input, # 입력된 코멘트 저장
+                                                'generated_at': datetime.datetime.now().isoformat(), # 현재 시각
+                                            }
+                                            if save_ai_result(ai_results, data_to_save):
+                                                st.success("✅ 분석 결과가 데이터베이스에 저장/업데이트되었습니다.")
+                                                st.session_state[session_key_comment] = teacher_comment_input
+                                                st.rerun() # 저장 상태 반영 위해 새로고침
+
+                                    # --- 5. PDF로 저장 ---
+                                    pdf_data = create_pdf(current_result, f"{selected_student_name} 학생 관계 프로파일 - {selected_survey_name}")
+                                    if pdf_data:
+                                        st.download_button(
+                                            label="📄 PDF로 저장하기",
+                                            data=pdf_data,
+                                            file_name=reports.safe_filename(f"AI_분석결과_{selected_class_name}_{selected_survey_name}_{selected_student_name}.pdf"),
+                                            mime="application/pdf",
+                                            key=f"pdf_ai_{selected_student_id}"
+                                        )
 
                         else:
                             st.warning("학생을 선택해주세요.")
@@ -878,34 +1318,23 @@ if selected_class_id and selected_survey_id:
                     st.subheader("학급 전체 관계 요약")
                     analysis_type = 'class_summary' # 캐시 키로 사용
 
-                    # --- 캐시된 결과 조회 (student_id 없이 조회) ---
+                    # --- 캐시된 결과 조회 (탭 진입 시 일괄 로드한 dict에서 student_id 없이 조회) ---
                     cached_result = None
                     generated_time = None
                     cached_comment = "" # 기본 빈 문자열
-                    try:
-                        cache_response = supabase.table("ai_analysis_results") \
-                            .select("result_text, generated_at") \
-                            .eq("survey_instance_id", selected_survey_id) \
-                            .is_("student_id", None) \
-                            .eq("analysis_type", analysis_type) \
-                            .maybe_single() \
-                            .execute()
-                        # ... (캐시 조회 및 표시 로직 - 이전 답변 참고) ...
-                        if cache_response and cache_response.data:
-                            cached_result = cache_response.data.get("result_text")
-                            generated_time = pd.to_datetime(cache_response.data.get("generated_at")).strftime('%Y-%m-%d %H:%M')
-                            st.caption(f"💾 이전에 분석된 결과입니다. (분석 시각: {generated_time})")
-                            st.info(cached_result)
-
-                    except Exception as e:
-                        st.warning(f"캐시된 분석 결과 조회 중 오류: {e}")
+                    cached_row = ai_results.get((None, analysis_type))
+                    if cached_row:
+                        cached_result = cached_row.get("result_text")
+                        generated_time = pd.to_datetime(cached_row.get("generated_at")).strftime('%Y-%m-%d %H:%M')
+                        st.caption(f"💾 이전에 분석된 결과입니다. (분석 시각: {generated_time})")
+                        st.info(cached_result)
 
                     # --- 분석 실행 버튼 ---
                     if st.button("🔄 학급 전체 AI 분석 실행/재실행", key="run_class_summary_ai"):
                         if not cached_result: st.write("AI 분석을 요청합니다...")
                         else: st.write("AI 분석을 다시 요청합니다...")
 
-                        with st.spinner("✨ 학급 전체 관계 데이터를 종합 분석 중입니다..."):
+                        with st.spinner("✨ 학급 전체 관계 데이터 분석 작업을 등록 중입니다..."):
                             # --- 프롬프트에 넣을 데이터 요약 ---
                             try:
                                 # --- ▼▼▼ [수정 확인] 이제 overall_scores_series가 정의되어 있음 ▼▼▼ ---
@@ -949,80 +1378,77 @@ if selected_class_id and selected_survey_id:
                                 위 데이터를 바탕으로 이 학급의 전반적인 교우관계 분위기, 주요 특징, 잠재적인 그룹 형성이나 소외 경향, 긍정적/부정적 상호작용 패턴 등 학급 전체 관계에 대한 종합적인 분석과 해석을 교사가 이해하기 쉽게 한국어로 작성해주세요. 주목해야 할 점이나 교사의 개입이 필요해 보이는 부분을 포함해도 좋습니다. 반드시 학생 이름을 언급할 때는 주어진 데이터에 있는 이름을 사용하세요.
                                 """
 
-                                # --- AI 호출 ---
-                                new_analysis_result = call_gemini(prompt, api_key)
-
-                                # --- 결과 처리 및 캐시 저장 (student_id = None) ---
-                                if new_analysis_result and not new_analysis_result.startswith("오류:"):
-                                    st.markdown("#### 학급 전체 관계 요약 (AI 분석 결과):")
-                                    # st.info(new_analysis_result)
-
-                                    # --- !!! 수동 저장 방식으로 변경 !!! ---
-                                    st.session_state[f"ai_result_{selected_survey_id}_class_summary"] = new_analysis_result
-                                    st.success("✅ AI 분석 완료! 아래 코멘트와 함께 저장할 수 있습니다.")
-
-                                else:
-                                    st.error(new_analysis_result or "AI 분석 중 알 수 없는 오류")
-                                    session_key_class_summary = f"ai_result_{selected_survey_id}_class_summary"
-                                    if session_key_class_summary in st.session_state:
-                                        del st.session_state[session_key_class_summary]
+                                # --- AI 분석 작업 등록 (워커가 결과를 student_id = None 으로 저장) ---
+                                submit_ai_job(selected_survey_id, None, analysis_type, prompt, api_key)
 
                             except Exception as e:
                                 st.error(f"AI 분석 준비/실행 중 오류 발생: {e}")
                                 traceback.print_exc()
 
 
-                        # # --- 결과 표시 및 수동 저장 UI (학생 프로파일과 유사하게) ---
-                        session_key_class_summary = f"ai_result_{selected_survey_id}_class_summary"
-                        # session_key_class_comment = f"ai_comment_{selected_survey_id}_class_summary"
-
-                        current_result = st.session_state.get(session_key_class_summary)
-                        # 캐시된 결과가 있고 세션 결과가 없다면 캐시된 것을 보여줌 (페이지 첫 로드시)
-                        if not current_result and cached_result:
-                            current_result = cached_result
-                            # 코멘트도 DB에서 불러온 값 사용
-                            # current_comment = cached_comment # DB 조회 로직에서 cached_comment 설정 필요
-                        # else:
-                        #     current_comment = st.session_state.get(session_key_class_comment, "")
-
-                        if current_result:
-                            if not cached_result: # 캐시가 없었는데 새로 생성된 경우
-                                st.markdown("#### 학급 전체 관계 요약 (AI 분석 결과):")
-                                st.info(current_result)
-
-                            st.markdown("---")
-                            # st.subheader("✍️ 교사 코멘트 추가 및 저장")
-                            # teacher_comment_input = st.text_area(
-                            #     "분석 결과에 대한 교사 의견 또는 추가 메모:",
-                            #     value=current_comment,
-                            #     height=150,
-                            #     key=f"comment_input_{selected_survey_id}_class_summary"
-                            # )
-
-                            if st.button("💾 분석 결과 저장하기", key=f"save_ai_{selected_survey_id}_class_summary"):
-                                # DB에 저장 (Upsert - student_id는 None)
+                    poll_ai_job(selected_survey_id, None, analysis_type)
+                    render_ai_result_editor(selected_survey_id, analysis_type, ai_results)
+
+                elif analysis_option == "학급 보고서 일괄 다운로드 (PDF)":
+                    st.subheader("학급 보고서 일괄 다운로드 (PDF)")
+                    st.caption("저장된 학생별 관계 프로파일과 학급 전체 요약/고민 요약을 각각 PDF로 만들어 하나의 ZIP 파일로 내려받습니다.")
+
+                    # 저장된 AI 결과로 문서 목록 구성 (교사 코멘트가 있으면 함께 포함)
+                    report_titles = {
+                        'class_summary': "학급 전체 관계 요약",
+                        'concern_summary': "학생 고민 전체 요약",
+                    }
+                    report_documents = []
+                    # 동명이인은 ZIP 안 파일명이 겹치지 않도록 student_id 앞부분을 붙임
+                    name_counts = pd.Series(list(students_map.values())).value_counts()
+                    for (result_student_id, result_type), row in sorted(ai_results.items(), key=lambda item: (item[0][1], students_map.get(item[0][0], ""))):
+                        result_text = row.get('result_text')
+                        if not result_text:
+                            continue
+                        if result_type == 'student_profile' and result_student_id in students_map:
+                            student_name = students_map[result_student_id]
+                            title = f"{student_name} 학생 관계 프로파일 - {selected_survey_name}"
+                            file_stem = student_name if name_counts.get(student_name, 0) <= 1 else f"{student_name}_{str(result_student_id)[:8]}"
+                            filename = f"학생별/{reports.safe_filename(file_stem)}.pdf"
+                        elif result_type in report_titles and result_student_id is None:
+                            title = f"{report_titles[result_type]} - {selected_class_name} {selected_survey_name}"
+                            filename = f"{reports.safe_filename(report_titles[result_type])}.pdf"
+                        else:
+                            continue
+                        if row.get('teacher_comment'):
+                            result_text = f"{result_text}\n\n[교사 코멘트]\n{row['teacher_comment']}"
+                        report_documents.append((filename, title, result_text))
+
+                    profile_count = sum(1 for filename, _, _ in report_documents if filename.startswith("학생별/"))
+                    st.write(f"학생별 프로파일 **{profile_count}**건 / 학급 요약 **{len(report_documents) - profile_count}**건")
+                    missing_profiles = len(students_map) - profile_count
+                    if missing_profiles > 0:
+                        st.caption(f"프로파일이 없는 학생 {missing_profiles}명은 보고서에서 제외됩니다. '학생별 관계 프로파일 생성'에서 먼저 분석해주세요.")
+
+                    if report_documents:
+                        if st.button("📦 보고서 생성하기", key="build_report_zip"):
+                            with st.spinner("PDF 보고서를 생성 중입니다..."):
                                 try:
-                                    data_to_save = {
-                                        'survey_instance_id': selected_survey_id,
-                                        'student_id': None, # 학급 전체 요약
-                                        'analysis_type': analysis_type,
-                                        'result_text': current_result,
-                                        # 'teacher_comment': teacher_comment_input,
-                                        'generated_at': datetime.datetime.now().isoformat()
-                                    }
-                                    upsert_response = supabase.table("ai_analysis_results") \
-                                        .upsert(data_to_save, on_conflict='survey_instance_id, student_id, analysis_type') \
-                                        .execute()
-                                    # if hasattr(upsert_response, 'error') and upsert_response.error:
-                                    #     st.error(f"DB 저장 실패 (Supabase 오류): {upsert_response.error}")
-                                    # # elif hasattr(upsert_response, 'status_code') and upsert_response.status_code in [200, 201, 204]: # 성공 상태 코드 확인 (라이브러리 버전에 따라 다를 수 있음)
-                                    # else : # 간단하게 error 속성이 없거나 비어있으면 성공으로 간주
-                                    st.success("✅ 분석 결과가 데이터베이스에 저장되었습니다.")
-                                    # st.session_state[session_key_class_comment] = teacher_comment_input # 세션 코멘트도 업데이트
-                                    st.rerun()
-
-                                except Exception as db_e:
-                                    st.error(f"DB 저장 중 예외 발생: {db_e}")
+                                    zip_bytes, failed_files = reports.build_reports_zip(report_documents)
+                                    st.session_state[f"report_zip_{selected_survey_id}"] = zip_bytes
+                                    if failed_files:
+                                        st.warning(f"{len(failed_files)}건의 PDF 생성에 실패했습니다: {', '.join(failed_files)}")
+                                except Exception as e:
+                                    st.error(f"보고서 생성 중 오류 발생: {e}")
+                                    traceback.print_exc()
+
+                        zip_bytes = st.session_state.get(f"report_zip_{selected_survey_id}")
+                        if zip_bytes:
+                            current_time = datetime.datetime.now().strftime("%Y%m%d_%H%M")
+                            st.download_button(
+                                label="⬇️ ZIP 다운로드",
+                                data=zip_bytes,
+                                file_name=reports.safe_filename(f"AI_분석보고서_{selected_class_name}_{selected_survey_name}_{current_time}.zip"),
+                                mime="application/zip",
+                                key="download_report_zip"
+                            )
+                    else:
+                        st.info("보고서로 만들 저장된 AI 분석 결과가 없습니다.")
 
                 elif analysis_option == "주요 키워드 추출 (준비중)":
                     st.info("키워드 추출 기능은 준비 중입니다.")
@@ -1045,6 +1471,10 @@ if selected_class_id and selected_survey_id:
 
 
 
+        with tab4:
+            st.header("📈 설문 회차 비교")
+            render_trend_view(selected_class_id, surveys, selected_survey_id)
+
     # ... (데이터 로드 실패 시 등 나머지 코드) ...
 
     else:
@@ -1,5 +1,9 @@
 # pages/4_⚙️_설정.py
 import streamlit as st
+import pandas as pd
+import datetime
+import telemetry
+import ai_jobs
 
 # --- 페이지 설정 ---
 st.set_page_config(page_title="설정", page_icon="⚙️", layout="centered")
@@ -22,7 +26,8 @@ st.subheader("✨ 생성형 AI 분석 설정 (Gemini)")
 st.markdown("""
 분석 대시보드의 서술형 응답에 대한 AI 요약 및 심층 분석 기능을 사용하려면 Google Gemini API 키가 필요합니다.
 API 키는 [Google AI Studio](https://aistudio.google.com/app/apikey)에서 무료로 발급받을 수 있습니다.
-입력된 키는 **현재 브라우저 세션 동안에만 임시로 저장**되며, 창을 닫거나 로그아웃하면 다시 입력해야 합니다.
+입력된 키는 **현재 브라우저 세션**에 저장되며, 창을 닫거나 로그아웃하면 다시 입력해야 합니다.
+'계정에 저장'을 선택하면 창을 닫은 뒤에도 백그라운드 AI 분석 작업이 이 키로 실행될 수 있도록 계정에도 저장됩니다.
 """)
 
 # 현재 세션에 저장된 키 가져오기 (없으면 None)
@@ -42,15 +47,25 @@ with st.form("api_key_form"):
         "Gemini API 키 입력",
         type="password",
         placeholder="발급받은 API 키를 여기에 붙여넣으세요.",
-        help="입력된 키는 현재 세션에만 저장됩니다."
+        help="입력된 키는 현재 세션에 저장됩니다."
     )
-    submitted = st.form_submit_button("API 키 저장 (현재 세션)")
+    store_for_worker = st.checkbox("계정에 저장 (백그라운드 분석 작업용)", value=True,
+                                   help="AI 분석 워커가 별도 프로세스로 실행되거나 앱이 다시 시작되어도 이 키로 분석을 이어갈 수 있습니다.")
+    submitted = st.form_submit_button("API 키 저장")
 
     if submitted:
         if api_key_input and len(api_key_input) > 10: # 간단한 유효성 검사 (길이)
             st.session_state['gemini_api_key'] = api_key_input
             st.success("✅ API 키가 현재 세션에 성공적으로 저장되었습니다!")
-            st.rerun() # 상태 표시 업데이트를 위해 새로고침
+            key_stored = True
+            if store_for_worker:
+                try:
+                    ai_jobs.store_api_key(st.session_state.get('teacher_id'), api_key_input)
+                except Exception as e:
+                    key_stored = False # 경고를 볼 수 있도록 새로고침하지 않음
+                    st.warning(f"API 키를 계정에 저장하는 중 오류 발생 (현재 세션에서는 사용 가능): {e}")
+            if key_stored:
+                st.rerun() # 상태 표시 업데이트를 위해 새로고침
         elif api_key_input:
              st.error("유효한 API 키 형식이 아닌 것 같습니다. 다시 확인해주세요.")
         else:
@@ -58,8 +73,61 @@ with st.form("api_key_form"):
 
 # API 키 제거 버튼 (선택 사항)
 if current_api_key:
-    if st.button("현재 세션에서 API 키 제거"):
+    if st.button("API 키 제거 (세션 및 계정)"):
         if 'gemini_api_key' in st.session_state:
             del st.session_state['gemini_api_key']
-        st.info("현재 세션에서 API 키가 제거되었습니다.")
-        st.rerun() # 상태 표시 업데이트
\ No newline at end of file
+        try:
+            ai_jobs.forget_api_key(st.session_state.get('teacher_id'))
+            st.info("API 키가 제거되었습니다.")
+            st.rerun() # 상태 표시 업데이트
+        except Exception as e:
+            st.warning(f"계정에 저장된 API 키를 지우는 중 오류 발생: {e}")
+st.divider()
+
+# --- AI 사용량 및 응답 시간 ---
+st.subheader("📈 AI 사용량 및 응답 시간")
+st.caption("Gemini 호출마다 기록된 토큰 수, 응답 시간, 재시도 횟수, 결과를 요약합니다. (내 계정으로 기록된 호출 기준)")
+
+period_options = {"최근 7일": 7, "최근 30일": 30, "전체": None}
+selected_period = st.radio("기간", options=list(period_options.keys()), horizontal=True, key="telemetry_period")
+days = period_options[selected_period]
+since = datetime.datetime.now() - datetime.timedelta(days=days) if days else None
+
+# 다른 교사의 사용 기록은 보이지 않도록 현재 교사 것만 불러옴 (teacher_id가 없으면 아무것도 불러오지 않음)
+current_teacher_id = st.session_state.get('teacher_id')
+try:
+    my_calls_df = (telemetry.load_ai_calls(teacher_id=current_teacher_id, since=since)
+                   if current_teacher_id is not None else pd.DataFrame())
+except Exception as e:
+    st.error(f"AI 사용 기록을 불러오는 중 오류 발생: {e}")
+    my_calls_df = pd.DataFrame()
+
+summary_column_config = {
+    "analysis_type": "분석 유형",
+    "calls": "호출 수",
+    "success_rate": st.column_config.NumberColumn("성공률", format="percent"),
+    "prompt_tokens": "입력 토큰",
+    "response_tokens": "출력 토큰",
+    "cost_usd": st.column_config.NumberColumn("예상 비용(USD)", format="$%.4f"),
+    "retries": "재시도",
+    "p50_ms": st.column_config.NumberColumn("p50 응답(ms)", format="%.0f"),
+    "p95_ms": st.column_config.NumberColumn("p95 응답(ms)", format="%.0f"),
+}
+
+if my_calls_df.empty:
+    st.info("아직 기록된 AI 호출이 없습니다.")
+else:
+    col_calls, col_tokens, col_p95 = st.columns(3)
+    col_calls.metric("내 AI 호출 수", len(my_calls_df))
+    col_tokens.metric("내 사용 토큰", int(my_calls_df[['prompt_tokens', 'response_tokens']].fillna(0).to_numpy().sum()))
+    my_latencies = telemetry.model_latencies(my_calls_df).dropna()
+    col_p95.metric("내 p95 응답 시간", f"{my_latencies.quantile(0.95) / 1000:.1f}초" if not my_latencies.empty else "-")
+
+    st.write("##### 내 분석 유형별 사용량")
+    st.dataframe(telemetry.summarize_ai_calls(my_calls_df, 'analysis_type'),
+                 column_config=summary_column_config, hide_index=True, use_container_width=True)
+
+    with st.expander("호출 결과별 건수 보기"):
+        outcome_counts = my_calls_df['outcome'].map(lambda x: telemetry.OUTCOME_LABELS.get(x, x)).value_counts()
+        st.write("호출 결과별 건수:")
+        st.dataframe(outcome_counts)
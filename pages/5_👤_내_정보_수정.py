@@ -3,6 +3,8 @@ import streamlit as st
 from supabase import create_client, Client, PostgrestAPIResponse
 from passlib.context import CryptContext
 import re # 이메일 형식 검증을 위해 추가
+import async_db # 서로 독립적인 조회 동시 실행
+import resilience # 제한 시간/재시도/회로 차단기를 적용한 쿼리 실행
 # Home.py와 동일한 Supabase 초기화 및 pwd_context 설정 필요
 import os
 
@@ -54,7 +56,10 @@ st.title("👤 내 정보 수정")
 
 # 현재 정보 로드 (예시)
 try:
-    res = supabase.table("teachers").select("username, teacher_name, email").eq("teacher_id", teacher_id).single().execute()
+    res = resilience.read_query(lambda db: db.table("teachers").select("username, teacher_name, email").eq("teacher_id", teacher_id).single(),
+                                cache_key=('teacher_profile', teacher_id))
+    if res.stale:
+        st.warning(resilience.stale_notice(res))
     current_data = res.data if res.data else {}
 except Exception as e:
     st.error(f"정보 로드 실패: {e}")
@@ -73,7 +78,7 @@ with st.form("name_change_form"):
     name_submitted = st.form_submit_button("이름 변경하기")
     if name_submitted and new_teacher_name:
         try:
-            res = supabase.table("teachers").update({"teacher_name": new_teacher_name}).eq("teacher_id", teacher_id).execute()
+            res = resilience.write(lambda db: db.table("teachers").update({"teacher_name": new_teacher_name}).eq("teacher_id", teacher_id))
             if res.data:
                 st.session_state['teacher_name'] = new_teacher_name # 세션 상태 업데이트
                 st.success("이름이 변경되었습니다.")
@@ -99,18 +104,20 @@ with st.form("email_change_form"):
              st.info("현재 이메일 주소와 동일합니다. 변경할 이메일을 입력하세요.")
         else:
             try:
-                # 1. 현재 비밀번호 확인
-                pw_res = supabase.table("teachers").select("password_hash").eq("teacher_id", teacher_id).single().execute()
+                # 1. 현재 비밀번호 조회와 2. 새 이메일 중복 확인(다른 사용자가 사용하는지)은 서로 독립적이므로 동시에 조회
+                checks = resilience.read(lambda db: async_db.execute_all({
+                    'password': db.table("teachers").select("password_hash").eq("teacher_id", teacher_id).single(),
+                    'email': db.table("teachers").select("teacher_id").eq("email", new_email).neq("teacher_id", teacher_id),
+                })).data
+                pw_res, email_check_res = checks['password'], checks['email']
                 if not pw_res.data or not pwd_context.verify(password_confirm_email, pw_res.data['password_hash']):
                     st.error("현재 비밀번호가 올바르지 않습니다.")
                 else:
-                    # 2. 새 이메일 중복 확인 (다른 사용자가 사용하는지)
-                    email_check_res = supabase.table("teachers").select("teacher_id").eq("email", new_email).neq("teacher_id", teacher_id).execute()
                     if email_check_res.data:
                         st.error("이미 다른 사용자가 사용 중인 이메일 주소입니다.")
                     else:
                         # 3. 이메일 업데이트 실행
-                        update_res = supabase.table("teachers").update({"email": new_email}).eq("teacher_id", teacher_id).execute()
+                        update_res = resilience.write(lambda db: db.table("teachers").update({"email": new_email}).eq("teacher_id", teacher_id))
                         if update_res.data or (hasattr(update_res, 'status_code') and update_res.status_code == 204):
                             st.success("이메일 주소가 성공적으로 변경되었습니다.")
                             st.rerun() # 페이지 새로고침하여 변경된 이메일 표시
@@ -137,11 +144,11 @@ with st.form("password_change_form"):
         else:
             # --- 현재 비밀번호 확인 로직 ---
             try:
-                 res = supabase.table("teachers").select("password_hash").eq("teacher_id", teacher_id).single().execute()
+                 res = resilience.read_query(lambda db: db.table("teachers").select("password_hash").eq("teacher_id", teacher_id).single())
                  if res.data and pwd_context.verify(current_password, res.data['password_hash']):
                       # --- 새 비밀번호 해싱 및 업데이트 ---
                       new_hashed_password = pwd_context.hash(new_password)
-                      update_res = supabase.table("teachers").update({"password_hash": new_hashed_password}).eq("teacher_id", teacher_id).execute()
+                      update_res = resilience.write(lambda db: db.table("teachers").update({"password_hash": new_hashed_password}).eq("teacher_id", teacher_id))
                       if update_res.data:
                            st.success("비밀번호가 성공적으로 변경되었습니다.")
                       else: st.error("비밀번호 변경 실패")
@@ -0,0 +1,110 @@
+# pages/6_🏫_학년_통합_분석.py
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+import school
+import sociometry
+
+st.set_page_config(page_title="학년 통합 분석", page_icon="🏫", layout="wide")
+
+# --- 인증 확인 ---
+if not st.session_state.get('logged_in'):
+    st.warning("로그인이 필요합니다.")
+    st.stop()
+
+teacher_id = st.session_state.get('teacher_id')
+teacher_name = st.session_state.get('teacher_name')
+
+st.title("🏫 학년 통합 분석")
+st.caption("담당하는 모든 학급의 가장 최근 설문을 합쳐 학급 간 비교, 학급별 응집도, 살펴볼 학생, 다른 반 친구 관계를 보여줍니다.")
+
+@st.cache_data(ttl=300, show_spinner=False) # 5분 캐싱
+def load_school_analysis(teacher_id):
+    return school.analyze_school(teacher_id)
+
+CLASS_LABELS = {
+    'class_name': "학급", 'survey_name': "설문", 'students': "학생 수", 'submitted': "응답 수",
+    'received_mean': "받은 평균 점수", 'positive_density': "긍정 선택 밀도", 'mutual_ratio': "상호 선택 비율",
+    'groups': "친구 그룹 수", 'modularity': "그룹 모듈성", 'isolated': "긍정 선택을 받지 못한 학생",
+    'otherclass_friendly_in': "다른 반 긍정 언급", 'otherclass_bad_in': "다른 반 부정 언급",
+}
+OUTLIER_LABELS = {
+    'student_name': "학생", 'class_name': "학급", 'received_avg': "받은 평균 점수", 'grade_z': "학년 z",
+    'class_z': "학급 z", 'status': "사회성 지위", 'otherclass_bad': "다른 반 부정 언급", 'reason': "살펴볼 이유",
+}
+
+if st.button("🔄 최신 데이터로 다시 분석"):
+    load_school_analysis.clear()
+
+try:
+    with st.spinner("학급별로 응답을 불러와 분석하는 중..."):
+        analysis = load_school_analysis(teacher_id)
+except Exception as e:
+    st.error(f"통합 분석 데이터 로딩 오류: {e}")
+    st.stop()
+
+for notice in analysis.stale_notices:
+    st.warning(notice)
+
+if analysis.classes.empty:
+    st.info("분석할 설문 응답이 있는 학급이 없습니다. '설문 관리' 메뉴에서 설문을 만들고 응답을 받아주세요.")
+    st.stop()
+
+students_df = analysis.students
+col1, col2, col3 = st.columns(3)
+col1.metric("학급 수", len(analysis.classes))
+col2.metric("응답 학생 수", int(students_df['submitted'].sum()))
+col3.metric("다른 반 친구 언급", f"{analysis.friendly.data.sum():.0f}건")
+
+# --- 1. 학급별 요약 ---
+st.subheader("1. 학급별 요약 및 응집도")
+class_columns = [c for c in CLASS_LABELS if c in analysis.classes.columns]
+st.dataframe(analysis.classes[class_columns].rename(columns=CLASS_LABELS).round(3), use_container_width=True, hide_index=True)
+st.caption(f"긍정 선택은 {sociometry.POSITIVE_THRESHOLD}점 이상입니다. 긍정 선택 밀도와 상호 선택 비율이 높을수록 학급의 결속이 강한 편입니다.")
+
+# --- 2. 학급 간 분포 ---
+st.subheader("2. 학급 간 받은 평균 점수 분포")
+dist_df = students_df.dropna(subset=['received_avg'])
+if not dist_df.empty:
+    fig_box = px.box(dist_df, x='class_name', y='received_avg', points='all', hover_data=['student_name'],
+                     labels={'class_name': "학급", 'received_avg': "받은 평균 점수", 'student_name': "학생"})
+    fig_box.update_layout(yaxis_range=[0, 100])
+    st.plotly_chart(fig_box, use_container_width=True)
+    status_df = students_df[students_df['submitted']].groupby(['class_name', 'status']).size().unstack(fill_value=0)
+    status_df = status_df.reindex(columns=list(sociometry.STATUS_LABELS), fill_value=0).rename(columns=sociometry.STATUS_LABELS)
+    st.write("##### 학급별 사회성 지위 분포")
+    st.dataframe(status_df, use_container_width=True)
+else:
+    st.write("받은 점수 데이터가 없습니다.")
+
+# --- 3. 살펴볼 학생 ---
+st.subheader("3. 살펴볼 학생 (이상치)")
+outliers_df = analysis.outliers()
+if not outliers_df.empty:
+    outliers_df = outliers_df.assign(status=outliers_df['status'].map(sociometry.STATUS_LABELS))
+    st.dataframe(outliers_df[list(OUTLIER_LABELS)].rename(columns=OUTLIER_LABELS).round(2), use_container_width=True, hide_index=True)
+else:
+    st.success("학년 전체 기준으로 특별히 눈에 띄는 학생이 없습니다.")
+st.caption(f"학년 z가 -{school.OUTLIER_Z:g} 이하이거나, 반 친구의 긍정 선택을 받지 못했거나, "
+           f"다른 반 학생에게 부정적으로 {school.OUTLIER_NEGATIVE_MENTIONS}회 이상 언급된 학생입니다.")
+
+# --- 4. 학급 간 관계 ---
+st.subheader("4. 학급 간 친구 관계 (다른 반 친구 언급)")
+col_friendly, col_bad = st.columns(2)
+for column, kind, title, scale in ((col_friendly, school.MENTION_FRIENDLY, "관계가 좋은 친구 언급", 'Greens'),
+                                   (col_bad, school.MENTION_BAD, "관계가 안 좋은 친구 언급", 'Reds')):
+    with column:
+        links_df = analysis.class_links(kind)
+        fig_links = px.imshow(links_df, text_auto=True, color_continuous_scale=scale, title=title,
+                              labels=dict(x="언급된 학생의 반", y="언급한 학생의 반", color="언급 수"))
+        st.plotly_chart(fig_links, use_container_width=True)
+mentioned_df = students_df[(students_df['otherclass_friendly'] > 0) | (students_df['otherclass_bad'] > 0)]
+if not mentioned_df.empty:
+    st.write("##### 다른 반 학생에게 많이 언급된 학생")
+    st.dataframe(mentioned_df.sort_values('otherclass_friendly', ascending=False)
+                 [['student_name', 'class_name', 'otherclass_friendly', 'otherclass_bad']]
+                 .rename(columns={'student_name': "학생", 'class_name': "학급",
+                                  'otherclass_friendly': "긍정 언급", 'otherclass_bad': "부정 언급"}).head(20),
+                 use_container_width=True, hide_index=True)
+if analysis.unresolved:
+    st.caption(f"명단에서 찾지 못한 이름 {analysis.unresolved}건은 제외했습니다. (같은 이름이 여러 반에 있으면 언급 수를 나누어 셉니다.)")
@@ -0,0 +1,70 @@
+# qr_utils.py
+# 설문 링크 QR 코드 생성 (PNG/SVG 캐시) 및 여러 설문의 QR 코드를 한 번에 인쇄하는 PDF
+# - 같은 URL/크기의 QR 코드는 프로세스 안에서 한 번만 인코딩/렌더링 (페이지 rerun 시 재사용)
+import io
+import functools
+import qrcode
+import qrcode.image.svg
+from fpdf import FPDF
+import reports
+
+QR_CACHE_SIZE = 256
+SCAN_HINT = "휴대폰 카메라로 QR 코드를 찍어 설문에 참여하세요."
+
+
+def _make_qr(url, box_size, border):
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L, # 오류 복원 레벨
+        box_size=box_size,
+        border=border,
+    )
+    qr.add_data(url)
+    qr.make(fit=True)
+    return qr
+
+@functools.lru_cache(maxsize=QR_CACHE_SIZE)
+def qr_png(url, box_size=10, border=4):
+    """URL의 QR 코드 PNG(bytes). (url, box_size, border)별로 캐시됩니다."""
+    qr = _make_qr(url, box_size, border)
+    img = qr.make_image(fill_color="black", back_color="white")
+
+    # 이미지를 메모리 버퍼에 저장
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+@functools.lru_cache(maxsize=QR_CACHE_SIZE)
+def qr_svg(url, box_size=10, border=4):
+    """URL의 QR 코드 SVG(bytes). 인쇄 시 크기를 키워도 깨지지 않습니다."""
+    qr = _make_qr(url, box_size, border)
+    img = qr.make_image(image_factory=qrcode.image.svg.SvgPathImage)
+    return img.to_string(encoding='unicode').encode('utf-8')
+
+def build_qr_sheet_pdf(entries, qr_size_mm=120):
+    """entries: [(제목, 부제목, URL), ...] 를 한 페이지에 하나씩 담은 인쇄용 PDF(bytes)를 만듭니다."""
+    # 사용된 글자만 담은 서브셋 폰트 (보고서 PDF와 같은 폰트/캐시 사용)
+    font_path = reports.subset_font_for([SCAN_HINT] + [part for entry in entries for part in entry])
+    pdf = FPDF(format='A4')
+    pdf.add_font(reports.FONT_FAMILY, '', font_path)
+    pdf.set_auto_page_break(False)
+
+    for title, subtitle, url in entries:
+        pdf.add_page()
+        pdf.set_font(reports.FONT_FAMILY, size=22)
+        pdf.set_y(25)
+        pdf.cell(0, 12, text=title, new_x="LMARGIN", new_y="NEXT", align='C')
+        if subtitle:
+            pdf.set_font(reports.FONT_FAMILY, size=14)
+            pdf.cell(0, 10, text=subtitle, new_x="LMARGIN", new_y="NEXT", align='C')
+
+        # 인쇄용이므로 큰 box_size로 렌더링 (캐시 공유)
+        x = (pdf.w - qr_size_mm) / 2
+        pdf.image(io.BytesIO(qr_png(url, box_size=20)), x=x, y=60, w=qr_size_mm, h=qr_size_mm)
+
+        pdf.set_y(60 + qr_size_mm + 10)
+        pdf.set_font(reports.FONT_FAMILY, size=12)
+        pdf.cell(0, 8, text=SCAN_HINT, new_x="LMARGIN", new_y="NEXT", align='C')
+        pdf.set_font(reports.FONT_FAMILY, size=9)
+        pdf.multi_cell(0, 5, text=url, align='C')
+    return bytes(pdf.output())
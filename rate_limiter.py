@@ -0,0 +1,145 @@
+# rate_limiter.py
+# Gemini 호출용 토큰 버킷 레이트 리미터 (API 키별 분당 요청 수 / 분당 토큰 수)
+# 한 프로세스 안의 모든 교사 세션이 같은 리미터를 공유하며,
+# GEMINI_RATE_STATE_PATH 를 지정하면 파일 잠금으로 여러 워커 프로세스 간에도 공유됩니다.
+import os
+import json
+import time
+import math
+import hashlib
+import threading
+
+try:
+    import fcntl # 파일 잠금 (리눅스/맥)
+except ImportError: # Windows 등에서는 프로세스 내 잠금만 사용
+    fcntl = None
+
+# gemini-2.0-flash-lite 무료 등급 기준 기본값 (환경 변수로 조정 가능)
+DEFAULT_RPM = int(os.environ.get("GEMINI_RPM", 30))
+DEFAULT_TPM = int(os.environ.get("GEMINI_TPM", 1_000_000))
+DEFAULT_MAX_WAIT = float(os.environ.get("GEMINI_MAX_WAIT_SECONDS", 120))
+
+
+def estimate_tokens(text):
+    """프롬프트 토큰 수를 대략 추정합니다 (한국어 기준 약 2글자당 1토큰)."""
+    return max(1, math.ceil(len(text or "") / 2))
+
+def _key_id(api_key):
+    # API 키 원문은 메모리/파일에 남기지 않고 해시만 사용
+    return hashlib.sha256((api_key or "").encode()).hexdigest()[:16]
+
+
+class RateLimitExceeded(Exception):
+    """허용 대기 시간보다 오래 기다려야 할 때 발생합니다."""
+    def __init__(self, wait_seconds):
+        super().__init__(f"약 {wait_seconds:.0f}초 후 다시 시도해주세요.")
+        self.wait_seconds = wait_seconds
+
+
+class TokenBucketLimiter:
+    """API 키별 요청/토큰 버킷. 예약 후 대기(reserve-then-sleep) 방식으로 순서대로 처리합니다."""
+
+    def __init__(self, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM, state_path=None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.state_path = state_path
+        self._lock = threading.Lock()
+        self._state = {} # key_id -> {'req': 남은 요청 수, 'tok': 남은 토큰 수, 'ts': 마지막 갱신 시각}
+
+    # --- 상태 저장소 (메모리 또는 파일) ---
+    def _locked(self, fn):
+        with self._lock:
+            if not self.state_path or fcntl is None:
+                return fn(self._state)
+            with open(self.state_path, "a+") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    raw = f.read()
+                    state = json.loads(raw) if raw.strip() else {}
+                    result = fn(state)
+                    f.seek(0)
+                    f.truncate()
+                    json.dump(state, f)
+                    f.flush()
+                    return result
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _refill(self, state, key_id, now):
+        bucket = state.get(key_id)
+        if bucket is None:
+            bucket = {'req': float(self.rpm), 'tok': float(self.tpm), 'ts': now}
+        elapsed = max(0.0, now - bucket['ts'])
+        bucket['req'] = min(float(self.rpm), bucket['req'] + elapsed * self.rpm / 60.0)
+        bucket['tok'] = min(float(self.tpm), bucket['tok'] + elapsed * self.tpm / 60.0)
+        bucket['ts'] = now
+        state[key_id] = bucket
+        return bucket
+
+    def _wait_for(self, bucket, tokens):
+        tokens = min(tokens, self.tpm) # 한 번에 버킷 용량 이상은 요구하지 않음
+        req_wait = max(0.0, (1 - bucket['req']) * 60.0 / self.rpm)
+        tok_wait = max(0.0, (tokens - bucket['tok']) * 60.0 / self.tpm)
+        return max(req_wait, tok_wait)
+
+    # --- 공개 API ---
+    def estimate_wait(self, api_key, tokens=1):
+        """지금 요청하면 몇 초를 기다려야 하는지 반환합니다 (버킷은 소비하지 않음)."""
+        key_id = _key_id(api_key)
+        return self._locked(lambda state: self._wait_for(self._refill(state, key_id, time.time()), tokens))
+
+    def reserve(self, api_key, tokens=1, max_wait=DEFAULT_MAX_WAIT):
+        """요청 1건과 토큰을 예약하고 기다려야 할 시간(초)을 반환합니다.
+        max_wait 보다 오래 기다려야 하면 예약하지 않고 RateLimitExceeded 를 발생시킵니다."""
+        key_id = _key_id(api_key)
+
+        def _reserve(state):
+            bucket = self._refill(state, key_id, time.time())
+            wait = self._wait_for(bucket, tokens)
+            if max_wait is not None and wait > max_wait:
+                raise RateLimitExceeded(wait)
+            bucket['req'] -= 1
+            bucket['tok'] -= min(tokens, self.tpm)
+            return wait
+
+        return self._locked(_reserve)
+
+    def acquire(self, api_key, tokens=1, max_wait=DEFAULT_MAX_WAIT):
+        """예약 후 필요한 만큼 대기합니다. 실제 대기한 시간(초)을 반환합니다."""
+        wait = self.reserve(api_key, tokens, max_wait)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def adjust(self, api_key, token_delta):
+        """실제 사용 토큰과 추정치의 차이를 반영합니다 (양수면 추가 차감)."""
+        key_id = _key_id(api_key)
+
+        def _adjust(state):
+            bucket = self._refill(state, key_id, time.time())
+            bucket['tok'] -= token_delta
+
+        self._locked(_adjust)
+
+    def penalize(self, api_key, seconds):
+        """429 응답을 받았을 때 해당 키의 요청 버킷을 비워 seconds 동안 새 요청을 막습니다."""
+        key_id = _key_id(api_key)
+
+        def _penalize(state):
+            bucket = self._refill(state, key_id, time.time())
+            bucket['req'] = min(bucket['req'], 1 - seconds * self.rpm / 60.0)
+
+        self._locked(_penalize)
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def get_limiter():
+    """프로세스 전역 리미터를 반환합니다."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = TokenBucketLimiter(state_path=os.environ.get("GEMINI_RATE_STATE_PATH"))
+        return _limiter
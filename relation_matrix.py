@@ -0,0 +1,337 @@
+# relation_matrix.py
+# 학생×학생 친밀도 점수 행렬 (행: 점수를 준 학생, 열: 점수를 받은 학생, 평가 없음은 NaN)
+# 응답 1건이 추가/수정되면 해당 행만 교체하고, 받은/준 점수 합계와 개수를 증분(delta)으로 갱신합니다.
+# 집계 기준은 대시보드의 calculate_received_scores / calculate_given_scores 와 같습니다:
+# 응답을 제출한 학생만 결과에 포함하고, 점수도 제출한 학생 사이의 점수만 반영합니다.
+# screen_responses()는 불러올 때 모든 친구에게 같은 점수(기본값 50점 등)를 준 성의 없는 응답을 표시합니다.
+# normalized()는 평가자마다 다른 점수 습관(모두 100점, 모두 기본값 50점 등)을 보정한 행렬을 만듭니다.
+import json
+import hashlib
+from statistics import NormalDist
+import numpy as np
+import pandas as pd
+
+SCORE_KEY = 'intimacy'
+
+# 점수 기준
+SCORING_RAW = 'raw'
+SCORING_RATER_Z = 'rater_z' # 평가자별 표준화 후 학급 전체 평균/표준편차로 되돌림
+SCORING_ADDITIVE = 'additive' # 점수 = 전체 평균 + 평가자 효과 + 대상 효과 모형에서 평가자 효과를 뺌
+SCORING_LABELS = {
+    SCORING_RAW: "원점수",
+    SCORING_RATER_Z: "평가자별 표준화",
+    SCORING_ADDITIVE: "평가자 성향 보정",
+}
+ALS_MAX_ITER = 50
+ALS_TOL = 1e-6
+ALS_SHRINK = 1.0 # 평가 수가 적은 학생의 효과를 0 쪽으로 줄이는 정도 (릿지)
+
+# 받은 평균 점수의 부트스트랩 신뢰구간
+BOOTSTRAP_RESAMPLES = 2000
+BOOTSTRAP_LEVEL = 0.95
+BOOTSTRAP_CHUNK = 1 << 22 # 한 번에 뽑는 인덱스 수 상한 (메모리 제한용)
+BOOTSTRAP_EXACT_MAX = 60 # 받은 수가 이보다 많으면 재표집 대신 부트스트랩 표준오차의 정규 근사 사용
+
+# 응답 품질 점검
+DEFAULT_SCORE = 50 # 설문 슬라이더 기본값
+QUALITY_OK = ''
+QUALITY_DEFAULT = 'default' # 모든 점수가 기본값 그대로
+QUALITY_CONSTANT = 'constant' # 모든 점수가 (거의) 같음
+QUALITY_EXTREME = 'extreme' # 점수가 양 끝(0~9점, 91~100점)의 한두 구간에만 몰림
+QUALITY_LABELS = {
+    QUALITY_DEFAULT: "모두 기본값(50점)",
+    QUALITY_CONSTANT: "모두 거의 같은 점수",
+    QUALITY_EXTREME: "극단값 위주(0/100점 등)",
+}
+QUALITY_MIN_RATED = 3 # 평가한 친구가 이보다 적으면 판단하지 않음
+QUALITY_MIN_STD = 3.0
+QUALITY_BIN_WIDTH = 10 # 엔트로피 계산용 점수 구간 (0~9, 10~19, ..., 100)
+QUALITY_MIN_ENTROPY = 0.35 # 구간 분포 엔트로피 / 가능한 최대 엔트로피
+QUALITY_EXTREME_LOW = 9 # 이 점수 이하 또는
+QUALITY_EXTREME_HIGH = 91 # 이 점수 이상을 극단값으로 봄
+QUALITY_MIN_EXTREME_SHARE = 0.8 # 극단값 비율이 이 이상이면서 엔트로피가 낮을 때만 표시 (80점대/90점대만 준 응답은 제외)
+
+
+def rater_zscores(scores):
+    """행(평가자)별 z-score. 평가가 2개 미만이거나 모두 같은 점수면 0"""
+    rated = ~np.isnan(scores)
+    count = rated.sum(axis=1)
+    values = np.where(rated, scores, 0.0)
+    mean = np.divide(values.sum(axis=1), count, out=np.zeros(len(scores)), where=count > 0)
+    centered = np.where(rated, scores - mean[:, None], 0.0)
+    std = np.sqrt(np.divide((centered ** 2).sum(axis=1), count, out=np.zeros(len(scores)), where=count > 0))
+    z = np.divide(centered, std[:, None], out=np.zeros_like(centered), where=(std[:, None] > 0) & (count[:, None] > 1))
+    return np.where(rated, z, np.nan)
+
+def additive_effects(scores, max_iter=ALS_MAX_ITER, tol=ALS_TOL, shrink=ALS_SHRINK):
+    """점수 ≈ mu + rater[i] + target[j] 를 교대 최소제곱(ALS)으로 맞춥니다. (mu, rater, target) 반환"""
+    rated = ~np.isnan(scores)
+    n = len(scores)
+    if not rated.any():
+        return 0.0, np.zeros(n), np.zeros(n)
+    values = np.where(rated, scores, 0.0)
+    mu = values.sum() / rated.sum()
+    rater_count, target_count = rated.sum(axis=1), rated.sum(axis=0)
+    rater, target = np.zeros(n), np.zeros(n)
+    for _ in range(max_iter):
+        residual = np.where(rated, values - mu - target[None, :], 0.0)
+        new_rater = residual.sum(axis=1) / (rater_count + shrink)
+        residual = np.where(rated, values - mu - new_rater[:, None], 0.0)
+        new_target = residual.sum(axis=0) / (target_count + shrink)
+        change = max(np.abs(new_rater - rater).max(), np.abs(new_target - target).max())
+        rater, target = new_rater, new_target
+        if change < tol:
+            break
+    return mu, rater, target
+
+def screen_responses(relations_list):
+    """응답(relation_mapping_data)마다 준 점수의 개수/평균/표준편차/구간 엔트로피/극단값 비율과 품질 표시를 계산합니다.
+    모든 점수를 (응답 번호, 점수) 1차원 배열로 펼친 뒤 bincount로 행별 통계를 한 번에 구합니다.
+    relations_list와 같은 순서의 DataFrame(rated_count, mean, std, entropy, extreme_share, flag) 반환"""
+    rows, values = [], []
+    for i, relations in enumerate(relations_list):
+        for info in parse_relations(relations).values():
+            score = info.get(SCORE_KEY) if isinstance(info, dict) else None
+            if isinstance(score, (int, float)):
+                rows.append(i)
+                values.append(score)
+    n = len(relations_list)
+    rows = np.asarray(rows, dtype=np.intp)
+    values = np.asarray(values, dtype=float)
+
+    count = np.bincount(rows, minlength=n)
+    safe_count = np.maximum(count, 1)
+    mean = np.bincount(rows, values, minlength=n) / safe_count
+    variance = np.bincount(rows, values ** 2, minlength=n) / safe_count - mean ** 2
+    std = np.sqrt(np.clip(variance, 0, None))
+    default_share = np.bincount(rows, values == DEFAULT_SCORE, minlength=n) / safe_count
+    extreme = (values <= QUALITY_EXTREME_LOW) | (values >= QUALITY_EXTREME_HIGH)
+    extreme_share = np.bincount(rows, extreme, minlength=n) / safe_count
+
+    n_bins = 100 // QUALITY_BIN_WIDTH + 1
+    bins = np.clip(values // QUALITY_BIN_WIDTH, 0, n_bins - 1).astype(np.intp)
+    histogram = np.bincount(rows * n_bins + bins, minlength=n * n_bins).reshape(n, n_bins)
+    share = histogram / safe_count[:, None]
+    entropy = (share * np.log2(np.divide(1, share, out=np.ones_like(share), where=share > 0))).sum(axis=1)
+    max_entropy = np.log2(np.clip(count, 1, n_bins)) # 평가 수가 적으면 가능한 최대 엔트로피도 작음
+    entropy = np.divide(entropy, max_entropy, out=np.ones(n), where=max_entropy > 0)
+
+    judged = count >= QUALITY_MIN_RATED
+    # 엔트로피만 보면 80점대/90점대처럼 두 구간에 고르게 준 응답도 걸리므로 실제로 극단값 위주인지 함께 확인
+    mostly_extreme = (entropy < QUALITY_MIN_ENTROPY) & (extreme_share >= QUALITY_MIN_EXTREME_SHARE)
+    flag = np.select([judged & (default_share == 1), judged & (std < QUALITY_MIN_STD), judged & mostly_extreme],
+                     [QUALITY_DEFAULT, QUALITY_CONSTANT, QUALITY_EXTREME], QUALITY_OK)
+    return pd.DataFrame({'rated_count': count, 'mean': mean, 'std': std, 'entropy': entropy,
+                         'extreme_share': extreme_share, 'flag': flag})
+
+def parse_relations(value):
+    """relation_mapping_data(JSON 문자열 또는 dict)를 dict로 변환합니다. 실패 시 빈 dict"""
+    if isinstance(value, dict):
+        return value
+    if isinstance(value, str) and value:
+        try:
+            parsed = json.loads(value)
+            return parsed if isinstance(parsed, dict) else {}
+        except json.JSONDecodeError:
+            return {}
+    return {}
+
+
+class RelationMatrix:
+    """학급 친밀도 점수 행렬과 받은/준 점수 집계."""
+
+    def __init__(self, student_ids, student_names=None):
+        student_names = student_names or {}
+        self.student_ids = list(student_ids)
+        self.index = {student_id: i for i, student_id in enumerate(self.student_ids)}
+        self.names = [student_names.get(student_id, 'Unknown') for student_id in self.student_ids]
+        n = len(self.student_ids)
+        self.scores = np.full((n, n), np.nan)
+        self.submitted = np.zeros(n, dtype=bool) # 응답을 제출한 학생 (집계에 포함되는 학생)
+        self._received_sum = np.zeros(n)
+        self._received_count = np.zeros(n, dtype=int)
+        self._given_sum = np.zeros(n)
+        self._given_count = np.zeros(n, dtype=int)
+        self.version = 0 # 변경될 때마다 증가 (차트 다시 그리기 판단용)
+
+    @classmethod
+    def from_responses(cls, analysis_df, students_map, roster=None):
+        """load_analysis_data 결과로 행렬을 만듭니다. roster({student_id: 이름})를 주면 미제출 학생 자리도 미리 만듭니다."""
+        names = dict(roster or {})
+        names.update(students_map or {})
+        matrix = cls(names.keys(), names)
+        if analysis_df is not None and not analysis_df.empty:
+            for submitter_id, relations in zip(analysis_df['submitter_id'], analysis_df['parsed_relations']):
+                matrix.apply_response(submitter_id, relations)
+        matrix.version = 0
+        return matrix
+
+    def __len__(self):
+        return len(self.student_ids)
+
+    def fingerprint(self):
+        """행렬 내용의 해시 (학생 목록/이름/제출 여부/점수가 같으면 같은 값). 분석 결과 캐시 키로 사용
+        (캐시된 결과에 학생 이름이 들어가므로 명단에서 이름만 바꿔도 값이 달라짐)"""
+        digest = hashlib.sha1()
+        digest.update("\x1f".join(map(str, self.student_ids)).encode('utf-8'))
+        digest.update(b"\x1e")
+        digest.update("\x1f".join(map(str, self.names)).encode('utf-8'))
+        digest.update(self.submitted.tobytes())
+        digest.update(np.ascontiguousarray(self.scores).tobytes())
+        return digest.hexdigest()
+
+    def normalized(self, method):
+        """평가자 성향을 보정한 새 행렬 (0~100 범위). method: SCORING_RATER_Z / SCORING_ADDITIVE, SCORING_RAW면 그대로"""
+        if method == SCORING_RAW:
+            return self
+        scores = np.where(self.submitted[:, None], self.scores, np.nan) # 집계에 쓰이는 평가만
+        if method == SCORING_RATER_Z:
+            rated = scores[~np.isnan(scores)]
+            mean, std = (rated.mean(), rated.std()) if rated.size else (0.0, 0.0)
+            adjusted = mean + std * rater_zscores(scores)
+        elif method == SCORING_ADDITIVE:
+            _, rater, _ = additive_effects(scores)
+            adjusted = scores - rater[:, None]
+        else:
+            raise ValueError(f"알 수 없는 점수 기준: {method}")
+        result = RelationMatrix(self.student_ids, dict(zip(self.student_ids, self.names)))
+        result.scores = np.where(np.isnan(self.scores), np.nan, np.clip(np.where(np.isnan(adjusted), self.scores, adjusted), 0, 100))
+        result.submitted = self.submitted.copy()
+        result._recompute_totals()
+        result.version = self.version
+        return result
+
+    def _recompute_totals(self):
+        """점수 행렬 전체로 받은/준 점수 합계와 개수를 다시 계산합니다."""
+        counted = ~np.isnan(self.scores) & self.submitted[:, None]
+        values = np.where(counted, self.scores, 0.0)
+        self._received_sum = values.sum(axis=0)
+        self._received_count = counted.sum(axis=0)
+        given = counted & self.submitted[None, :]
+        self._given_sum = np.where(given, self.scores, 0.0).sum(axis=1)
+        self._given_count = given.sum(axis=1)
+
+    def add_student(self, student_id, name='Unknown'):
+        """명단에 없던 학생을 행렬에 추가합니다 (행/열 하나씩 확장)."""
+        if student_id in self.index:
+            return self.index[student_id]
+        self.index[student_id] = len(self.student_ids)
+        self.student_ids.append(student_id)
+        self.names.append(name)
+        self.scores = np.pad(self.scores, ((0, 1), (0, 1)), constant_values=np.nan)
+        self.submitted = np.append(self.submitted, False)
+        self._received_sum = np.append(self._received_sum, 0.0)
+        self._received_count = np.append(self._received_count, 0)
+        self._given_sum = np.append(self._given_sum, 0.0)
+        self._given_count = np.append(self._given_count, 0)
+        return self.index[student_id]
+
+    def _row_from_relations(self, relations, submitter_idx):
+        row = np.full(len(self.student_ids), np.nan)
+        for target_id, info in parse_relations(relations).items():
+            target_idx = self.index.get(target_id)
+            score = info.get(SCORE_KEY) if isinstance(info, dict) else None
+            if target_idx is not None and target_idx != submitter_idx and isinstance(score, (int, float)):
+                row[target_idx] = score
+        return row
+
+    def apply_response(self, submitter_id, relations, name=None):
+        """학생 한 명의 응답(추가 또는 수정)을 반영합니다. 행렬이 바뀌었으면 True"""
+        i = self.index.get(submitter_id)
+        if i is None:
+            i = self.add_student(submitter_id, name or 'Unknown')
+        new_row = self._row_from_relations(relations, i)
+        old_row = self.scores[i]
+        if self.submitted[i] and np.array_equal(old_row, new_row, equal_nan=True):
+            return False
+
+        if not self.submitted[i]:
+            # 처음 제출한 학생: 이 학생이 받은 점수가 다른 학생들의 '준 점수'에 포함되기 시작
+            self.submitted[i] = True
+            column = self.scores[:, i]
+            has_score = ~np.isnan(column)
+            self._given_sum += np.where(has_score, column, 0.0)
+            self._given_count += has_score
+
+        # 받은 점수: 바뀐 행만큼만 더하고 뺌
+        old_has, new_has = ~np.isnan(old_row), ~np.isnan(new_row)
+        self._received_sum += np.where(new_has, new_row, 0.0) - np.where(old_has, old_row, 0.0)
+        self._received_count += new_has.astype(int) - old_has.astype(int)
+
+        # 준 점수: 제출한 학생에게 준 점수만
+        counted = new_has & self.submitted
+        self._given_sum[i] = new_row[counted].sum()
+        self._given_count[i] = counted.sum()
+
+        self.scores[i] = new_row
+        self.version += 1
+        return True
+
+    # --- 집계 결과 (대시보드 함수와 같은 컬럼) ---
+    def received_scores(self):
+        mask = self.submitted & (self._received_count > 0)
+        idx = np.flatnonzero(mask)
+        return pd.DataFrame({
+            'student_id': [self.student_ids[i] for i in idx],
+            'student_name': [self.names[i] for i in idx],
+            'average_score': self._received_sum[idx] / self._received_count[idx],
+            'received_count': self._received_count[idx],
+        }, columns=['student_id', 'student_name', 'average_score', 'received_count'])
+
+    def received_intervals(self, resamples=BOOTSTRAP_RESAMPLES, level=BOOTSTRAP_LEVEL, seed=0):
+        """받은 평균 점수의 부트스트랩 백분위 신뢰구간. received_scores()와 같은 학생 순서로
+        student_id, ci_low, ci_high 반환. 학생(열)마다 받은 점수를 앞으로 모아 두고,
+        재표집 인덱스를 (재표집 × 학생 × 받은 수) 배열로 한 번에 뽑아 평균을 구합니다.
+        받은 수가 BOOTSTRAP_EXACT_MAX보다 많은 학생은 평균의 분포가 정규에 가까우므로
+        부트스트랩 분산(표본분산 / 받은 수)으로 바로 계산합니다."""
+        columns = ['student_id', 'ci_low', 'ci_high']
+        idx = np.flatnonzero(self.submitted & (self._received_count > 0))
+        if idx.size == 0:
+            return pd.DataFrame(columns=columns)
+        counted = ~np.isnan(self.scores[:, idx]) & self.submitted[:, None]
+        values = np.where(counted, self.scores[:, idx], 0.0)
+        count = counted.sum(axis=0)
+        mean = values.sum(axis=0) / count
+        alpha = (1 - level) / 2
+        z = NormalDist().inv_cdf(1 - alpha)
+        spread = np.sqrt(np.where(counted, (values - mean) ** 2, 0.0).sum(axis=0) / count / count)
+        low, high = mean - z * spread, mean + z * spread
+
+        exact = np.flatnonzero(count <= BOOTSTRAP_EXACT_MAX)
+        if exact.size:
+            order = np.argsort(~counted[:, exact], axis=0, kind='stable') # 받은 점수가 앞에 오도록
+            width = int(count[exact].max())
+            packed = np.take_along_axis(values[:, exact], order, axis=0)[:width].T.astype(np.float32)
+            valid = np.arange(width)[None, :] < count[exact][:, None]
+            rng = np.random.default_rng(seed)
+            step = max(1, BOOTSTRAP_CHUNK // (resamples * width))
+            for start in range(0, exact.size, step):
+                part = slice(start, start + step)
+                n_part = len(packed[part])
+                part_count = count[exact][part]
+                draws = (rng.random((resamples, n_part, width), dtype=np.float32) * part_count[None, :, None]).astype(np.intp)
+                sampled = packed[part][np.arange(n_part)[None, :, None], draws]
+                sampled[:, ~valid[part]] = 0.0
+                means = sampled.sum(axis=2, dtype=np.float64) / part_count[None, :]
+                low[exact[part]], high[exact[part]] = np.quantile(means, [alpha, 1 - alpha], axis=0)
+        return pd.DataFrame({
+            'student_id': [self.student_ids[i] for i in idx],
+            'ci_low': np.clip(low, 0, 100),
+            'ci_high': np.clip(high, 0, 100),
+        }, columns=columns)
+
+    def given_scores(self):
+        mask = self.submitted & (self._given_count > 0)
+        idx = np.flatnonzero(mask)
+        return pd.DataFrame({
+            'submitter_id': [self.student_ids[i] for i in idx],
+            'submitter_name': [self.names[i] for i in idx],
+            'average_score_given': self._given_sum[idx] / self._given_count[idx],
+            'rated_count': self._given_count[idx],
+            'scores_list': [self.scores[i][self.submitted & ~np.isnan(self.scores[i])].tolist() for i in idx],
+        }, columns=['submitter_id', 'submitter_name', 'average_score_given', 'rated_count', 'scores_list'])
+
+    def all_scores(self):
+        """제출한 학생들이 매긴 모든 점수 (1차원 배열)"""
+        rows = self.scores[self.submitted]
+        return rows[~np.isnan(rows)]
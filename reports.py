@@ -0,0 +1,202 @@
+# reports.py
+# AI 분석 결과 PDF 보고서 생성 (학생별 프로파일 + 학급 요약 일괄 ZIP)
+# - 한글 폰트는 프로세스당 한 번만 파싱하고, 문서마다 파싱된 메트릭을 복제해 사용
+# - 일괄 생성 시에는 문서들에 쓰인 글자만 남긴 서브셋 폰트를 한 번 만들어 모든 문서가 공유
+# - 여러 문서는 프로세스 풀에서 병렬 렌더링
+# - 완성된 PDF는 내용 해시로 디스크에 캐시하여 같은 내용은 다시 그리지 않음
+import os
+import io
+import copy
+import hashlib
+import zipfile
+import functools
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from fpdf import FPDF
+from fpdf.fonts import SubsetMap
+from fontTools import ttLib
+from fontTools import subset as ftsubset
+
+FONT_FAMILY = 'NanumGothic'
+FONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fonts', 'NanumGothicCoding.ttf')
+REPORT_CACHE_DIR = os.environ.get("REPORT_CACHE_DIR", ".report_cache")
+REPORT_CACHE_VERSION = "1" # 레이아웃을 바꾸면 올려서 기존 캐시 무효화
+PARALLEL_THRESHOLD = 4 # 문서가 이보다 적으면 프로세스 풀 없이 바로 렌더링
+
+
+@functools.lru_cache(maxsize=8)
+def _font_prototype(font_path=FONT_PATH):
+    """프로세스당 한 번 폰트를 파싱해 메트릭(cmap, 글자 폭 등)을 보관합니다."""
+    pdf = FPDF()
+    pdf.add_font(FONT_FAMILY, '', font_path)
+    return pdf.fonts[FONT_FAMILY.lower()]
+
+def _attach_font(pdf, font_path=FONT_PATH):
+    """파싱해 둔 폰트 메트릭을 복제해 문서에 등록합니다.
+    fpdf2는 output() 시 폰트 객체를 제자리에서 서브셋하므로 TTFont와 서브셋 맵만 문서마다 새로 만듭니다."""
+    try:
+        proto = _font_prototype(font_path)
+        font = copy.copy(proto)
+        font.i = len(pdf.fonts) + 1
+        font.ttfont = ttLib.TTFont(proto.ttffile, recalcTimestamp=False, fontNumber=0, lazy=True)
+        font.missing_glyphs = []
+        font.subset = SubsetMap(font, [ord(char) for char in "\x00 \r\n0123456789" + pdf.str_alias_nb_pages])
+        if hasattr(font, 'hbfont'): # harfbuzz 폰트도 문서마다 새로 생성되도록
+            del font.hbfont
+        pdf.fonts[proto.fontkey] = font
+    except Exception:
+        # fpdf2 내부 구조가 바뀐 경우 등: 일반 방식으로 폰트 등록
+        traceback.print_exc()
+        pdf.add_font(FONT_FAMILY, '', font_path)
+
+def subset_font_for(texts):
+    """texts에 쓰인 글자(+ ASCII)만 남긴 서브셋 폰트 파일 경로를 반환합니다.
+    전체 폰트(약 1.2만 글리프)를 문서마다 읽고 서브셋하는 비용을 일괄 생성 1회로 줄입니다. 실패 시 원본 폰트 경로"""
+    charset = set(range(0x20, 0x7f))
+    for text in texts:
+        charset.update(ord(char) for char in (text or ""))
+    charset_key = hashlib.sha256(",".join(map(str, sorted(charset))).encode()).hexdigest()
+    path = os.path.join(REPORT_CACHE_DIR, "fonts", f"{charset_key}.ttf")
+    if os.path.exists(path):
+        return path
+    try:
+        font = ttLib.TTFont(FONT_PATH, recalcTimestamp=False)
+        options = ftsubset.Options(notdef_outline=True, recommended_glyphs=True)
+        subsetter = ftsubset.Subsetter(options)
+        subsetter.populate(unicodes=charset)
+        subsetter.subset(font)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        font.save(tmp_path)
+        os.replace(tmp_path, path)
+        return path
+    except Exception:
+        traceback.print_exc()
+        return FONT_PATH
+
+def render_pdf(text_content, title="AI 분석 결과", font_path=FONT_PATH):
+    """제목과 본문으로 PDF를 만들어 bytes로 반환합니다. (실패 시 예외 발생)"""
+    pdf = FPDF()
+    pdf.add_page()
+    _attach_font(pdf, font_path)
+
+    # 제목
+    pdf.set_font(FONT_FAMILY, size=16)
+    pdf.cell(0, 10, text=title, new_x="LMARGIN", new_y="NEXT", align='C')
+    pdf.ln(10)
+
+    # 본문
+    pdf.set_font(FONT_FAMILY, size=10)
+    pdf.multi_cell(0, 5, text=text_content or "")
+    return bytes(pdf.output())
+
+
+# --- 내용 해시 기반 캐시 ---
+def report_cache_key(title, text_content):
+    digest = hashlib.sha256()
+    for part in (REPORT_CACHE_VERSION, os.path.basename(FONT_PATH), title or "", text_content or ""):
+        digest.update(part.encode('utf-8'))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def _cache_path(cache_key):
+    return os.path.join(REPORT_CACHE_DIR, cache_key[:2], f"{cache_key}.pdf")
+
+def get_cached_pdf(title, text_content):
+    """캐시에 같은 내용의 PDF가 있으면 bytes를, 없으면 None을 반환합니다."""
+    path = _cache_path(report_cache_key(title, text_content))
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+def _store_cached_pdf(title, text_content, pdf_bytes):
+    path = _cache_path(report_cache_key(title, text_content))
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(pdf_bytes)
+        os.replace(tmp_path, path) # 동시에 쓰는 프로세스가 있어도 깨진 파일이 보이지 않도록
+    except OSError as e:
+        print(f"PDF 캐시 저장 실패: {e}")
+
+def create_pdf_cached(text_content, title="AI 분석 결과"):
+    """캐시를 먼저 확인하고 없으면 렌더링 후 캐시에 저장합니다."""
+    pdf_bytes = get_cached_pdf(title, text_content)
+    if pdf_bytes is None:
+        pdf_bytes = render_pdf(text_content, title)
+        _store_cached_pdf(title, text_content, pdf_bytes)
+    return pdf_bytes
+
+
+def _render_job(job):
+    # 프로세스 풀에서 실행되는 함수 (pickle 가능하도록 모듈 최상위에 정의)
+    index, title, text_content, font_path = job
+    return index, render_pdf(text_content, title, font_path)
+
+def unique_filenames(filenames):
+    """겹치는 파일명에 ' (2)', ' (3)'... 을 붙여 ZIP 안에서 서로 덮어쓰지 않게 합니다."""
+    seen = set()
+    unique = []
+    for filename in filenames:
+        stem, ext = os.path.splitext(filename)
+        candidate, n = filename, 1
+        while candidate in seen:
+            n += 1
+            candidate = f"{stem} ({n}){ext}"
+        seen.add(candidate)
+        unique.append(candidate)
+    return unique
+
+def build_reports_zip(documents, max_workers=None):
+    """documents: [(파일명, 제목, 본문), ...] 를 PDF로 렌더링해 하나의 ZIP(bytes)으로 묶습니다.
+    (ZIP bytes, 렌더링 실패 파일명 목록) 반환. 파일명이 겹치면 unique_filenames로 구분합니다."""
+    buffer = io.BytesIO()
+    failed = []
+    documents = list(documents)
+    filenames = unique_filenames([filename for filename, _, _ in documents])
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        to_render = [] # (documents 안의 위치, 제목, 본문)
+        for index, (filename, (_, title, text_content)) in enumerate(zip(filenames, documents)):
+            cached = get_cached_pdf(title, text_content)
+            if cached is not None:
+                zf.writestr(filename, cached)
+            else:
+                to_render.append((index, title, text_content))
+
+        # 렌더링할 문서 전체가 공유할 서브셋 폰트 (일괄 생성당 1회)
+        font_path = subset_font_for([part for job in to_render for part in job[1:]]) if to_render else FONT_PATH
+        to_render = [(*job, font_path) for job in to_render]
+
+        def _collect(index, pdf_bytes):
+            # 결과는 파일명이 아닌 문서 위치로 찾음 (완료 순서와 무관하게 제 문서의 캐시 키로 저장)
+            _, title, text = documents[index]
+            zf.writestr(filenames[index], pdf_bytes)
+            _store_cached_pdf(title, text, pdf_bytes)
+
+        if len(to_render) < PARALLEL_THRESHOLD:
+            for job in to_render:
+                try:
+                    _collect(*_render_job(job))
+                except Exception:
+                    traceback.print_exc()
+                    failed.append(filenames[job[0]])
+        else:
+            # spawn: Streamlit 서버(멀티스레드)에서 fork 하지 않도록
+            with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"),
+                                     initializer=_font_prototype, initargs=(font_path,)) as pool:
+                futures = {pool.submit(_render_job, job): filenames[job[0]] for job in to_render}
+                for future in as_completed(futures): # 끝나는 순서대로 ZIP에 기록
+                    try:
+                        _collect(*future.result())
+                    except Exception:
+                        traceback.print_exc()
+                        failed.append(futures[future])
+    return buffer.getvalue(), failed
+
+def safe_filename(name):
+    """파일명에 쓸 수 없는 문자를 '_'로 바꿉니다."""
+    return "".join('_' if c in '\\/:*?"<>|' else c for c in str(name)).strip() or "report"
@@ -0,0 +1,218 @@
+# resilience.py
+# Supabase 쿼리 실행 공통 래퍼: 요청별 제한 시간, 조회 재시도, 회로 차단기, 마지막 정상 데이터
+# - 모든 요청은 async_db 공유 클라이언트에서 asyncio.wait_for 로 제한 시간을 두고 실행 (초과 시 요청 취소)
+# - 조회(read)는 연결 오류 시 짧게 재시도 (시간 초과는 제한 시간을 또 기다리게 되므로 재시도하지 않음)
+#   쓰기(write)는 중복 반영 위험이 있어 재시도하지 않음
+# - 연속 실패가 FAILURE_THRESHOLD 회 이상이면 차단기가 열려 OPEN_SECONDS 동안 요청을 보내지 않고 바로 실패
+#   (열린 동안 조회는 cache_key 로 저장해 둔 마지막 정상 데이터를 stale=True 로 반환)
+# - PostgREST가 돌려준 오류(권한, 제약 조건, RPC 없음 등)는 서버가 정상 응답한 것이므로 재시도/차단 대상이 아님
+# - 여러 페이지를 가져오는 조회(fetch_all)는 paged=True 로 제한 시간을 페이지(요청)마다 적용
+#   (큰 학급/학교 조회가 전체 4초를 넘었다고 차단기가 열려 모든 교사의 요청이 막히지 않도록)
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from postgrest.exceptions import APIError
+import async_db
+
+READ_TIMEOUT = 4.0 # 조회 1회 제한 시간(초). paged=True 조회는 페이지(요청) 1개의 제한 시간
+READ_PAGED_TOTAL_TIMEOUT = 30.0 # paged=True 조회 전체의 상한(초)
+WRITE_TIMEOUT = 10.0 # 쓰기 1회 제한 시간(초)
+READ_RETRIES = 1 # 조회 재시도 횟수
+RETRY_BACKOFF = 0.3 # 재시도 전 대기(초), 시도마다 2배
+FAILURE_THRESHOLD = 2 # 이 횟수만큼 연속 실패하면 차단기 열림 (장애 중 한 페이지가 기다리는 시간 상한 ≈ 2 × READ_TIMEOUT)
+OPEN_SECONDS = 30 # 차단기가 열려 있는 시간 (이후 요청 1건으로 복구 여부 확인)
+LAST_GOOD_MAX_ENTRIES = 512
+
+# 차단기 상태
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+
+class BackendUnavailable(Exception):
+    """DB에 연결할 수 없고 대신 보여줄 마지막 정상 데이터도 없을 때 발생"""
+
+
+class CircuitBreaker:
+    """프로세스 전역 회로 차단기 (스레드 안전)."""
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, open_seconds=OPEN_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """요청을 보내도 되면 True. 열린 뒤 open_seconds가 지나면 시험 요청 1건만 허용"""
+        with self._lock:
+            if self.state == STATE_CLOSED:
+                return True
+            if self.state == STATE_OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+                self.state = STATE_HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == STATE_HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = STATE_CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == STATE_HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != STATE_OPEN:
+                    print(f"DB 요청이 연속 {self.failures}회 실패하여 {self.open_seconds}초 동안 요청을 차단합니다.")
+                self.state = STATE_OPEN
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    @property
+    def is_open(self):
+        return self.state == STATE_OPEN
+
+
+class ReadResult:
+    """조회 결과. data 는 응답의 data 와 같고, stale 이면 마지막 정상 데이터를 대신 돌려준 것"""
+
+    def __init__(self, data, stale=False, fetched_at=None, error=None):
+        self.data = data
+        self.stale = stale
+        self.fetched_at = fetched_at
+        self.error = error
+
+
+breaker = CircuitBreaker()
+_last_good = OrderedDict() # cache_key -> (data, fetched_at)
+_last_good_lock = threading.Lock()
+
+
+def _remember(cache_key, data):
+    with _last_good_lock:
+        _last_good[cache_key] = (data, time.time())
+        _last_good.move_to_end(cache_key)
+        while len(_last_good) > LAST_GOOD_MAX_ENTRIES:
+            _last_good.popitem(last=False)
+
+def _last_good_result(cache_key, error):
+    with _last_good_lock:
+        entry = _last_good.get(cache_key) if cache_key is not None else None
+    if entry is None:
+        raise BackendUnavailable(f"데이터베이스에 연결할 수 없습니다. 잠시 후 다시 시도해주세요. ({error})") from error
+    return ReadResult(entry[0], stale=True, fetched_at=entry[1], error=error)
+
+def _is_server_answer(error):
+    """PostgREST가 응답한 오류 (연결 문제가 아님)"""
+    return isinstance(error, APIError)
+
+def _is_timeout(error):
+    return isinstance(error, (TimeoutError, asyncio.TimeoutError))
+
+def _call(fetch, timeout, paged=False):
+    total = READ_PAGED_TOTAL_TIMEOUT if paged else timeout
+
+    async def _run(db):
+        if paged: # 이 작업 안의 요청(async_db.bounded)마다 timeout 적용
+            async_db.set_request_timeout(timeout)
+        return await asyncio.wait_for(fetch(db), total)
+    return async_db.run(_run, timeout=total + 1)
+
+def read(fetch, cache_key=None, timeout=None, retries=None, paged=False):
+    """fetch(async_client) 코루틴으로 조회합니다. ReadResult 반환.
+    cache_key 를 주면 성공한 결과를 보관했다가 DB 장애 중에는 그 데이터를 stale=True 로 돌려줍니다.
+    (로그인처럼 오래된 데이터를 쓰면 안 되는 조회는 cache_key 없이 호출)
+    paged=True 면 timeout 을 전체가 아닌 요청(페이지)마다 적용하고, 전체는 READ_PAGED_TOTAL_TIMEOUT 까지 기다립니다."""
+    timeout = READ_TIMEOUT if timeout is None else timeout
+    retries = READ_RETRIES if retries is None else retries
+    error = None
+    for attempt in range(retries + 1):
+        if not breaker.allow():
+            error = error or BackendUnavailable("DB 요청 차단 중 (회로 차단기 열림)")
+            break
+        try:
+            data = _call(fetch, timeout, paged)
+        except Exception as e:
+            if _is_server_answer(e):
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            error = e
+            print(f"DB 조회 실패 ({attempt + 1}/{retries + 1}회): {type(e).__name__}: {e}")
+            if _is_timeout(e):
+                break
+            if attempt < retries:
+                time.sleep(RETRY_BACKOFF * (2 ** attempt))
+            continue
+        breaker.record_success()
+        if cache_key is not None:
+            _remember(cache_key, data)
+        return ReadResult(data, fetched_at=time.time())
+    return _last_good_result(cache_key, error)
+
+async def _response_data(query):
+    response = await query.execute()
+    return response.data if response is not None else None # maybe_single()은 행이 없으면 None
+
+def read_query(build_query, cache_key=None, timeout=None, retries=None):
+    """build_query(async_client) -> 쿼리 빌더. 한 번의 select 를 read() 규칙으로 실행합니다."""
+    return read(lambda db: _response_data(build_query(db)), cache_key, timeout, retries)
+
+def write(build_query, timeout=None):
+    """insert/update/upsert/delete 를 제한 시간 안에 한 번 실행하고 응답을 반환합니다 (재시도 없음).
+    차단기가 열려 있으면 요청을 보내지 않고 바로 BackendUnavailable."""
+    if not breaker.allow():
+        raise BackendUnavailable("데이터베이스 연결이 불안정하여 저장하지 않았습니다. 잠시 후 다시 시도해주세요.")
+    try:
+        response = _call(lambda db: build_query(db).execute(), WRITE_TIMEOUT if timeout is None else timeout)
+    except Exception as e:
+        if _is_server_answer(e):
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+        raise
+    breaker.record_success()
+    return response
+
+def write_all(build_queries, timeout=None):
+    """여러 insert/update 를 동시에 보내고(동시 요청 수 제한) 요청마다 응답 또는 예외를 담은 리스트를 반환합니다.
+    요청마다 WRITE_TIMEOUT 제한 시간, 재시도 없음. 차단기 규칙은 write()와 같고 연결 오류가 하나라도 있으면 실패로 기록합니다."""
+    if not breaker.allow():
+        raise BackendUnavailable("데이터베이스 연결이 불안정하여 저장하지 않았습니다. 잠시 후 다시 시도해주세요.")
+    timeout = WRITE_TIMEOUT if timeout is None else timeout
+    limit = async_db.MAX_CONCURRENT_REQUESTS
+
+    async def _run(db):
+        semaphore = asyncio.Semaphore(limit)
+
+        async def _write(build_query):
+            async with semaphore:
+                return await asyncio.wait_for(build_query(db).execute(), timeout)
+
+        return await asyncio.gather(*(_write(build_query) for build_query in build_queries), return_exceptions=True)
+
+    rounds = -(-len(build_queries) // limit) # 동시 요청 수 제한으로 나뉘는 차례 수
+    try:
+        results = async_db.run(_run, timeout=timeout * max(rounds, 1) + 1)
+    except Exception:
+        breaker.record_failure()
+        raise
+    if any(isinstance(result, Exception) and not _is_server_answer(result) for result in results):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return results
+
+def stale_notice(result):
+    """stale 결과일 때 화면에 보여줄 안내 문구 (아니면 None)"""
+    if result is None or not result.stale:
+        return None
+    fetched = time.strftime('%H:%M:%S', time.localtime(result.fetched_at)) if result.fetched_at else "-"
+    return f"⚠️ 데이터베이스 연결이 불안정하여 {fetched}에 불러온 데이터를 표시합니다."
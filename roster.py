@@ -0,0 +1,272 @@
+# roster.py
+# 학생 명단 파일(CSV/XLSX) 가져오기
+# - 파일 전체를 한 번에 읽지 않고 청크 단위로 스트리밍 (openpyxl read-only, pandas chunksize)
+# - 이름 정규화 (유니코드 NFC, 공백 정리) 후 해시 집합으로 중복 검사
+# - '학급' 컬럼이 있으면 행마다 해당 학급으로 배정 (학년 전체 명단을 한 번에 등록)
+# - 학생 추가는 청크 단위 일괄 insert (청크들은 resilience.write_all로 동시에 전송), 행별 처리 결과 보고서 반환
+# - 그 밖의 조회/저장은 resilience 를 거쳐 제한 시간과 회로 차단기를 적용
+import codecs
+import traceback
+import unicodedata
+import pandas as pd
+import openpyxl
+import async_db
+import resilience
+
+CHUNK_SIZE = 1000 # 파일 읽기 청크 크기 (행)
+INSERT_CHUNK_SIZE = 500 # 한 번의 insert 요청에 담을 학생 수
+FETCH_PAGE_SIZE = 1000 # PostgREST 기본 최대 행 수에 맞춘 조회 페이지 크기
+
+# 헤더 이름으로 컬럼 찾기 (정규화 후 비교, 없으면 이름은 첫 번째 컬럼)
+NAME_COLUMN_ALIASES = ('학생 이름', '학생이름', '이름', '성명', 'student_name', 'name')
+CLASS_COLUMN_ALIASES = ('학급', '학급 이름', '학급이름', '학급명', '반', 'class', 'class_name')
+
+# 행별 처리 결과
+RESULT_ADD = "추가 예정"
+RESULT_ADDED = "추가됨"
+RESULT_FAILED = "추가 실패"
+RESULT_EMPTY = "이름 없음"
+RESULT_EXISTS = "이미 등록됨"
+RESULT_DUPLICATE = "파일 내 중복"
+RESULT_NO_CLASS = "학급 없음"
+
+
+def normalize_name(value):
+    """이름 정규화: None/NaN은 빈 문자열, NFC 정규화, 연속 공백은 한 칸으로."""
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return ""
+    return " ".join(unicodedata.normalize('NFC', str(value)).split())
+
+def normalize_names(series):
+    """normalize_name의 Series(벡터) 버전."""
+    return series.fillna("").astype(str).str.normalize('NFC').str.split().str.join(" ")
+
+def _find_column(headers, aliases):
+    normalized = [normalize_name(h).lower() for h in headers]
+    for alias in aliases:
+        if alias.lower() in normalized:
+            return normalized.index(alias.lower())
+    return None
+
+def _detect_columns(headers):
+    """(이름 컬럼 위치, 학급 컬럼 위치 또는 None)"""
+    name_idx = _find_column(headers, NAME_COLUMN_ALIASES)
+    class_idx = _find_column(headers, CLASS_COLUMN_ALIASES)
+    if name_idx is None: # 기존 방식과 같이 첫 번째 컬럼을 이름으로 사용
+        name_idx = 0 if class_idx != 0 else 1
+    return name_idx, class_idx
+
+def _to_chunk(rows, name_idx, class_idx):
+    return pd.DataFrame({
+        'row': [row_number for row_number, _ in rows],
+        'student_name': [values[name_idx] if name_idx < len(values) else None for _, values in rows],
+        'class_name': [values[class_idx] if class_idx is not None and class_idx < len(values) else None for _, values in rows],
+    })
+
+def _iter_xlsx_chunks(file_obj, chunk_size):
+    workbook = openpyxl.load_workbook(file_obj, read_only=True, data_only=True)
+    try:
+        rows_iter = workbook.active.iter_rows(values_only=True)
+        name_idx = class_idx = None
+        rows = []
+        for row_number, values in enumerate(rows_iter, start=1):
+            if name_idx is None: # 첫 번째 비어있지 않은 행을 헤더로 사용
+                if any(v is not None and str(v).strip() for v in values):
+                    name_idx, class_idx = _detect_columns(values)
+                continue
+            rows.append((row_number, values))
+            if len(rows) >= chunk_size:
+                yield _to_chunk(rows, name_idx, class_idx), class_idx is not None
+                rows = []
+        if rows:
+            yield _to_chunk(rows, name_idx, class_idx), class_idx is not None
+    finally:
+        workbook.close()
+
+def _detect_encoding(file_obj, sample_size=65536):
+    """앞부분을 읽어 UTF-8로 해석되지 않으면 cp949(엑셀 한글 CSV 기본)로 판단합니다."""
+    sample = file_obj.read(sample_size)
+    file_obj.seek(0)
+    try:
+        # 샘플 끝에서 잘린 멀티바이트 문자는 오류로 보지 않음 (final=False)
+        codecs.getincrementaldecoder('utf-8-sig')().decode(sample, final=False)
+        return 'utf-8-sig'
+    except UnicodeDecodeError:
+        return 'cp949'
+
+def _iter_csv_chunks(file_obj, chunk_size):
+    encoding = _detect_encoding(file_obj)
+    headers = pd.read_csv(file_obj, encoding=encoding, nrows=0).columns.tolist()
+    file_obj.seek(0)
+    name_idx, class_idx = _detect_columns(headers)
+    usecols = [i for i in (name_idx, class_idx) if i is not None and i < len(headers)]
+    reader = pd.read_csv(file_obj, encoding=encoding, usecols=usecols, dtype=str,
+                         keep_default_na=False, skip_blank_lines=False, chunksize=chunk_size)
+    for chunk in reader:
+        yield pd.DataFrame({
+            'row': chunk.index + 2, # 헤더가 1행
+            'student_name': chunk[headers[name_idx]] if name_idx < len(headers) else None,
+            'class_name': chunk[headers[class_idx]] if class_idx is not None else None,
+        }), class_idx is not None
+
+def read_roster(file_name, file_obj, chunk_size=CHUNK_SIZE):
+    """명단 파일을 청크 단위로 읽어 정규화된 DataFrame(row, student_name, class_name)과 학급 컬럼 유무를 반환합니다."""
+    if file_name.lower().endswith('.xlsx'):
+        chunk_iter = _iter_xlsx_chunks(file_obj, chunk_size)
+    elif file_name.lower().endswith('.csv'):
+        chunk_iter = _iter_csv_chunks(file_obj, chunk_size)
+    else:
+        raise ValueError("지원하지 않는 파일 형식입니다.")
+
+    chunks = []
+    has_class_column = False
+    for chunk, has_class in chunk_iter:
+        has_class_column = has_class_column or has_class
+        chunk['student_name'] = normalize_names(chunk['student_name'])
+        chunk['class_name'] = normalize_names(chunk['class_name'])
+        chunks.append(chunk)
+    if not chunks:
+        return pd.DataFrame(columns=['row', 'student_name', 'class_name']), has_class_column
+    roster_df = pd.concat(chunks, ignore_index=True)
+    # 완전히 빈 행(이름, 학급 모두 없음)은 보고서에서도 제외
+    roster_df = roster_df[(roster_df['student_name'] != "") | (roster_df['class_name'] != "")]
+    return roster_df.reset_index(drop=True), has_class_column
+
+
+def fetch_existing_names(class_ids, page_size=FETCH_PAGE_SIZE):
+    """여러 학급의 기존 학생 이름을 페이지 단위로 한 번에 조회합니다. {class_id: set(정규화된 이름)}"""
+    existing = {class_id: set() for class_id in class_ids}
+    if not class_ids:
+        return existing
+    class_ids = sorted(class_ids, key=str)
+    result = resilience.read(
+        lambda db: async_db.fetch_all(lambda: db.table('students')
+                                      .select("class_id, student_name")
+                                      .in_('class_id', class_ids)
+                                      .order('student_id', desc=False), page_size),
+        cache_key=('student_names', tuple(map(str, class_ids))), paged=True)
+    for row in result.data or []:
+        existing.setdefault(row['class_id'], set()).add(normalize_name(row['student_name']))
+    return existing
+
+def plan_import(roster_df, class_ids_by_name, existing_names, default_class_id=None):
+    """행마다 배정 학급과 처리 결과를 정합니다.
+    class_ids_by_name: {정규화된 학급 이름: class_id}, existing_names: {class_id: set(이름)}
+    학급 컬럼 값이 비어 있으면 default_class_id 로 배정합니다. 결과 컬럼이 추가된 DataFrame 반환"""
+    plan_df = roster_df.copy()
+    plan_df['class_id'] = plan_df['class_name'].map(class_ids_by_name)
+    if default_class_id is not None:
+        plan_df.loc[plan_df['class_name'] == "", 'class_id'] = default_class_id
+
+    seen = set() # (class_id, 이름) - 파일 내 중복 검사
+    results = []
+    for class_id, name in zip(plan_df['class_id'], plan_df['student_name']):
+        if not name:
+            results.append(RESULT_EMPTY)
+        elif class_id is None or pd.isna(class_id):
+            results.append(RESULT_NO_CLASS)
+        elif name in existing_names.get(class_id, ()):
+            results.append(RESULT_EXISTS)
+        elif (class_id, name) in seen:
+            results.append(RESULT_DUPLICATE)
+        else:
+            seen.add((class_id, name))
+            results.append(RESULT_ADD)
+    plan_df['result'] = results
+    return plan_df
+
+def create_missing_classes(teacher_id, class_names):
+    """명단에만 있는 학급을 한 번의 insert로 생성합니다. {학급 이름: class_id} 반환"""
+    if not class_names:
+        return {}
+    response = resilience.write(lambda db: db.table('classes').insert(
+        [{'teacher_id': teacher_id, 'class_name': name} for name in class_names]
+    ))
+    return {normalize_name(row['class_name']): row['class_id'] for row in (response.data or [])}
+
+def insert_planned_students(plan_df, chunk_size=INSERT_CHUNK_SIZE):
+    """'추가 예정' 행을 청크 단위로 일괄 insert 하고 결과 컬럼을 갱신한 DataFrame을 반환합니다.
+    청크들은 동시에 전송되며, 청크 하나가 실패해도 나머지 청크는 계속 진행하고 실패한 행은 '추가 실패'로 표시됩니다."""
+    report_df = plan_df.copy()
+    report_df['error'] = ""
+    pending = report_df.index[report_df['result'] == RESULT_ADD]
+    chunks = [pending[start:start + chunk_size] for start in range(0, len(pending), chunk_size)]
+    payloads = [
+        [{'class_id': class_id, 'student_name': name}
+         for class_id, name in zip(report_df.loc[chunk_index, 'class_id'], report_df.loc[chunk_index, 'student_name'])]
+        for chunk_index in chunks
+    ]
+    if not payloads:
+        return report_df
+    try:
+        # 청크별 insert 를 동시에 (요청마다 제한 시간, 회로 차단기 적용)
+        results = resilience.write_all([lambda db, payload=payload: db.table('students').insert(payload) for payload in payloads])
+    except Exception as e: # 차단기 열림 또는 연결 자체 실패 (요청을 보내지 못함)
+        results = [e] * len(payloads)
+
+    for chunk_index, payload, result in zip(chunks, payloads, results):
+        error = result if isinstance(result, Exception) else None
+        if error is None and result.data is not None and len(result.data) != len(payload):
+            error = RuntimeError(f"{len(payload)}명 중 {len(result.data)}명만 추가됨")
+        if error is None:
+            report_df.loc[chunk_index, 'result'] = RESULT_ADDED
+        else:
+            print(f"학생 일괄 추가 중 오류 발생 (행 {report_df.loc[chunk_index[0], 'row']}~): {error}")
+            traceback.print_exception(error)
+            report_df.loc[chunk_index, 'result'] = RESULT_FAILED
+            report_df.loc[chunk_index, 'error'] = str(error)
+    return report_df
+
+
+# --- 학생 목록 편집 저장 ---
+SAVE_ROSTER_RPC = 'save_class_roster' # sql/save_class_roster.sql
+_rpc_available = True # RPC가 설치되지 않은 DB에서는 한 번 확인 후 일괄 요청 방식만 사용
+
+def diff_roster(original_df, edited_df):
+    """학생 ID 기준으로 편집 전/후 명단을 비교합니다.
+    (이름 변경 [{student_id, student_name}], 삭제할 student_id 목록, 추가할 이름 목록) 반환"""
+    original_names = {
+        student_id: normalize_name(name)
+        for student_id, name in zip(original_df['student_id'], original_df['student_name'])
+        if student_id is not None and pd.notna(student_id)
+    }
+    renamed, added, kept_ids = [], [], set()
+    for student_id, name in zip(edited_df['student_id'], edited_df['student_name']):
+        name = normalize_name(name)
+        if student_id is None or pd.isna(student_id) or student_id not in original_names:
+            if name: # data_editor에서 새로 추가된 행
+                added.append(name)
+            continue
+        kept_ids.add(student_id)
+        if name and name != original_names[student_id]:
+            renamed.append({'student_id': student_id, 'student_name': name})
+    deleted_ids = [student_id for student_id in original_names if student_id not in kept_ids]
+    return renamed, deleted_ids, added
+
+def save_roster_changes(class_id, renamed, deleted_ids, added):
+    """diff_roster 결과를 저장합니다. {'updated', 'inserted', 'deleted'} 건수 반환
+    save_class_roster RPC가 있으면 한 트랜잭션으로, 없으면 일괄 upsert 1회 + 일괄 delete 1회로 처리합니다."""
+    global _rpc_available
+    upserts = [dict(row, class_id=class_id) for row in renamed] + \
+              [{'class_id': class_id, 'student_name': name} for name in added]
+
+    if _rpc_available:
+        try:
+            response = resilience.write(lambda db: db.rpc(SAVE_ROSTER_RPC, {
+                'p_class_id': str(class_id),
+                'p_upserts': upserts,
+                'p_delete_ids': [str(student_id) for student_id in deleted_ids],
+            }))
+            return response.data or {'updated': len(renamed), 'inserted': len(added), 'deleted': len(deleted_ids)}
+        except Exception as e:
+            if getattr(e, 'code', None) != 'PGRST202': # 함수 없음 외의 오류는 그대로 전달 (트랜잭션은 롤백됨)
+                raise
+            print(f"{SAVE_ROSTER_RPC} RPC가 없어 일괄 요청 방식으로 저장합니다.")
+            _rpc_available = False
+
+    if upserts:
+        # default_to_null=False: 새 학생 행에 없는 student_id는 DB 기본값으로 생성
+        resilience.write(lambda db: db.table('students').upsert(upserts, on_conflict='student_id', default_to_null=False))
+    if deleted_ids:
+        resilience.write(lambda db: db.table('students').delete().eq('class_id', class_id).in_('student_id', deleted_ids))
+    return {'updated': len(renamed), 'inserted': len(added), 'deleted': len(deleted_ids)}
@@ -0,0 +1,268 @@
+# school.py
+# 교사의 모든 학급(학년/학교 단위)을 합친 통합 분석
+# - 학급마다 가장 최근 설문 응답을 따로 불러와 처리하고 학생별/학급별 요약만 남김
+#   (학급 단위로 나눠 처리하므로 메모리는 학생 수 전체가 아니라 가장 큰 학급 크기의 점수 행렬에 비례)
+# - 학급 간 받은 평균 점수 분포, 학급별 응집도(긍정 선택 밀도, 상호 선택 비율, 그룹 모듈성), 이상치 학생
+# - 다른 반 친구 이름(otherclass_friendly_name / otherclass_bad_name)을 전체 명단으로 해석해
+#   학급 간 관계 그래프를 CSR(압축 희소 행) 배열로 저장 (scipy 없이 NumPy로 구성)
+import re
+import numpy as np
+import pandas as pd
+import async_db
+import resilience
+import sociometry
+from relation_matrix import RelationMatrix
+
+SCHOOL_RESPONSE_COLUMNS = "response_id, student_id, relation_mapping_data, otherclass_friendly_name, otherclass_bad_name"
+OUTLIER_Z = 2.0 # 학년 전체 받은 평균 점수 z-score가 -OUTLIER_Z 이하면 이상치
+OUTLIER_NEGATIVE_MENTIONS = 2 # 다른 반 학생에게 '관계가 안 좋은 친구'로 이 횟수 이상 언급되면 이상치
+NAME_SEPARATORS = re.compile(r"[,/·;\s]+|그리고|및")
+MENTION_FRIENDLY = 'friendly'
+MENTION_BAD = 'bad'
+
+
+class SparseGraph:
+    """CSR 형식 가중 방향 그래프 (indptr, indices, data). 같은 (행, 열) 간선은 가중치를 더함"""
+
+    def __init__(self, indptr, indices, data, shape):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.shape = shape
+
+    @classmethod
+    def from_edges(cls, rows, cols, weights, shape):
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        weights = np.asarray(weights, dtype=float)
+        if rows.size:
+            order = np.lexsort((cols, rows))
+            rows, cols, weights = rows[order], cols[order], weights[order]
+            first = np.r_[True, (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])]
+            starts = np.flatnonzero(first)
+            rows, cols, weights = rows[starts], cols[starts], np.add.reduceat(weights, starts)
+        indptr = np.zeros(shape[0] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=shape[0]), out=indptr[1:])
+        return cls(indptr, cols, weights, shape)
+
+    @property
+    def nnz(self):
+        return len(self.data)
+
+    def row_ids(self):
+        """간선마다의 행 번호 (indptr을 펼친 것)"""
+        return np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+
+    def out_weight(self):
+        return np.bincount(self.row_ids(), weights=self.data, minlength=self.shape[0])
+
+    def in_weight(self):
+        return np.bincount(self.indices, weights=self.data, minlength=self.shape[1])
+
+    def aggregate(self, labels, size):
+        """노드를 labels(예: 학급 번호)로 묶은 size × size 밀집 행렬"""
+        result = np.zeros((size, size))
+        np.add.at(result, (labels[self.row_ids()], labels[self.indices]), self.data)
+        return result
+
+
+class SchoolRoster:
+    """교사의 전체 학생 명단 (전체 인덱스, 학급 번호, 이름으로 찾기)"""
+
+    def __init__(self, students, classes):
+        self.class_ids = [c['class_id'] for c in classes]
+        self.class_names = [c['class_name'] for c in classes]
+        class_index = {class_id: i for i, class_id in enumerate(self.class_ids)}
+        students = [s for s in students if s.get('class_id') in class_index]
+        self.student_ids = [s['student_id'] for s in students]
+        self.names = [s['student_name'] for s in students]
+        self.class_of = np.array([class_index[s['class_id']] for s in students], dtype=np.int64)
+        self.index = {student_id: i for i, student_id in enumerate(self.student_ids)}
+        self._by_name = {}
+        for i, name in enumerate(self.names):
+            self._by_name.setdefault(str(name).strip(), []).append(i)
+
+    def __len__(self):
+        return len(self.student_ids)
+
+    def class_roster(self, class_pos):
+        idx = np.flatnonzero(self.class_of == class_pos)
+        return {self.student_ids[i]: self.names[i] for i in idx}
+
+    def resolve_names(self, text, exclude_class):
+        """자유 입력 이름 문자열을 다른 반 학생 인덱스로. [(학생 인덱스, 가중치)], 못 찾은 이름 수
+        같은 이름이 여러 반에 있으면 가중치를 나눔"""
+        matches, unresolved = [], 0
+        for token in NAME_SEPARATORS.split(str(text or "")):
+            token = token.strip()
+            if not token:
+                continue
+            candidates = [i for i in self._by_name.get(token, []) if self.class_of[i] != exclude_class]
+            if not candidates:
+                unresolved += 1
+                continue
+            matches.extend((i, 1.0 / len(candidates)) for i in candidates)
+        return matches, unresolved
+
+
+def _latest_surveys_by_class(surveys):
+    """최신순 설문 목록에서 학급별 가장 최근 설문"""
+    latest = {}
+    for survey in surveys:
+        latest.setdefault(survey.get('class_id'), survey)
+    return latest
+
+def load_roster(teacher_id):
+    """교사의 학급, 설문, 전체 학생을 조회합니다 (학급/설문은 동시에). (classes, surveys, students, ReadResult) 반환"""
+    async def _load(db):
+        responses = await async_db.execute_all({
+            'classes': db.table('classes').select("class_id, class_name").eq('teacher_id', teacher_id).order('created_at'),
+            'surveys': db.table('surveys').select("survey_instance_id, survey_name, class_id, created_at")
+                         .eq('teacher_id', teacher_id).order('created_at', desc=True),
+        })
+        classes = responses['classes'].data or []
+        students = []
+        if classes:
+            students = await async_db.fetch_all(lambda: db.table('students').select("student_id, student_name, class_id")
+                                                .in_('class_id', [c['class_id'] for c in classes]).order('student_id'))
+        return classes, responses['surveys'].data or [], students
+    result = resilience.read(_load, cache_key=('school_roster', teacher_id), paged=True)
+    classes, surveys, students = result.data
+    return classes, surveys, students, result
+
+def fetch_class_chunk(survey_instance_id):
+    """학급 하나(설문 하나)의 응답 (페이지 단위 조회). ReadResult 반환"""
+    return resilience.read(lambda db: async_db.fetch_all(lambda: db.table('survey_responses').select(SCHOOL_RESPONSE_COLUMNS)
+                                                         .eq('survey_instance_id', survey_instance_id).order('response_id')),
+                           cache_key=('school_chunk', survey_instance_id), paged=True)
+
+def _class_chunk(roster, class_pos, responses):
+    """학급 하나의 점수 행렬로 학생별 지표와 학급 응집도를 계산하고, 다른 반 언급 간선을 모읍니다.
+    점수 행렬은 이 함수 안에서만 사용 (반환값은 요약뿐)"""
+    matrix = RelationMatrix.from_responses(None, None, roster=roster.class_roster(class_pos))
+    edges = {MENTION_FRIENDLY: [], MENTION_BAD: []}
+    unresolved = 0
+    for row in responses:
+        student_id = row.get('student_id')
+        if student_id not in matrix.index:
+            continue # 다른 반으로 옮긴 학생 등 명단에 없는 응답
+        matrix.apply_response(student_id, row.get('relation_mapping_data'))
+        source = roster.index[student_id]
+        for kind, column in ((MENTION_FRIENDLY, 'otherclass_friendly_name'), (MENTION_BAD, 'otherclass_bad_name')):
+            matches, missing = roster.resolve_names(row.get(column), class_pos)
+            unresolved += missing
+            edges[kind].extend((source, target, weight) for target, weight in matches)
+
+    metrics = sociometry.compute_metrics(matrix)
+    received = matrix.received_scores().set_index('student_id')['average_score']
+    metrics['received_avg'] = metrics['student_id'].map(received)
+    metrics['class_pos'] = class_pos
+
+    _, _, positive, _ = sociometry.choice_matrices(matrix)
+    responded = matrix.submitted
+    possible = responded.sum() * (responded.sum() - 1)
+    chosen = positive[np.ix_(responded, responded)].sum()
+    mutual = (positive & positive.T)[np.ix_(responded, responded)].sum()
+    _, groups_df, modularity = sociometry.detect_communities(matrix)
+    cohesion = {
+        'class_pos': class_pos,
+        'students': len(matrix),
+        'submitted': int(responded.sum()),
+        'received_mean': float(np.nanmean(metrics['received_avg'])) if metrics['received_avg'].notna().any() else np.nan,
+        'positive_density': chosen / possible if possible else np.nan,
+        'mutual_ratio': mutual / chosen if chosen else np.nan,
+        'groups': len(groups_df),
+        'modularity': modularity,
+        'isolated': int((metrics['submitted'] & (metrics['positive_in'] == 0)).sum()),
+    }
+    return metrics[['student_id', 'student_name', 'class_pos', 'submitted', 'received_avg',
+                    'positive_in', 'negative_in', 'status', 'isolation_index']], cohesion, edges, unresolved
+
+
+class SchoolAnalysis:
+    """학급별 처리 결과를 합친 통합 분석 결과"""
+
+    def __init__(self, roster, students_df, classes_df, friendly, bad, unresolved, stale_notices):
+        self.roster = roster
+        self.students = students_df
+        self.classes = classes_df
+        self.friendly = friendly # SparseGraph (학생 × 학생)
+        self.bad = bad
+        self.unresolved = unresolved
+        self.stale_notices = stale_notices
+
+    def class_links(self, kind=MENTION_FRIENDLY):
+        """학급 × 학급 언급 수 (행: 언급한 학생의 반, 열: 언급된 학생의 반)"""
+        graph = self.friendly if kind == MENTION_FRIENDLY else self.bad
+        size = len(self.roster.class_ids)
+        links = graph.aggregate(self.roster.class_of, size)
+        return pd.DataFrame(links, index=self.roster.class_names, columns=self.roster.class_names)
+
+    def outliers(self, z_cutoff=OUTLIER_Z, negative_mentions=OUTLIER_NEGATIVE_MENTIONS):
+        """이상치 학생: 학년 전체 받은 평균 점수가 매우 낮음 / 반 친구의 긍정 선택 없음 / 다른 반 부정 언급 많음"""
+        df = self.students
+        reasons = pd.Series([[] for _ in range(len(df))], index=df.index)
+        low = df['grade_z'] <= -z_cutoff
+        isolated = df['submitted'] & (df['positive_in'] == 0)
+        disliked = df['otherclass_bad'] >= negative_mentions
+        for mask, reason in ((low, "학년 전체 대비 받은 점수 매우 낮음"), (isolated, "반 친구의 긍정 선택 없음"),
+                             (disliked, "다른 반 학생의 부정 언급 많음")):
+            for i in df.index[mask]:
+                reasons[i].append(reason)
+        result = df[low | isolated | disliked].copy()
+        result['reason'] = reasons[result.index].map(", ".join)
+        return result.sort_values('grade_z')
+
+
+def analyze_school(teacher_id, progress=None):
+    """교사의 모든 학급을 학급 단위로 하나씩 처리해 SchoolAnalysis 를 만듭니다.
+    progress(완료 수, 전체 수, 학급 이름)를 주면 학급마다 호출"""
+    classes, surveys, students, roster_result = load_roster(teacher_id)
+    roster = SchoolRoster(students, classes)
+    latest = _latest_surveys_by_class(surveys)
+    stale_notices = [resilience.stale_notice(roster_result)] if roster_result.stale else []
+
+    student_frames, cohesion_rows, unresolved = [], [], 0
+    edges = {MENTION_FRIENDLY: [], MENTION_BAD: []}
+    for class_pos, class_id in enumerate(roster.class_ids):
+        survey = latest.get(class_id)
+        if progress:
+            progress(class_pos, len(roster.class_ids), roster.class_names[class_pos])
+        if survey is None:
+            continue
+        chunk = fetch_class_chunk(survey['survey_instance_id'])
+        if chunk.stale:
+            stale_notices.append(resilience.stale_notice(chunk))
+        metrics, cohesion, class_edges, missing = _class_chunk(roster, class_pos, chunk.data or [])
+        metrics['survey_name'] = survey['survey_name']
+        cohesion['survey_name'] = survey['survey_name']
+        student_frames.append(metrics)
+        cohesion_rows.append(cohesion)
+        unresolved += missing
+        for kind, triples in class_edges.items():
+            edges[kind].extend(triples)
+
+    shape = (len(roster), len(roster))
+    friendly, bad = (SparseGraph.from_edges(*(zip(*edges[kind]) if edges[kind] else ((), (), ())), shape)
+                     for kind in (MENTION_FRIENDLY, MENTION_BAD))
+    friendly_in, bad_in = friendly.in_weight(), bad.in_weight()
+
+    students_df = pd.concat(student_frames, ignore_index=True) if student_frames else pd.DataFrame(
+        columns=['student_id', 'student_name', 'class_pos', 'submitted', 'received_avg', 'positive_in',
+                 'negative_in', 'status', 'isolation_index', 'survey_name'])
+    students_df['class_name'] = [roster.class_names[i] for i in students_df['class_pos']]
+    global_idx = np.array([roster.index[s] for s in students_df['student_id']], dtype=np.int64)
+    students_df['otherclass_friendly'] = friendly_in[global_idx]
+    students_df['otherclass_bad'] = bad_in[global_idx]
+    received = students_df['received_avg'].astype(float)
+    students_df['grade_z'] = (received - received.mean()) / received.std(ddof=0) if received.std(ddof=0) > 0 else 0.0
+    class_mean = received.groupby(students_df['class_pos']).transform('mean')
+    class_std = received.groupby(students_df['class_pos']).transform(lambda v: v.std(ddof=0))
+    students_df['class_z'] = ((received - class_mean) / class_std.replace(0, np.nan)).fillna(0.0)
+
+    classes_df = pd.DataFrame(cohesion_rows)
+    if not classes_df.empty:
+        classes_df.insert(0, 'class_name', [roster.class_names[i] for i in classes_df['class_pos']])
+        classes_df['otherclass_friendly_in'] = np.bincount(roster.class_of, weights=friendly_in, minlength=len(roster.class_ids))[classes_df['class_pos']]
+        classes_df['otherclass_bad_in'] = np.bincount(roster.class_of, weights=bad_in, minlength=len(roster.class_ids))[classes_df['class_pos']]
+    return SchoolAnalysis(roster, students_df, classes_df, friendly, bad, unresolved, stale_notices)
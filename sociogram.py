@@ -0,0 +1,267 @@
+# sociogram.py
+# 긍정 선택 관계망(소시오그램)의 힘 기반 배치(Fruchterman–Reingold)와 Plotly 그림
+# - 반발력은 NumPy 행렬 연산으로 한꺼번에 계산. 학생 수가 GRID_MIN_NODES 이상이면 격자 근사
+#   (가까운 칸(자기 칸+주변 8칸)의 학생은 정확히, 먼 칸은 칸 무게중심 하나로 계산)
+# - 인력은 간선 배열에서 bincount로 누적 (간선별 파이썬 반복 없음)
+# - 이전 배치(이전 설문)를 시작 위치로 주면 적은 반복으로 다듬기만 해서 설문 간 배치가 크게 바뀌지 않음
+# - 그림은 간선 종류별로 선 trace 하나(NaN으로 끊은 좌표 배열)만 만들어 수백 명도 바로 그려짐
+# - 친밀도 행렬 히트맵은 go.Heatmap 하나(z 배열)로 그리고, 학생이 많으면 그룹/구간 평균으로 줄여서 보냄
+from collections import Counter
+import numpy as np
+import plotly.graph_objects as go
+import sociometry
+
+LAYOUT_ITERATIONS = 80 # 처음 배치할 때 반복 횟수
+WARM_START_ITERATIONS = 30 # 이전 배치에서 시작할 때 반복 횟수
+INITIAL_TEMPERATURE = 0.1 # 한 번에 움직일 수 있는 최대 거리 (배치 영역 크기 1 기준)
+WARM_START_TEMPERATURE = 0.03
+GRAVITY = 0.3 # 연결이 없는 학생/그룹이 멀리 밀려나지 않도록 중심으로 당기는 힘
+GRID_MIN_NODES = 1000 # 이 인원 이상이면 반발력을 격자로 근사 (그 아래는 정확한 계산이 더 빠름)
+GRID_NODES_PER_CELL = 8 # 격자 한 칸에 들어가는 평균 학생 수
+MIN_DISTANCE = 1e-3
+HEATMAP_MAX_SIDE = 120 # 히트맵 한 변의 최대 칸 수 (넘으면 그룹/구간 평균으로 축소)
+
+EDGE_COLORS = {'mutual': "#2E7D32", 'one_way': "#B0BEC5"}
+NO_GROUP_COLOR = "#9E9E9E"
+GROUP_PALETTE = [
+    "#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", "#8c564b",
+    "#e377c2", "#bcbd22", "#17becf", "#393b79", "#ad494a", "#637939",
+]
+
+
+def _pairwise_repulsion(pos, other, k2, weight=None):
+    """pos(n, 2)의 각 점이 other(n, m, 2) 또는 (m, 2)의 점들에게서 받는 반발력 합 (float32, 제자리 연산)"""
+    if other.ndim == 2:
+        dx = np.subtract.outer(pos[:, 0], other[:, 0])
+        dy = np.subtract.outer(pos[:, 1], other[:, 1])
+    else:
+        dx = pos[:, 0, None] - other[:, :, 0]
+        dy = pos[:, 1, None] - other[:, :, 1]
+    force = dx * dx
+    force += dy * dy
+    np.maximum(force, np.float32(MIN_DISTANCE ** 2), out=force)
+    np.divide(np.float32(k2), force, out=force) # (delta / d) * (k² / d) = delta * k² / d²
+    if weight is not None:
+        force *= weight
+    dx *= force
+    dy *= force
+    return np.stack([dx.sum(axis=1), dy.sum(axis=1)], axis=1)
+
+def _exact_repulsion(pos, k2):
+    pos = pos.astype(np.float32)
+    weight = np.ones((len(pos), len(pos)), dtype=np.float32)
+    np.fill_diagonal(weight, 0.0)
+    return _pairwise_repulsion(pos, pos, k2, weight).astype(float)
+
+def _grid_repulsion(pos, k2):
+    """격자 근사 반발력. 자기 칸과 주변 8칸의 학생은 정확히, 나머지는 칸 무게중심(인원수 가중)으로 계산"""
+    n = len(pos)
+    side = max(int(np.ceil(np.sqrt(n / GRID_NODES_PER_CELL))), 1)
+    low = pos.min(axis=0)
+    cell_size = max(float((pos.max(axis=0) - low).max()), MIN_DISTANCE) / side
+    cell_xy = np.minimum(((pos - low) / cell_size).astype(int), side - 1)
+    cell = cell_xy[:, 0] * side + cell_xy[:, 1]
+    count = np.bincount(cell, minlength=side * side)
+    pos32 = pos.astype(np.float32)
+
+    # 먼 칸: 칸 무게중심에 인원수만큼의 반발력
+    occupied = np.flatnonzero(count)
+    centroid = np.stack([np.bincount(cell, weights=pos[:, 0], minlength=side * side)[occupied],
+                         np.bincount(cell, weights=pos[:, 1], minlength=side * side)[occupied]], axis=1) / count[occupied, None]
+    far = (np.abs(cell_xy[:, None, 0] - occupied[None, :] // side) > 1) | \
+          (np.abs(cell_xy[:, None, 1] - occupied[None, :] % side) > 1)
+    result = _pairwise_repulsion(pos32, centroid.astype(np.float32), k2, far * count[occupied].astype(np.float32))
+
+    # 가까운 칸: (학생, 주변 9칸의 학생) 쌍 목록을 np.repeat로 만들어 정확히 계산
+    order = np.argsort(cell, kind='stable')
+    starts = np.concatenate([[0], np.cumsum(count)[:-1]])
+    sources, targets = [], []
+    for ox in (-1, 0, 1):
+        for oy in (-1, 0, 1):
+            nx, ny = cell_xy[:, 0] + ox, cell_xy[:, 1] + oy
+            inside = np.flatnonzero((nx >= 0) & (nx < side) & (ny >= 0) & (ny < side))
+            neighbour_cell = nx[inside] * side + ny[inside]
+            lengths = count[neighbour_cell]
+            offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+            sources.append(np.repeat(inside, lengths))
+            targets.append(order[np.repeat(starts[neighbour_cell], lengths) + offsets])
+    sources, targets = np.concatenate(sources), np.concatenate(targets)
+    keep = sources != targets
+    sources, targets = sources[keep], targets[keep]
+    delta = pos[sources] - pos[targets]
+    force = k2 / np.maximum((delta ** 2).sum(axis=1), MIN_DISTANCE ** 2)
+    result = result.astype(float)
+    result[:, 0] += np.bincount(sources, weights=delta[:, 0] * force, minlength=n)
+    result[:, 1] += np.bincount(sources, weights=delta[:, 1] * force, minlength=n)
+    return result
+
+def _initial_positions(weights, init, rng):
+    """init의 NaN 행(이전 배치에 없던 학생)은 배치된 이웃의 평균 근처, 이웃이 없으면 무작위 위치"""
+    n = weights.shape[0]
+    random_pos = rng.uniform(-0.5, 0.5, size=(n, 2))
+    if init is None:
+        return random_pos
+    pos = np.array(init, dtype=float)
+    missing = np.isnan(pos).any(axis=1)
+    if missing.all():
+        return random_pos
+    placed = ~missing
+    link = weights[np.ix_(missing, placed)]
+    total = link.sum(axis=1)
+    neighbour_mean = np.divide(link @ pos[placed], total[:, None], out=np.zeros((missing.sum(), 2)), where=total[:, None] > 0)
+    pos[missing] = np.where(total[:, None] > 0, neighbour_mean, random_pos[missing]) + rng.normal(0, 0.05, size=(missing.sum(), 2))
+    return pos
+
+def force_layout(weights, init=None, iterations=None, seed=0):
+    """대칭 가중 인접 행렬의 Fruchterman–Reingold 배치. (n, 2) 좌표 (-1~1 범위로 정규화) 반환.
+    init: 시작 좌표 (n, 2), 모르는 학생은 NaN. 주면 낮은 온도에서 짧게 반복합니다."""
+    n = weights.shape[0]
+    if n == 0:
+        return np.zeros((0, 2))
+    if n == 1:
+        return np.zeros((1, 2))
+    rng = np.random.default_rng(seed)
+    warm = init is not None and not np.isnan(np.asarray(init, dtype=float)).all()
+    if iterations is None:
+        iterations = WARM_START_ITERATIONS if warm else LAYOUT_ITERATIONS
+    temperature = WARM_START_TEMPERATURE if warm else INITIAL_TEMPERATURE
+    pos = _initial_positions(weights, init, rng)
+    if warm:
+        pos = pos / max(np.abs(pos).max(), MIN_DISTANCE) * 0.5 # 정규화된 이전 배치를 작업 범위로
+
+    k = 1.0 / np.sqrt(n) # 이상적인 간선 길이 (영역 1 기준)
+    k2 = k * k
+    rows, cols = np.nonzero(np.triu(weights, 1))
+    edge_weight = weights[rows, cols]
+    repulsion = _grid_repulsion if n >= GRID_MIN_NODES else _exact_repulsion
+    for step in range(iterations):
+        disp = repulsion(pos, k2)
+        delta = pos[rows] - pos[cols]
+        dist = np.maximum(np.sqrt((delta ** 2).sum(axis=1)), MIN_DISTANCE)
+        pull = delta * (edge_weight * dist / k)[:, None] # (delta / d) * (d² / k) * w
+        for axis in range(2):
+            disp[:, axis] -= np.bincount(rows, weights=pull[:, axis], minlength=n)
+            disp[:, axis] += np.bincount(cols, weights=pull[:, axis], minlength=n)
+        disp -= GRAVITY * pos * np.sqrt(n)
+        length = np.maximum(np.sqrt((disp ** 2).sum(axis=1)), MIN_DISTANCE)
+        step_temperature = temperature * (1 - step / iterations)
+        pos += disp / length[:, None] * np.minimum(length, step_temperature)[:, None]
+
+    pos -= pos.mean(axis=0)
+    return pos / max(np.abs(pos).max(), MIN_DISTANCE)
+
+def layout_positions(matrix, previous=None, seed=0):
+    """학급 긍정 선택 관계망 배치. {student_id: (x, y)} 반환.
+    previous: 이전 설문의 {student_id: (x, y)} (같은 학생은 그 위치에서 시작)"""
+    _, _, positive, _ = sociometry.choice_matrices(matrix)
+    weights = positive.astype(float) + positive.T
+    init = None
+    if previous:
+        init = np.array([previous.get(student_id, (np.nan, np.nan)) for student_id in matrix.student_ids], dtype=float)
+    pos = force_layout(weights, init=init, seed=seed)
+    return {student_id: (float(x), float(y)) for student_id, (x, y) in zip(matrix.student_ids, pos)}
+
+def _edge_trace(pos, rows, cols, name, color, width):
+    """간선 여러 개를 NaN으로 끊은 좌표 배열 하나로 그리는 선 trace"""
+    xs = np.full(len(rows) * 3, np.nan)
+    ys = np.full(len(rows) * 3, np.nan)
+    xs[0::3], xs[1::3] = pos[rows, 0], pos[cols, 0]
+    ys[0::3], ys[1::3] = pos[rows, 1], pos[cols, 1]
+    return go.Scatter(x=xs, y=ys, mode='lines', name=name, hoverinfo='skip',
+                      line=dict(color=color, width=width), connectgaps=False)
+
+def build_figure(matrix, positions, membership_df=None, metrics_df=None):
+    """소시오그램 Plotly 그림. 서로 선택 / 한쪽 선택 간선 trace 2개 + 학생 점 trace 1개.
+    membership_df(detect_communities 결과)가 있으면 그룹별 색, metrics_df가 있으면 받은 긍정 선택 수로 점 크기"""
+    n = len(matrix)
+    pos = np.array([positions.get(student_id, (0.0, 0.0)) for student_id in matrix.student_ids], dtype=float).reshape(n, 2)
+    _, _, positive, _ = sociometry.choice_matrices(matrix)
+    mutual = np.triu(positive & positive.T, 1)
+    one_way = positive & ~positive.T
+    figure = go.Figure()
+    rows, cols = np.nonzero(one_way)
+    figure.add_trace(_edge_trace(pos, rows, cols, "한쪽 선택", EDGE_COLORS['one_way'], 1))
+    rows, cols = np.nonzero(mutual)
+    figure.add_trace(_edge_trace(pos, rows, cols, "서로 선택", EDGE_COLORS['mutual'], 2))
+
+    groups = np.full(n, sociometry.NO_GROUP)
+    if membership_df is not None and not membership_df.empty:
+        groups = membership_df['group'].to_numpy()
+    colors = np.where(groups == sociometry.NO_GROUP, NO_GROUP_COLOR,
+                      np.array(GROUP_PALETTE)[np.maximum(groups - 1, 0) % len(GROUP_PALETTE)])
+    received = positive.sum(axis=0)
+    if metrics_df is not None and not metrics_df.empty:
+        received = metrics_df['positive_in'].to_numpy()
+    hover = [f"{name}<br>그룹: {'없음' if group == sociometry.NO_GROUP else group}<br>받은 긍정 선택: {count}"
+             for name, group, count in zip(matrix.names, groups, received)]
+    figure.add_trace(go.Scatter(
+        x=pos[:, 0], y=pos[:, 1], mode='markers+text' if n <= 60 else 'markers', name="학생",
+        text=matrix.names, textposition='top center', hovertext=hover, hoverinfo='text',
+        marker=dict(size=8 + 3 * np.sqrt(received), color=colors, line=dict(width=1, color="#FFFFFF")),
+    ))
+    figure.update_layout(
+        showlegend=True, hovermode='closest', height=600, margin=dict(l=10, r=10, t=30, b=10),
+        xaxis=dict(visible=False), yaxis=dict(visible=False, scaleanchor='x'),
+    )
+    return figure
+
+def _block_means(ordered_scores, starts):
+    """순서대로 정렬한 점수 행렬을 starts 경계의 블록으로 나눈 평균 (평가 없는 칸은 제외, 블록 전체가 비면 NaN)"""
+    rated = ~np.isnan(ordered_scores)
+    sums = np.add.reduceat(np.add.reduceat(np.where(rated, ordered_scores, 0.0), starts, axis=0), starts, axis=1)
+    counts = np.add.reduceat(np.add.reduceat(rated.astype(int), starts, axis=0), starts, axis=1)
+    return np.divide(sums, counts, out=np.full(sums.shape, np.nan), where=counts > 0)
+
+def heatmap_data(matrix, order, membership_df=None, max_side=HEATMAP_MAX_SIDE):
+    """히트맵 z 배열과 축 라벨. 반환: (z, labels, aggregated)
+    학생 수가 max_side 이하면 학생 단위, 넘으면 그룹 단위(그룹 수가 max_side 이하일 때) 또는 같은 크기 구간의 평균"""
+    order = np.asarray(order, dtype=int)
+    ordered = matrix.scores[np.ix_(order, order)]
+    names = [matrix.names[i] for i in order]
+    n = len(order)
+    if n <= max_side:
+        return ordered, names, False
+    if membership_df is not None and not membership_df.empty:
+        groups = membership_df['group'].to_numpy()[order]
+        starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+        if len(starts) <= max_side:
+            sizes = np.diff(np.r_[starts, n])
+            labels = [f"{'그룹 없음' if groups[start] == sociometry.NO_GROUP else f'그룹 {groups[start]}'} ({size}명)"
+                      for start, size in zip(starts, sizes)]
+            return _block_means(ordered, starts), labels, True
+    bin_size = int(np.ceil(n / max_side))
+    starts = np.arange(0, n, bin_size)
+    labels = [f"{names[start]} 외 {min(bin_size, n - start) - 1}명" for start in starts]
+    return _block_means(ordered, starts), labels, True
+
+def _unique_labels(labels):
+    """같은 라벨이 여러 번 나오면 '이름 (n)'으로 구분 (동명이인이 한 칸으로 합쳐지지 않도록)"""
+    totals = Counter(labels)
+    seen = Counter()
+    unique = []
+    for label in labels:
+        seen[label] += 1
+        unique.append(f"{label} ({seen[label]})" if totals[label] > 1 else label)
+    return unique
+
+def build_heatmap(matrix, order, membership_df=None, max_side=HEATMAP_MAX_SIDE):
+    """친밀도 행렬 히트맵 (행: 준 학생, 열: 받은 학생). go.Heatmap trace 하나만 사용
+    축은 위치(0..n-1) 기준이고 눈금에만 라벨을 붙여, 이름이 같은 학생도 각자 행/열을 가짐"""
+    z, labels, aggregated = heatmap_data(matrix, order, membership_df, max_side)
+    positions = np.arange(len(labels))
+    ticks = _unique_labels(labels)
+    hovertext = [[f"준 쪽: {giver}<br>받은 쪽: {receiver}" for receiver in ticks] for giver in ticks]
+    hover = "%{hovertext}<br>" + ("평균 점수" if aggregated else "점수") + ": %{z:.0f}<extra></extra>"
+    figure = go.Figure(go.Heatmap(
+        z=z, x=positions, y=positions, zmin=0, zmax=100, colorscale='RdYlGn',
+        hovertext=hovertext, hoverongaps=False, hovertemplate=hover, colorbar=dict(title="친밀도"),
+    ))
+    show_ticks = len(labels) <= 60
+    figure.update_layout(
+        height=max(400, min(900, 12 * len(labels) + 150)), margin=dict(l=10, r=10, t=30, b=10),
+        xaxis=dict(title="받은 학생", showticklabels=show_ticks, tickangle=-45,
+                   tickmode='array', tickvals=positions, ticktext=ticks),
+        yaxis=dict(title="준 학생", showticklabels=show_ticks, autorange='reversed',
+                   tickmode='array', tickvals=positions, ticktext=ticks),
+    )
+    return figure
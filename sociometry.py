@@ -0,0 +1,306 @@
+# sociometry.py
+# 친밀도 점수 행렬(relation_matrix.RelationMatrix)로 계산하는 사회성 측정(소시오메트리) 지표
+# - 가중 받은/준 연결 강도, PageRank, 학생별 상호 선택 비율, 근사 매개 중심성, 사회성 지위 유형, 고립 지수
+# - 모두 NumPy 행렬 연산(거듭제곱 반복, 행렬 곱으로 한 번에 진행하는 BFS)으로 계산하며
+#   관계(간선)마다 도는 파이썬 반복문은 없음. 학급(30명)은 수 ms, 학년(600명)도 1초 이내
+# - '긍정 선택'/'부정 선택' 기준은 대시보드의 관계 상호성 분석과 같은 75점 / 35점
+import numpy as np
+import pandas as pd
+
+POSITIVE_THRESHOLD = 75 # 이 점수 이상이면 긍정 선택 (친한 관계)
+NEGATIVE_THRESHOLD = 35 # 이 점수 이하면 부정 선택 (어려운 관계)
+PAGERANK_DAMPING = 0.85
+PAGERANK_TOL = 1e-10
+PAGERANK_MAX_ITER = 200
+MAX_BETWEENNESS_SOURCES = 128 # 학생 수가 이보다 많으면 출발점을 표본 추출해 근사
+STATUS_Z_CUTOFF = 1.0
+MIN_GROUP_SIZE = 2 # 이보다 작은 그룹(혼자)은 '소속 그룹 없음'
+NO_GROUP = -1
+LOUVAIN_MAX_LEVELS = 10
+
+# 사회성 지위 유형 (Coie & Dodge 분류)
+STATUS_POPULAR = 'popular'
+STATUS_REJECTED = 'rejected'
+STATUS_NEGLECTED = 'neglected'
+STATUS_CONTROVERSIAL = 'controversial'
+STATUS_AVERAGE = 'average'
+STATUS_LABELS = {
+    STATUS_POPULAR: "인기형",
+    STATUS_REJECTED: "거부형",
+    STATUS_NEGLECTED: "무시형",
+    STATUS_CONTROVERSIAL: "양면형",
+    STATUS_AVERAGE: "평균형",
+}
+
+METRIC_COLUMNS = [
+    'student_id', 'student_name', 'submitted',
+    'in_strength', 'out_strength', 'in_count', 'out_count',
+    'pagerank', 'reciprocity', 'betweenness',
+    'positive_in', 'negative_in', 'preference_z', 'impact_z', 'status', 'isolation_index',
+]
+GROUP_COLUMNS = ['group', 'size', 'members', 'density', 'mutual_ratio', 'mean_score']
+
+
+def _zscore(values):
+    values = np.asarray(values, dtype=float)
+    std = values.std()
+    if values.size == 0 or std == 0:
+        return np.zeros_like(values)
+    return (values - values.mean()) / std
+
+def pagerank(weights, damping=PAGERANK_DAMPING, tol=PAGERANK_TOL, max_iter=PAGERANK_MAX_ITER):
+    """가중 인접 행렬(행: 준 학생, 열: 받은 학생)의 PageRank. 점수를 주지 않은 학생의 몫은 전체에 고르게 분배"""
+    n = weights.shape[0]
+    if n == 0:
+        return np.zeros(0)
+    out_strength = weights.sum(axis=1)
+    dangling = out_strength == 0
+    transition = np.divide(weights, out_strength[:, None], out=np.zeros_like(weights), where=~dangling[:, None])
+    rank = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        updated = (1 - damping) / n + damping * (rank @ transition + rank[dangling].sum() / n)
+        if np.abs(updated - rank).sum() < tol:
+            return updated
+        rank = updated
+    return rank
+
+def betweenness(adjacency, max_sources=MAX_BETWEENNESS_SOURCES, seed=0):
+    """방향 그래프의 매개 중심성 (간선 가중치 없음, 0~1로 정규화).
+    여러 출발점의 BFS를 (출발점 × 학생) 행렬로 한꺼번에 진행하는 Brandes 알고리즘.
+    학생 수가 max_sources보다 많으면 출발점을 표본 추출하고 비율만큼 키워 근사합니다."""
+    n = adjacency.shape[0]
+    if n < 3:
+        return np.zeros(n)
+    a = adjacency.astype(float)
+    if n > max_sources:
+        sources = np.sort(np.random.default_rng(seed).choice(n, size=max_sources, replace=False))
+    else:
+        sources = np.arange(n)
+    k = len(sources)
+    rows = np.arange(k)
+
+    dist = np.full((k, n), -1, dtype=np.int32)
+    sigma = np.zeros((k, n))
+    dist[rows, sources] = 0
+    sigma[rows, sources] = 1.0
+    frontier = sigma.copy()
+    depth = 0
+    while True:
+        paths = frontier @ a # 다음 단계 학생까지의 최단 경로 수
+        reached = (paths > 0) & (dist < 0)
+        if not reached.any():
+            break
+        depth += 1
+        dist[reached] = depth
+        sigma[reached] = paths[reached]
+        frontier = np.where(reached, paths, 0.0)
+
+    delta = np.zeros((k, n))
+    for level in range(depth - 1, -1, -1):
+        coef = np.divide(1.0 + delta, sigma, out=np.zeros_like(delta), where=dist == level + 1)
+        delta += np.where(dist == level, sigma * (coef @ a.T), 0.0)
+    delta[rows, sources] = 0.0
+
+    scores = delta.sum(axis=0) * (n / k)
+    return scores / ((n - 1) * (n - 2))
+
+def choice_matrices(matrix):
+    """(점수 행렬(대각 NaN), 평가 여부, 긍정 선택, 부정 선택) 불리언 행렬"""
+    scores = matrix.scores.copy()
+    np.fill_diagonal(scores, np.nan)
+    rated = ~np.isnan(scores)
+    positive = rated & (np.nan_to_num(scores, nan=-1.0) >= POSITIVE_THRESHOLD)
+    negative = rated & (np.nan_to_num(scores, nan=101.0) <= NEGATIVE_THRESHOLD)
+    return scores, rated, positive, negative
+
+def compute_metrics(matrix):
+    """학생별 사회성 측정 지표 DataFrame (METRIC_COLUMNS)."""
+    n = len(matrix)
+    if n == 0:
+        return pd.DataFrame(columns=METRIC_COLUMNS)
+    scores, rated, positive, negative = choice_matrices(matrix)
+    weights = np.where(rated, scores, 0.0) / 100.0
+
+    out_positive = positive.sum(axis=1)
+    mutual = (positive & positive.T).sum(axis=1)
+    reciprocity = np.divide(mutual, out_positive, out=np.full(n, np.nan), where=out_positive > 0)
+
+    # 사회성 지위: 받은 긍정/부정 선택 수를 표준화해 선호도(긍정-부정)와 영향력(긍정+부정)으로 분류
+    positive_in = positive.sum(axis=0)
+    negative_in = negative.sum(axis=0)
+    z_liked, z_disliked = _zscore(positive_in), _zscore(negative_in)
+    preference_z = _zscore(z_liked - z_disliked)
+    impact_z = _zscore(z_liked + z_disliked)
+    status = np.select(
+        [
+            (preference_z > STATUS_Z_CUTOFF) & (z_liked > 0) & (z_disliked < 0),
+            (preference_z < -STATUS_Z_CUTOFF) & (z_disliked > 0) & (z_liked < 0),
+            (impact_z < -STATUS_Z_CUTOFF) & (z_liked < 0) & (z_disliked < 0),
+            (impact_z > STATUS_Z_CUTOFF) & (z_liked > 0) & (z_disliked > 0),
+        ],
+        [STATUS_POPULAR, STATUS_REJECTED, STATUS_NEGLECTED, STATUS_CONTROVERSIAL],
+        default=STATUS_AVERAGE,
+    )
+
+    # 고립 지수: 점수를 매길 수 있었던 (제출한) 친구 중 긍정 선택을 하지 않은 비율 (1에 가까울수록 고립)
+    possible_raters = matrix.submitted.sum() - matrix.submitted.astype(int)
+    isolation_index = np.divide(possible_raters - positive_in, possible_raters,
+                                out=np.full(n, np.nan), where=possible_raters > 0)
+
+    return pd.DataFrame({
+        'student_id': matrix.student_ids,
+        'student_name': matrix.names,
+        'submitted': matrix.submitted,
+        'in_strength': weights.sum(axis=0),
+        'out_strength': weights.sum(axis=1),
+        'in_count': rated.sum(axis=0),
+        'out_count': rated.sum(axis=1),
+        'pagerank': pagerank(weights),
+        'reciprocity': reciprocity,
+        'betweenness': betweenness(positive),
+        'positive_in': positive_in,
+        'negative_in': negative_in,
+        'preference_z': preference_z,
+        'impact_z': impact_z,
+        'status': status,
+        'isolation_index': isolation_index,
+    }, columns=METRIC_COLUMNS)
+
+def status_counts(metrics_df):
+    """사회성 지위 유형별 학생 수 (한글 라벨, 정해진 순서)"""
+    counts = metrics_df['status'].value_counts() if not metrics_df.empty else pd.Series(dtype=int)
+    return pd.Series({label: int(counts.get(key, 0)) for key, label in STATUS_LABELS.items()}, name="학생 수")
+
+# --- 친구 그룹 탐지 ---
+def _within_group_sums(onehot, values):
+    """onehot(학생 × 그룹)로 그룹마다 같은 그룹 학생 쌍의 values 합계"""
+    return ((onehot.T @ values) * onehot.T).sum(axis=1)
+
+def modularity(weights, labels):
+    """무방향 가중 행렬의 모듈성 Q (그룹 안 연결이 무작위 기대치보다 얼마나 많은지, -0.5~1)"""
+    total = weights.sum()
+    if total == 0:
+        return 0.0
+    onehot = np.eye(labels.max() + 1)[labels]
+    internal = _within_group_sums(onehot, weights)
+    degree = onehot.T @ weights.sum(axis=1)
+    return float((internal / total - (degree / total) ** 2).sum())
+
+def _louvain_level(weights, rng):
+    """노드 이동 단계: 모듈성이 가장 많이 오르는 이웃 그룹으로 한 명씩 옮기기를 더 이상 바뀌지 않을 때까지 반복.
+    노드마다 모든 그룹과의 연결 합을 bincount 한 번으로 계산 (간선별 반복 없음)"""
+    n = weights.shape[0]
+    degree = weights.sum(axis=1)
+    total = degree.sum()
+    labels = np.arange(n)
+    group_degree = degree.copy()
+    moved_any = False
+    while True:
+        moved = 0
+        for i in rng.permutation(n):
+            if degree[i] == 0:
+                continue
+            current = labels[i]
+            links = np.bincount(labels, weights=weights[i], minlength=n)
+            links[current] -= weights[i, i]
+            group_degree[current] -= degree[i]
+            gain = links - group_degree * degree[i] / total
+            candidates = np.flatnonzero(links > 0)
+            best = candidates[np.argmax(gain[candidates])] if candidates.size else current
+            if gain[best] <= gain[current] + 1e-12:
+                best = current
+            group_degree[best] += degree[i]
+            if best != current:
+                labels[i] = best
+                moved += 1
+        if moved == 0:
+            break
+        moved_any = True
+    return np.unique(labels, return_inverse=True)[1], moved_any
+
+def louvain(weights, seed=0, max_levels=LOUVAIN_MAX_LEVELS):
+    """Louvain 방식 모듈성 최적화. weights: 대칭 가중 인접 행렬. 학생별 그룹 번호(0부터) 배열 반환.
+    한 단계가 끝나면 그룹을 노드 하나로 합친 행렬(onehot.T @ W @ onehot)에서 다시 진행"""
+    n = weights.shape[0]
+    membership = np.arange(n)
+    if n == 0 or weights.sum() == 0:
+        return membership
+    rng = np.random.default_rng(seed)
+    level_weights = weights.astype(float)
+    for _ in range(max_levels):
+        labels, moved = _louvain_level(level_weights, rng)
+        if not moved:
+            break
+        membership = labels[membership]
+        onehot = np.eye(labels.max() + 1)[labels]
+        level_weights = onehot.T @ level_weights @ onehot
+    return membership
+
+def detect_communities(matrix, seed=0):
+    """긍정 선택(POSITIVE_THRESHOLD 이상) 관계망의 친구 그룹.
+    반환: (학생별 소속 DataFrame[student_id, student_name, group], 그룹별 DataFrame[GROUP_COLUMNS], 모듈성)
+    혼자 남은 학생(긍정 선택을 주고받은 친구가 그룹에 없음)은 group = NO_GROUP"""
+    n = len(matrix)
+    membership_columns = ['student_id', 'student_name', 'group']
+    if n == 0:
+        return pd.DataFrame(columns=membership_columns), pd.DataFrame(columns=GROUP_COLUMNS), 0.0
+    scores, rated, positive, _ = choice_matrices(matrix)
+    undirected = positive.astype(float) + positive.T # 서로 선택하면 가중치 2
+    labels = louvain(undirected, seed=seed)
+    score = modularity(undirected, labels)
+
+    # 그룹 번호는 큰 그룹부터 1, 2, ... (혼자인 학생은 NO_GROUP)
+    sizes = np.bincount(labels)
+    order = np.argsort(-sizes, kind='stable')
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order)) + 1
+    groups = np.where(sizes[labels] >= MIN_GROUP_SIZE, rank[labels], NO_GROUP)
+
+    valid = np.unique(groups[groups != NO_GROUP])
+    onehot = (groups[:, None] == valid[None, :]).astype(float) # 학생 × 그룹
+    size = onehot.sum(axis=0)
+    choices_inside = _within_group_sums(onehot, positive.astype(float))
+    mutual_inside = _within_group_sums(onehot, (positive & positive.T).astype(float))
+    rated_inside = _within_group_sums(onehot, rated.astype(float))
+    score_inside = _within_group_sums(onehot, np.where(rated, scores, 0.0))
+    group_df = pd.DataFrame({
+        'group': valid,
+        'size': size.astype(int),
+        'members': [", ".join(matrix.names[i] for i in np.flatnonzero(groups == g)) for g in valid],
+        'density': choices_inside / (size * (size - 1)), # 그룹 안에서 가능한 선택 중 실제 긍정 선택 비율
+        'mutual_ratio': np.divide(mutual_inside, choices_inside, out=np.zeros_like(size), where=choices_inside > 0),
+        'mean_score': np.divide(score_inside, rated_inside, out=np.full_like(size, np.nan), where=rated_inside > 0),
+    }, columns=GROUP_COLUMNS)
+    membership_df = pd.DataFrame({
+        'student_id': matrix.student_ids,
+        'student_name': matrix.names,
+        'group': groups,
+    }, columns=membership_columns)
+    return membership_df, group_df, score
+
+# --- 행렬 보기 순서 ---
+def fiedler_vector(weights):
+    """대칭 가중 행렬 라플라시안의 두 번째로 작은 고유값의 고유벡터 (가까운 학생일수록 비슷한 값)"""
+    n = weights.shape[0]
+    if n < 3:
+        return np.arange(n, dtype=float)
+    laplacian = np.diag(weights.sum(axis=1)) - weights
+    _, vectors = np.linalg.eigh(laplacian)
+    vector = vectors[:, 1]
+    return vector if vector.sum() >= 0 else -vector # 부호를 고정해 같은 행렬이면 같은 순서
+
+def seriation_order(matrix, membership_df=None):
+    """행렬 보기에서 그룹이 블록으로 보이도록 하는 학생 순서 (행렬 인덱스 배열).
+    점수를 양방향 평균한 유사도의 Fiedler 벡터로 정렬하고, membership_df(detect_communities 결과)가 있으면
+    그룹 번호 순으로 묶은 뒤 그룹 안에서 정렬합니다. 그룹이 없는 학생은 맨 뒤"""
+    n = len(matrix)
+    scores, rated, _, _ = choice_matrices(matrix)
+    values = np.where(rated, scores, 0.0)
+    counts = rated.astype(float) + rated.T
+    similarity = np.divide(values + values.T, counts, out=np.zeros((n, n)), where=counts > 0) / 100.0
+    position = fiedler_vector(similarity)
+    if membership_df is None or membership_df.empty:
+        return np.argsort(position, kind='stable')
+    groups = membership_df['group'].to_numpy()
+    group_key = np.where(groups == NO_GROUP, groups.max() + 1, groups)
+    return np.lexsort((position, group_key))
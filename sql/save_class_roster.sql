@@ -0,0 +1,36 @@
+-- save_class_roster: 학생 명단 편집 내용을 한 트랜잭션으로 저장 (roster.save_roster_changes 에서 호출)
+-- p_upserts: [{"student_id": ..., "student_name": ...}] (student_id 없으면 새 학생)
+-- p_delete_ids: 삭제할 student_id 목록
+-- 하나라도 실패하면 전체가 롤백되어 명단이 절반만 저장되는 일이 없습니다.
+create or replace function public.save_class_roster(p_class_id text, p_upserts jsonb, p_delete_ids text[])
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_updated integer := 0;
+    v_inserted integer := 0;
+    v_deleted integer := 0;
+begin
+    update public.students s
+       set student_name = u.student_name
+      from jsonb_to_recordset(p_upserts) as u(student_id text, student_name text)
+     where u.student_id is not null
+       and s.student_id::text = u.student_id
+       and s.class_id::text = p_class_id;
+    get diagnostics v_updated = row_count;
+
+    insert into public.students (class_id, student_name)
+    select s.class_id, u.student_name
+      from jsonb_to_recordset(p_upserts) as u(student_id text, student_name text)
+      cross join (select class_id from public.classes where class_id::text = p_class_id) s
+     where u.student_id is null;
+    get diagnostics v_inserted = row_count;
+
+    delete from public.students
+     where class_id::text = p_class_id
+       and student_id::text = any(p_delete_ids);
+    get diagnostics v_deleted = row_count;
+
+    return jsonb_build_object('updated', v_updated, 'inserted', v_inserted, 'deleted', v_deleted);
+end;
+$$;
@@ -0,0 +1,30 @@
+-- survey_response_stats: 설문별 제출 수, 학급 학생 수, 마지막 제출 시각을 한 번에 집계 (survey_stats.fetch_response_stats 에서 호출)
+create or replace function public.survey_response_stats(p_survey_ids text[])
+returns table (
+    survey_instance_id text,
+    submitted_count integer,
+    total_students integer,
+    last_submitted_at timestamptz
+)
+language sql
+stable
+as $$
+    select s.survey_instance_id::text,
+           coalesce(r.submitted_count, 0)::integer,
+           coalesce(st.total_students, 0)::integer,
+           r.last_submitted_at
+      from public.surveys s
+      left join (
+            select survey_instance_id, count(*) as submitted_count, max(submission_time) as last_submitted_at
+              from public.survey_responses
+             where survey_instance_id::text = any(p_survey_ids)
+             group by survey_instance_id
+      ) r on r.survey_instance_id = s.survey_instance_id
+      left join (
+            select class_id, count(*) as total_students
+              from public.students
+             where class_id in (select class_id from public.surveys where survey_instance_id::text = any(p_survey_ids))
+             group by class_id
+      ) st on st.class_id = s.class_id
+     where s.survey_instance_id::text = any(p_survey_ids);
+$$;
@@ -0,0 +1,7 @@
+-- teacher_api_keys: 교사별 Gemini API 키 (ai_jobs 워커가 작업을 실행할 때 교사 키를 찾는 데 사용)
+-- 설정 페이지에서 키를 저장하면 upsert, 제거하면 delete. 워커는 별도 프로세스여도 이 테이블에서 키를 읽습니다.
+create table if not exists public.teacher_api_keys (
+    teacher_id text primary key,
+    api_key text not null,
+    updated_at timestamptz not null default now()
+);
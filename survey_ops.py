@@ -0,0 +1,69 @@
+# survey_ops.py
+# 설문 회차 일괄 작업: 상태 일괄 변경, 다른 학급으로 복제, 진행중 설문 일괄 마감
+# 각 작업은 행마다 요청을 보내지 않고 일괄 요청으로 처리하며, 반환된 행으로 설문별 성공 여부를 확인합니다.
+# 요청은 resilience.write 로 보내므로 제한 시간과 회로 차단기가 적용됩니다.
+import traceback
+import resilience
+
+STATUS_OPTIONS = ['준비중', '진행중', '완료']
+STATUS_ACTIVE = '진행중'
+STATUS_CLOSED = '완료'
+
+
+def _returned_ids(response, id_col='survey_instance_id'):
+    return {row[id_col] for row in (response.data or [])}
+
+def update_survey_statuses(teacher_id, status_by_survey):
+    """{survey_instance_id: 새 상태} 를 상태별로 묶어 한 번씩 update 합니다 (최대 상태 종류 수만큼 요청).
+    {survey_instance_id: 오류 메시지 또는 None} 반환 (None이면 성공)"""
+    results = {}
+    surveys_by_status = {}
+    for survey_id, status in status_by_survey.items():
+        if status not in STATUS_OPTIONS:
+            results[survey_id] = f"알 수 없는 상태: {status}"
+        else:
+            surveys_by_status.setdefault(status, []).append(survey_id)
+
+    for status, survey_ids in surveys_by_status.items():
+        try:
+            response = resilience.write(lambda db: db.table('surveys')
+                                        .update({'status': status})
+                                        .in_('survey_instance_id', survey_ids)
+                                        .eq('teacher_id', teacher_id))
+            updated = _returned_ids(response)
+            for survey_id in survey_ids:
+                # 반환되지 않은 행: 삭제되었거나 다른 교사의 설문 (권한 없음)
+                results[survey_id] = None if survey_id in updated else "설문을 찾을 수 없거나 권한이 없습니다."
+        except Exception as e:
+            print(f"설문 상태 일괄 변경 중 오류 발생 ({status}): {e}")
+            traceback.print_exc()
+            for survey_id in survey_ids:
+                results[survey_id] = str(e)
+    return results
+
+def clone_survey(teacher_id, source_survey, class_ids, status='준비중'):
+    """설문 하나를 여러 학급에 같은 이름/설명으로 한 번의 insert로 복제합니다.
+    source_survey: survey_name, description 을 가진 dict. {class_id: 새 survey_instance_id 또는 None} 반환"""
+    if not class_ids:
+        return {}
+    payload = [{
+        'class_id': class_id,
+        'teacher_id': teacher_id,
+        'survey_name': source_survey['survey_name'],
+        'description': source_survey.get('description') or '',
+        'status': status,
+    } for class_id in class_ids]
+    response = resilience.write(lambda db: db.table('surveys').insert(payload))
+    created = {row['class_id']: row['survey_instance_id'] for row in (response.data or [])}
+    return {class_id: created.get(class_id) for class_id in class_ids}
+
+def close_active_surveys(teacher_id, class_id=None):
+    """교사의 '진행중' 설문을 한 번의 update로 모두 '완료'로 바꿉니다. 마감된 설문 행 목록 반환"""
+    def build_query(db):
+        query = db.table('surveys') \
+            .update({'status': STATUS_CLOSED}) \
+            .eq('teacher_id', teacher_id) \
+            .eq('status', STATUS_ACTIVE)
+        return query.eq('class_id', class_id) if class_id is not None else query
+    response = resilience.write(build_query)
+    return response.data or []
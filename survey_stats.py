@@ -0,0 +1,116 @@
+# survey_stats.py
+# 설문별 응답 현황 (제출 수 / 학급 학생 수 / 마지막 제출 시각)
+# - survey_response_stats RPC(sql/survey_response_stats.sql)가 있으면 집계 쿼리 1회
+# - 없으면 필요한 컬럼만 일괄 조회해 파이썬에서 집계 (설문 수와 관계없이 요청 3회, async_db로 왕복 2번)
+# - 결과는 캐시하고, 학생이 설문을 제출하면 해당 설문의 캐시만 무효화 (invalidate_response_stats)
+import asyncio
+import threading
+import traceback
+import pandas as pd
+import streamlit as st
+import async_db
+import resilience
+
+RESPONSE_STATS_RPC = 'survey_response_stats'
+STATS_CACHE_TTL = 300 # 다른 서버 프로세스에서 제출된 응답도 이 시간 안에는 반영
+
+_rpc_available = True
+_stats_versions = {} # survey_instance_id -> 제출 시마다 증가하는 버전 (프로세스 전역)
+_versions_lock = threading.Lock()
+
+
+def _empty_stats():
+    return {'submitted': 0, 'total': 0, 'last_submitted_at': None}
+
+async def _fetch_stats_columns(db, survey_ids):
+    """설문의 학급과 응답 제출 시각을 동시에 조회한 뒤, 학급별 학생을 조회합니다 (왕복 2번)."""
+    surveys_response, responses = await asyncio.gather(
+        async_db.bounded(db.table('surveys').select("survey_instance_id, class_id").in_('survey_instance_id', survey_ids).execute()),
+        async_db.fetch_all(lambda: db.table('survey_responses')
+                           .select("survey_instance_id, submission_time")
+                           .in_('survey_instance_id', survey_ids)
+                           .order('response_id')),
+    )
+    class_by_survey = {s['survey_instance_id']: s['class_id'] for s in (surveys_response.data or [])}
+    class_ids = sorted({class_id for class_id in class_by_survey.values() if class_id})
+    students = []
+    if class_ids:
+        students = await async_db.fetch_all(lambda: db.table('students').select("class_id").in_('class_id', class_ids).order('student_id'))
+    return class_by_survey, students, responses
+
+def fetch_response_stats(survey_ids):
+    """{survey_instance_id: {'submitted', 'total', 'last_submitted_at'}} 를 조회합니다 (캐시 없음)."""
+    global _rpc_available
+    survey_ids = list(survey_ids)
+    stats = {survey_id: _empty_stats() for survey_id in survey_ids}
+    if not survey_ids:
+        return stats
+
+    if _rpc_available:
+        try:
+            rows = resilience.read_query(lambda db: db.rpc(RESPONSE_STATS_RPC, {'p_survey_ids': survey_ids}),
+                                         cache_key=(RESPONSE_STATS_RPC, tuple(survey_ids))).data
+            for row in rows or []:
+                stats[row['survey_instance_id']] = {
+                    'submitted': row.get('submitted_count') or 0,
+                    'total': row.get('total_students') or 0,
+                    'last_submitted_at': row.get('last_submitted_at'),
+                }
+            return stats
+        except Exception as e:
+            if getattr(e, 'code', None) != 'PGRST202':
+                raise
+            print(f"{RESPONSE_STATS_RPC} RPC가 없어 컬럼 조회 후 집계합니다.")
+            _rpc_available = False
+
+    # 대체 경로: 필요한 컬럼만 조회 (전체 응답 내용은 가져오지 않음)
+    class_by_survey, students, responses = resilience.read(lambda db: _fetch_stats_columns(db, survey_ids),
+                                                           cache_key=('response_stats_columns', tuple(survey_ids)), paged=True).data
+    students_per_class = pd.Series([s['class_id'] for s in students], dtype=object).value_counts().to_dict()
+
+    responses_df = pd.DataFrame(responses, columns=['survey_instance_id', 'submission_time'])
+    grouped = responses_df.groupby('survey_instance_id')['submission_time'].agg(['count', 'max'])
+    for survey_id in survey_ids:
+        stats[survey_id]['total'] = int(students_per_class.get(class_by_survey.get(survey_id), 0))
+        if survey_id in grouped.index:
+            stats[survey_id]['submitted'] = int(grouped.at[survey_id, 'count'])
+            last = grouped.at[survey_id, 'max']
+            stats[survey_id]['last_submitted_at'] = None if pd.isna(last) else last
+    return stats
+
+@st.cache_data(ttl=STATS_CACHE_TTL, show_spinner=False)
+def _load_response_stats(survey_ids, versions):
+    # versions는 캐시 키에만 사용 (제출 시 바뀌어 해당 설문이 포함된 캐시가 무효화됨)
+    return fetch_response_stats(survey_ids)
+
+def get_response_stats(survey_ids):
+    """캐시된 응답 현황을 반환합니다. 조회 실패 시 빈 dict."""
+    survey_ids = tuple(sorted({str(survey_id) for survey_id in survey_ids}))
+    with _versions_lock:
+        versions = tuple(_stats_versions.get(survey_id, 0) for survey_id in survey_ids)
+    try:
+        return _load_response_stats(survey_ids, versions)
+    except Exception as e:
+        print(f"응답 현황 조회 중 오류 발생: {e}")
+        traceback.print_exc()
+        return {}
+
+def invalidate_response_stats(survey_instance_id):
+    """설문 제출/수정 후 호출: 이 설문의 응답 현황 캐시를 무효화합니다."""
+    with _versions_lock:
+        _stats_versions[str(survey_instance_id)] = _stats_versions.get(str(survey_instance_id), 0) + 1
+
+def format_response_count(stat):
+    """'제출/전체' 문자열 (예: '12/25')"""
+    if not stat:
+        return "-"
+    return f"{stat['submitted']}/{stat['total']}"
+
+def fetch_submission_status(survey_instance_id):
+    """제출 현황 추적용: 응답 내용 없이 (student_id, submission_time)만 조회합니다. {student_id: submission_time}"""
+    rows = resilience.read(lambda db: async_db.fetch_all(lambda: db.table('survey_responses')
+                                                         .select("student_id, submission_time")
+                                                         .eq('survey_instance_id', survey_instance_id)
+                                                         .order('response_id')),
+                           cache_key=('submission_status', survey_instance_id), paged=True).data
+    return {row['student_id']: row.get('submission_time') for row in rows}
@@ -0,0 +1,115 @@
+# telemetry.py
+# AI(Gemini) 호출 기록: 모델, 토큰 수, 지연 시간, 재시도 횟수, 결과, 교사, 분석 유형
+# 로컬 SQLite 파일에 추가 전용(append-only)으로 저장하고, 설정 페이지에서 사용량/지연 시간을 요약해 보여줍니다.
+import os
+import sqlite3
+import datetime
+import traceback
+import pandas as pd
+
+TELEMETRY_DB_PATH = os.environ.get("AI_TELEMETRY_DB_PATH", "ai_telemetry.db")
+
+# 모델별 100만 토큰당 가격 (USD, 입력/출력). 목록에 없는 모델은 비용 0으로 계산
+MODEL_PRICES_PER_MILLION = {
+    'gemini-2.0-flash-lite': (0.075, 0.30),
+    'gemini-2.0-flash': (0.10, 0.40),
+}
+
+OUTCOME_LABELS = {
+    'ok': "성공",
+    'blocked': "차단됨",
+    'empty': "빈 응답",
+    'quota': "할당량 초과",
+    'rate_limited': "대기 한도 초과",
+    'error': "오류",
+}
+# 모델 응답을 받지 못한(대기 한도 초과) 또는 429로 거절된 호출은 응답 시간 분위수에서 제외
+LATENCY_EXCLUDED_OUTCOMES = ('rate_limited', 'quota')
+
+
+def get_connection(db_path=None):
+    """telemetry SQLite 연결을 열고 테이블이 없으면 생성합니다."""
+    conn = sqlite3.connect(db_path or TELEMETRY_DB_PATH, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ai_calls (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            called_at TEXT NOT NULL,
+            model TEXT,
+            teacher_id TEXT,
+            analysis_type TEXT,
+            outcome TEXT,
+            latency_ms REAL,
+            retries INTEGER,
+            prompt_tokens INTEGER,
+            response_tokens INTEGER,
+            cost_usd REAL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ai_calls_teacher ON ai_calls (teacher_id, called_at)")
+    return conn
+
+def estimate_cost(model, prompt_tokens, response_tokens):
+    """토큰 수로 호출 비용(USD)을 추정합니다."""
+    input_price, output_price = MODEL_PRICES_PER_MILLION.get(model, (0.0, 0.0))
+    return ((prompt_tokens or 0) * input_price + (response_tokens or 0) * output_price) / 1_000_000
+
+def record_ai_call(model, latency_ms, outcome, retries=0, prompt_tokens=None, response_tokens=None,
+                   teacher_id=None, analysis_type=None, db_path=None):
+    """AI 호출 1건을 기록합니다. 기록 실패가 AI 호출 자체를 막지 않도록 예외는 로그만 남깁니다."""
+    try:
+        conn = get_connection(db_path)
+        try:
+            conn.execute(
+                "INSERT INTO ai_calls (called_at, model, teacher_id, analysis_type, outcome, latency_ms, retries, "
+                "prompt_tokens, response_tokens, cost_usd) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (datetime.datetime.now().isoformat(), model,
+                 str(teacher_id) if teacher_id is not None else None, analysis_type, outcome,
+                 latency_ms, retries, prompt_tokens, response_tokens,
+                 estimate_cost(model, prompt_tokens, response_tokens))
+            )
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"AI 호출 기록 중 오류 발생: {e}")
+        traceback.print_exc()
+
+def load_ai_calls(teacher_id=None, since=None, db_path=None):
+    """기록된 호출을 DataFrame으로 불러옵니다 (교사/기간 필터 선택)."""
+    query = "SELECT * FROM ai_calls WHERE 1 = 1"
+    params = []
+    if teacher_id is not None:
+        query += " AND teacher_id = ?"
+        params.append(str(teacher_id))
+    if since is not None:
+        query += " AND called_at >= ?"
+        params.append(since.isoformat())
+    conn = get_connection(db_path)
+    try:
+        return pd.read_sql_query(query, conn, params=params)
+    finally:
+        conn.close()
+
+def model_latencies(calls_df):
+    """응답 시간 분위수 계산에 쓸 latency_ms (LATENCY_EXCLUDED_OUTCOMES 호출과 기록 없는 값은 NaN)"""
+    return calls_df['latency_ms'].where(~calls_df['outcome'].isin(LATENCY_EXCLUDED_OUTCOMES))
+
+def summarize_ai_calls(calls_df, by):
+    """by 컬럼별 호출 수, 성공률, 토큰, 비용, p50/p95 지연 시간 요약."""
+    columns = [by, 'calls', 'success_rate', 'prompt_tokens', 'response_tokens', 'cost_usd', 'retries', 'p50_ms', 'p95_ms']
+    if calls_df.empty:
+        return pd.DataFrame(columns=columns)
+    df = calls_df.assign(**{by: calls_df[by].fillna('(없음)'), 'is_ok': calls_df['outcome'] == 'ok',
+                            'latency_ms': model_latencies(calls_df)})
+    grouped = df.groupby(by)
+    summary = grouped.agg(
+        calls=('id', 'count'),
+        success_rate=('is_ok', 'mean'),
+        prompt_tokens=('prompt_tokens', 'sum'),
+        response_tokens=('response_tokens', 'sum'),
+        cost_usd=('cost_usd', 'sum'),
+        retries=('retries', 'sum'),
+    )
+    summary['p50_ms'] = grouped['latency_ms'].quantile(0.5)
+    summary['p95_ms'] = grouped['latency_ms'].quantile(0.95)
+    return summary.reset_index()[columns].sort_values('calls', ascending=False)
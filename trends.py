@@ -0,0 +1,147 @@
+# trends.py
+# 한 학급의 여러 설문(회차) 비교
+# - 학급 설문 전체의 응답을 in_ + range 페이지 조회 한 번으로 가져옴 (회차마다 load_analysis_data를 다시 부르지 않음)
+# - 학급 명단(+응답한 학생) 기준의 고정 학생 인덱스로 회차별 점수 행렬을 (회차 × 준 학생 × 받은 학생) 텐서로 맞춤
+# - 학생별 받은/준 평균 점수와 학생 쌍별 점수 변화를 회차 축 전체에 대해 한꺼번에 계산
+import numpy as np
+import pandas as pd
+import async_db
+import resilience
+import sociometry
+from relation_matrix import RelationMatrix
+
+TREND_COLUMNS = "response_id, survey_instance_id, student_id, relation_mapping_data"
+TOP_CHANGES = 10 # 가장 많이 오른/떨어진 항목 표시 개수
+
+
+def class_responses_query(db, survey_ids):
+    return db.table('survey_responses').select(TREND_COLUMNS) \
+        .in_('survey_instance_id', list(survey_ids)).order('response_id')
+
+def fetch_class_responses(survey_ids):
+    """여러 설문의 응답을 한 번에 (페이지 단위로) 조회합니다. ReadResult 반환"""
+    survey_ids = [str(survey_id) for survey_id in survey_ids]
+    return resilience.read(lambda db: async_db.fetch_all(lambda: class_responses_query(db, survey_ids)),
+                           cache_key=('class_responses', tuple(sorted(survey_ids))), paged=True)
+
+
+class RoundTensor:
+    """회차별 친밀도 점수를 같은 학생 인덱스로 맞춘 텐서. 회차는 오래된 순서."""
+
+    def __init__(self, survey_ids, survey_names, student_ids, names, scores, submitted):
+        self.survey_ids = list(survey_ids)
+        self.survey_names = list(survey_names)
+        self.student_ids = list(student_ids)
+        self.names = list(names)
+        self.scores = scores # (회차, 학생, 학생), 평가 없음은 NaN
+        self.submitted = submitted # (회차, 학생)
+
+    @classmethod
+    def from_responses(cls, surveys, responses, roster):
+        """surveys: 오래된 순 [{'survey_instance_id', 'survey_name'}, ...], responses: fetch_class_responses 결과,
+        roster: 학급 명단 {student_id: 이름}"""
+        names = dict(roster or {})
+        for row in responses:
+            names.setdefault(row.get('student_id'), 'Unknown') # 명단에서 빠진 학생의 응답도 같은 인덱스로
+        names.pop(None, None)
+        by_survey = {}
+        for row in responses:
+            by_survey.setdefault(str(row.get('survey_instance_id')), []).append(row)
+
+        matrices = []
+        for survey in surveys:
+            matrix = RelationMatrix(names.keys(), names)
+            for row in by_survey.get(str(survey['survey_instance_id']), []):
+                if row.get('student_id') is not None:
+                    matrix.apply_response(row['student_id'], row.get('relation_mapping_data'))
+            matrices.append(matrix)
+        n = len(names)
+        scores = np.stack([m.scores for m in matrices]) if matrices else np.zeros((0, n, n))
+        submitted = np.stack([m.submitted for m in matrices]) if matrices else np.zeros((0, n), dtype=bool)
+        return cls([s['survey_instance_id'] for s in surveys], [s['survey_name'] for s in surveys],
+                   names.keys(), names.values(), scores, submitted)
+
+    def __len__(self):
+        return len(self.survey_ids)
+
+    def round_index(self, survey_instance_id):
+        return [str(s) for s in self.survey_ids].index(str(survey_instance_id))
+
+    def counted_scores(self):
+        """대시보드 집계와 같은 기준의 점수: 준 학생과 받은 학생이 모두 그 회차에 제출한 경우만"""
+        both = self.submitted[:, :, None] & self.submitted[:, None, :]
+        return np.where(both, self.scores, np.nan)
+
+    def student_averages(self):
+        """(받은 평균, 준 평균, 받은 긍정 선택 수) 각각 (회차, 학생) 배열. 제출하지 않은 회차는 NaN"""
+        scores = self.counted_scores()
+        rated = ~np.isnan(scores)
+        values = np.where(rated, scores, 0.0)
+        received_count, given_count = rated.sum(axis=1), rated.sum(axis=2)
+        received = np.divide(values.sum(axis=1), received_count, out=np.full(received_count.shape, np.nan), where=received_count > 0)
+        given = np.divide(values.sum(axis=2), given_count, out=np.full(given_count.shape, np.nan), where=given_count > 0)
+        positive_in = (rated & (values >= sociometry.POSITIVE_THRESHOLD)).sum(axis=1).astype(float)
+        positive_in[~self.submitted] = np.nan
+        return received, given, positive_in
+
+    def student_changes(self, base, target):
+        """두 회차(인덱스) 사이 학생별 변화. 두 회차 모두 값이 있는 학생만"""
+        received, given, positive_in = self.student_averages()
+        df = pd.DataFrame({
+            'student_id': self.student_ids,
+            'student_name': self.names,
+            'received_before': received[base], 'received_after': received[target],
+            'received_change': received[target] - received[base],
+            'given_change': given[target] - given[base],
+            'positive_in_change': positive_in[target] - positive_in[base],
+        })
+        return df.dropna(subset=['received_change']).sort_values('received_change').reset_index(drop=True)
+
+    def pair_changes(self, base, target, top=TOP_CHANGES):
+        """두 회차 모두 평가한 (준 학생 → 받은 학생) 점수 변화 중 가장 많이 떨어진 / 오른 top개. (drops_df, rises_df)"""
+        scores = self.counted_scores()
+        change = (scores[target] - scores[base]).ravel()
+        valid = np.flatnonzero(~np.isnan(change))
+        columns = ['from_name', 'to_name', 'score_before', 'score_after', 'change']
+
+        def _frame(flat_index):
+            rows, cols = np.unravel_index(flat_index, scores.shape[1:])
+            return pd.DataFrame({
+                'from_name': [self.names[i] for i in rows],
+                'to_name': [self.names[j] for j in cols],
+                'score_before': scores[base][rows, cols],
+                'score_after': scores[target][rows, cols],
+                'change': change[flat_index],
+            }, columns=columns)
+
+        if valid.size == 0:
+            return pd.DataFrame(columns=columns), pd.DataFrame(columns=columns)
+        k = min(top, valid.size)
+        values = change[valid]
+        drops = valid[np.argpartition(values, k - 1)[:k]]
+        rises = valid[np.argpartition(-values, k - 1)[:k]]
+        drops = drops[np.argsort(change[drops], kind='stable')]
+        rises = rises[np.argsort(-change[rises], kind='stable')]
+        return _frame(drops[change[drops] < 0]), _frame(rises[change[rises] > 0])
+
+    def class_summary(self):
+        """회차별 학급 요약 (응답 학생 수, 평균 점수, 긍정/부정 선택 비율)"""
+        scores = self.counted_scores()
+        rated = ~np.isnan(scores)
+        total = rated.sum(axis=(1, 2))
+        values = np.where(rated, scores, 0.0)
+        return pd.DataFrame({
+            'survey_name': self.survey_names,
+            'submitted': self.submitted.sum(axis=1),
+            'mean_score': np.divide(values.sum(axis=(1, 2)), total, out=np.full(len(self), np.nan), where=total > 0),
+            'positive_ratio': np.divide((rated & (values >= sociometry.POSITIVE_THRESHOLD)).sum(axis=(1, 2)), total,
+                                        out=np.full(len(self), np.nan), where=total > 0),
+            'negative_ratio': np.divide((rated & (values <= sociometry.NEGATIVE_THRESHOLD)).sum(axis=(1, 2)), total,
+                                        out=np.full(len(self), np.nan), where=total > 0),
+        })
+
+def load_class_rounds(surveys, roster):
+    """학급 설문 목록(최신순 또는 오래된 순 상관없음)의 응답을 한 번에 불러와 RoundTensor로. (tensor, ReadResult) 반환"""
+    ordered = sorted(surveys, key=lambda s: str(s.get('created_at') or ''))
+    result = fetch_class_responses([s['survey_instance_id'] for s in ordered])
+    return RoundTensor.from_responses(ordered, result.data or [], roster), result
@@ -1,30 +1,110 @@
 import google.generativeai as genai
+from google.ai import generativelanguage as glm
+from google.api_core import exceptions as google_exceptions
+import hashlib
+import threading
+import time
 import traceback
+import rate_limiter
+import telemetry
 
-def call_gemini(prompt, api_key):
-    """Gemini API를 호출하고 결과를 반환하는 함수"""
+MAX_QUOTA_RETRIES = 2 # 429(할당량 초과) 시 재시도 횟수
+QUOTA_BACKOFF_SECONDS = 20 # 429 응답 후 해당 키의 요청을 막아둘 시간
+GEMINI_MODEL = 'gemini-2.0-flash-lite' # 사용할 모델
+
+
+_clients = {} # API 키 해시 -> 그 키 전용 GenerativeServiceClient
+_clients_lock = threading.Lock()
+
+
+def _client_for(api_key):
+    """API 키별 Gemini 클라이언트. genai.configure 는 프로세스 전역 설정이라 워커 스레드 여러 개가
+    동시에 다른 교사의 키로 호출하면 서로의 키가 섞이므로, 키마다 따로 만든 클라이언트를 씁니다."""
+    key_hash = hashlib.sha256(api_key.encode()).hexdigest()
+    with _clients_lock:
+        client = _clients.get(key_hash)
+        if client is None:
+            client = _clients[key_hash] = glm.GenerativeServiceClient(client_options={"api_key": api_key})
+    return client
+
+
+class GeminiResult:
+    """call_gemini 결과. outcome 이 'ok'일 때만 text 가 분석 결과이고, 그 밖에는 사용자에게 보여줄 오류 메시지"""
+
+    def __init__(self, text, outcome):
+        self.text = text
+        self.outcome = outcome
+
+    @property
+    def ok(self):
+        return self.outcome == 'ok'
+
+
+def call_gemini(prompt, api_key, teacher_id=None, analysis_type=None, defer=False):
+    """Gemini API를 호출하고 GeminiResult를 반환하는 함수 (호출 결과는 telemetry에 기록)
+    성공 여부는 문자열이 아니라 result.ok / result.outcome 으로 판단합니다.
+    defer=True면 레이트 리미터 대기나 429 재시도로 잠들지 않고 rate_limiter.RateLimitExceeded를 올립니다 (작업 큐 워커용)."""
     if not api_key:
-        return "오류: API 키가 설정되지 않았습니다."
+        return GeminiResult("오류: API 키가 설정되지 않았습니다.", 'no_key')
+    limiter = rate_limiter.get_limiter()
+    estimated_tokens = rate_limiter.estimate_tokens(prompt)
+    # 호출 통계 (finally 에서 telemetry 로 기록). latency_ms 는 generate_content 호출 시간만 (리미터 대기/재시도 대기 제외)
+    stats = {'outcome': 'error', 'retries': 0, 'prompt_tokens': None, 'response_tokens': None, 'latency_ms': None}
     try:
-        # 함수 호출 시마다 API 키로 클라이언트 설정
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.0-flash-lite') # 사용할 모델 선택
+        # 전역 genai.configure 대신 이 키 전용 클라이언트를 모델에 연결 (동시에 도는 다른 교사 작업과 키가 섞이지 않도록)
+        model = genai.GenerativeModel(GEMINI_MODEL) # 사용할 모델 선택
+        model._client = _client_for(api_key)
+
+        # API 호출 (레이트 리미터로 순서를 기다린 뒤 호출, 429 시 제한적으로 재시도)
+        for attempt in range(MAX_QUOTA_RETRIES + 1):
+            limiter.acquire(api_key, estimated_tokens, max_wait=0 if defer else rate_limiter.DEFAULT_MAX_WAIT)
+            started = time.perf_counter()
+            try:
+                response = model.generate_content(prompt)
+                break
+            except google_exceptions.ResourceExhausted:
+                limiter.penalize(api_key, QUOTA_BACKOFF_SECONDS)
+                if defer:
+                    stats['outcome'] = 'quota'
+                    raise rate_limiter.RateLimitExceeded(QUOTA_BACKOFF_SECONDS)
+                if attempt == MAX_QUOTA_RETRIES:
+                    stats['outcome'] = 'quota'
+                    raise
+                stats['retries'] += 1
+                print(f"Gemini 할당량 초과(429). 재시도합니다 ({attempt + 1}/{MAX_QUOTA_RETRIES})")
+            finally:
+                stats['latency_ms'] = (time.perf_counter() - started) * 1000
 
-        # API 호출 (안전 설정 등 추가 가능)
-        response = model.generate_content(prompt)
+        # 실제 사용 토큰(입력 + 출력)으로 리미터 보정 (예약은 입력 추정치만 했으므로 출력 토큰만큼 더 차감)
+        usage = getattr(response, 'usage_metadata', None)
+        if usage:
+            stats['prompt_tokens'] = getattr(usage, 'prompt_token_count', None)
+            stats['response_tokens'] = getattr(usage, 'candidates_token_count', None)
+        used_tokens = (stats['prompt_tokens'] or 0) + (stats['response_tokens'] or 0)
+        if used_tokens:
+            limiter.adjust(api_key, used_tokens - estimated_tokens)
 
         # 결과 텍스트 추출 (오류/안전 블록 처리 포함)
         if response.parts:
-            return response.text
+            stats['outcome'] = 'ok'
+            return GeminiResult(response.text, stats['outcome'])
         elif response.prompt_feedback.block_reason:
+             stats['outcome'] = 'blocked'
              block_reason = response.prompt_feedback.block_reason
              print(f"Gemini content blocked. Reason: {block_reason}")
-             return f"오류: 콘텐츠 생성 차단됨 (이유: {block_reason}). 프롬프트를 수정하거나 안전 설정을 확인하세요."
+             return GeminiResult(f"오류: 콘텐츠 생성 차단됨 (이유: {block_reason}). 프롬프트를 수정하거나 안전 설정을 확인하세요.", stats['outcome'])
         else:
              # 예상치 못한 빈 응답
+             stats['outcome'] = 'empty'
              print("Gemini response missing parts and block reason:", response)
-             return "오류: AI로부터 유효한 응답을 받지 못했습니다."
+             return GeminiResult("오류: AI로부터 유효한 응답을 받지 못했습니다.", stats['outcome'])
 
+    except rate_limiter.RateLimitExceeded as e:
+        if stats['outcome'] != 'quota':
+            stats['outcome'] = 'rate_limited'
+        if defer:
+            raise
+        return GeminiResult(f"오류: 현재 AI 요청이 많습니다. {e}", stats['outcome'])
     except Exception as e:
         # 상세 오류 로깅
         print(f"Gemini API 호출 중 오류 발생: {e}")
@@ -35,4 +115,17 @@ def call_gemini(prompt, api_key):
              error_message = "오류: 설정된 Gemini API 키가 유효하지 않습니다. 설정 페이지를 확인하세요."
         elif "quota" in str(e).lower():
              error_message = "오류: API 사용 할당량을 초과했을 수 있습니다."
-        return error_message
\ No newline at end of file
+        return GeminiResult(error_message, stats['outcome'])
+    finally:
+        # 워커가 미뤄 둔(모델을 부르지 않은) 시도는 기록하지 않음: 작업이 다시 실행될 때 한 번만 기록
+        if not (defer and stats['outcome'] == 'rate_limited'):
+            telemetry.record_ai_call(
+                model=GEMINI_MODEL,
+                latency_ms=stats['latency_ms'],
+                outcome=stats['outcome'],
+                retries=stats['retries'],
+                prompt_tokens=stats['prompt_tokens'],
+                response_tokens=stats['response_tokens'],
+                teacher_id=teacher_id,
+                analysis_type=analysis_type,
+            )